@@ -0,0 +1,321 @@
+# admission.py - Admission control and load shedding in front of the image tools
+#
+# Every remove_and_place_object / virtual_tryon call takes a slot before it starts.
+# Slots = what the key pool can serve right now (available keys x concurrency per key).
+# Excess calls wait in a short priority queue (interactive before batch); when the queue
+# is full or the expected wait is too long they are rejected at once with a retry-after
+# hint instead of timing out deep inside the key manager.
+#
+# Configure with:
+#   ADMISSION_ENABLED=true                       false = admit everything
+#   ADMISSION_MAX_QUEUE_DEPTH=16                 waiting calls (batch may use half)
+#   ADMISSION_MAX_QUEUE_WAIT_SECONDS=15          longest wait for interactive calls
+#   ADMISSION_BATCH_MAX_QUEUE_WAIT_SECONDS=60    longest wait for batch calls
+#   ADMISSION_BATCH_SHARE=0.75                   share of slots batch calls may hold
+#   ADMISSION_PER_KEY=4                          slots per key when the key manager has no
+#                                                per-key concurrency limit
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from threading import Lock
+from typing import AsyncIterator, Dict, List, Optional
+
+try:
+    from .api_key_manager import get_api_key_manager
+    from .metrics import ADMISSIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT
+except ImportError:
+    from api_key_manager import get_api_key_manager
+    from metrics import ADMISSIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "batch")  # Served in this order
+
+
+class AdmissionRejected(RuntimeError):
+    """
+    A tool call was shed because the key pool is saturated.
+    """
+
+    def __init__(self, message: str, retry_after_seconds: float):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class _Waiter:
+    def __init__(self, rank: int, seq: int, loop: asyncio.AbstractEventLoop, priority: str):
+        self.rank = rank
+        self.seq = seq
+        self.loop = loop
+        self.priority = priority
+        self.future: asyncio.Future = loop.create_future()
+        self.state = "waiting"  # waiting -> granted / abandoned
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class AdmissionController:
+    """
+    Capacity-aware gate with a bounded priority queue.
+
+    Features:
+    - Slot count follows the key manager (keys in cooldown shrink it)
+    - Interactive calls are queued ahead of batch calls, and batch calls never hold
+      more than batch_share of the slots or half of the queue
+    - Immediate rejection when the queue is full or the estimated wait exceeds the cap,
+      with retry_after from the measured service time
+    - Works across event loops (job queue thread, HTTP server, batch runner)
+    """
+
+    def __init__(
+        self,
+        max_queue_depth: int = 16,
+        max_queue_wait_seconds: float = 15.0,
+        batch_max_queue_wait_seconds: float = 60.0,
+        batch_share: float = 0.75,
+        per_key: int = 4,
+        initial_service_seconds: float = 8.0
+    ):
+        """
+        Initialize admission controller.
+
+        Args:
+            max_queue_depth: Calls allowed to wait for a slot (batch calls may use half)
+            max_queue_wait_seconds: Longest queue wait for interactive calls
+            batch_max_queue_wait_seconds: Longest queue wait for batch calls
+            batch_share: Fraction of slots batch calls may hold at once (at least one)
+            per_key: Slots per available key if the key manager does not limit concurrency
+            initial_service_seconds: Assumed tool duration for retry-after hints until one is measured
+                (no call is rejected on an estimated wait before then)
+        """
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = {"interactive": max_queue_wait_seconds, "batch": batch_max_queue_wait_seconds}
+        self.batch_share = batch_share
+        self.per_key = per_key
+        self.initial_service_seconds = initial_service_seconds
+        self.service_seconds: Optional[float] = None  # EWMA of how long a slot is held
+
+        self.limit: Optional[int] = None  # Slot limit at the last capacity check
+        self.running: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.waiters: List[_Waiter] = []  # heap: interactive first, then arrival order
+        self._seq = itertools.count()
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected_queue_full': 0, 'rejected_wait': 0, 'rejected_no_keys': 0}
+        self.lock = Lock()
+
+    # === CAPACITY ===
+    async def _capacity(self) -> Dict:
+        """
+        Slot limit and pool wait times from the key manager (read without blocking the event loop).
+        Remembers the limit for the synchronous paths (_release, get_statistics).
+        """
+        capacity = await get_api_key_manager().get_capacity_async()
+        limit = capacity['max_in_flight']
+        if limit is None:
+            limit = capacity['available_keys'] * self.per_key
+        self.limit = limit
+        return {**capacity, 'limit': limit}
+
+    def _batch_limit(self, limit: int) -> int:
+        return max(1, int(limit * self.batch_share))
+
+    def _can_run(self, priority: str, limit: int) -> bool:
+        """
+        Whether a call of this priority may take a slot now (caller must hold the lock).
+        """
+        if sum(self.running.values()) >= limit:
+            return False
+        return priority != "batch" or self.running["batch"] < self._batch_limit(limit)
+
+    def _estimate_wait(self, position: int, capacity: Dict) -> float:
+        """
+        Expected seconds until the call at queue position `position` (0 = next) gets a slot.
+        """
+        limit = max(1, capacity['limit'])
+        service = self.service_seconds if self.service_seconds is not None else self.initial_service_seconds
+        return (position + 1) / limit * service + capacity['budget_wait_seconds']
+
+    def _reject(self, tool: str, priority: str, outcome: str, message: str, retry_after: float):
+        self.stats[outcome] += 1
+        ADMISSIONS.inc(tool=tool, priority=priority, outcome=outcome)
+        retry_after = max(1, math.ceil(retry_after))
+        logger.warning(f"🚦 Rejected {priority} {tool}: {message} (retry after {retry_after}s)")
+        raise AdmissionRejected(f"Server busy: {message}. Please retry in {retry_after}s.", retry_after)
+
+    async def check(self, tool: str, priority: str = "interactive"):
+        """
+        Raise AdmissionRejected now if a call would certainly be rejected (reserves nothing).
+        Lets callers answer before committing to a response, e.g. a streaming HTTP reply.
+        """
+        capacity = await self._capacity()
+        with self.lock:
+            if capacity['limit'] == 0:
+                self._reject(tool, priority, 'rejected_no_keys', "every API key is cooling down", capacity['recovery_seconds'])
+            if not self._can_run(priority, capacity['limit']) and len(self.waiters) >= self._queue_cap(priority):
+                self._reject(tool, priority, 'rejected_queue_full', "queue is full",
+                             self._estimate_wait(len(self.waiters), capacity))
+
+    def _queue_cap(self, priority: str) -> int:
+        return self.max_queue_depth if priority == "interactive" else self.max_queue_depth // 2
+
+    # === ADMISSION ===
+    @asynccontextmanager
+    async def admit(self, tool: str, priority: str = "interactive") -> AsyncIterator[float]:
+        """
+        Hold a slot for the duration of the with-block (yields the queue wait in seconds).
+        Raises AdmissionRejected if no slot can be had within the priority's wait cap.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority} (expected one of {PRIORITIES})")
+
+        waited = await self._acquire(tool, priority)
+        start = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._release(priority, time.perf_counter() - start)
+
+    async def _acquire(self, tool: str, priority: str) -> float:
+        capacity = await self._capacity()
+        start = time.perf_counter()
+        with self.lock:
+            if capacity['limit'] == 0:
+                self._reject(tool, priority, 'rejected_no_keys', "every API key is cooling down", capacity['recovery_seconds'])
+            self._dispatch(capacity['limit'])  # Slots may have opened up (keys back from cooldown)
+
+            ahead = sum(1 for w in self.waiters if w.rank <= PRIORITIES.index(priority))
+            if ahead == 0 and self._can_run(priority, capacity['limit']):
+                self.running[priority] += 1
+                self.stats['admitted'] += 1
+                ADMISSIONS.inc(tool=tool, priority=priority, outcome="admitted")
+                ADMISSION_WAIT.observe(0.0, priority=priority)
+                return 0.0
+
+            if len(self.waiters) >= self._queue_cap(priority):
+                self._reject(tool, priority, 'rejected_queue_full', "queue is full",
+                             self._estimate_wait(len(self.waiters), capacity))
+            expected = self._estimate_wait(ahead, capacity)
+            if self.service_seconds is not None and expected > self.max_wait[priority]:
+                self._reject(tool, priority, 'rejected_wait', f"expected wait {expected:.0f}s", expected)
+
+            waiter = _Waiter(PRIORITIES.index(priority), next(self._seq), asyncio.get_running_loop(), priority)
+            heapq.heappush(self.waiters, waiter)
+            self.stats['queued'] += 1
+            ADMISSION_QUEUE_DEPTH.set(len(self.waiters))
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.max_wait[priority])
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self._release(priority)  # Granted just as the caller went away
+            raise
+
+        if self._abandon(waiter):
+            self._reject(tool, priority, 'rejected_wait', "timed out in queue", self._estimate_wait(0, await self._capacity()))
+
+        waited = time.perf_counter() - start
+        ADMISSIONS.inc(tool=tool, priority=priority, outcome="admitted")
+        ADMISSION_WAIT.observe(waited, priority=priority)
+        return waited
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Take a waiter out of the queue. Returns True if it never got a slot, False if a
+        slot was granted in the meantime (the caller then owns it).
+        """
+        with self.lock:
+            if waiter.state != "waiting":
+                return False
+            waiter.state = "abandoned"
+            self.waiters.remove(waiter)
+            heapq.heapify(self.waiters)
+            ADMISSION_QUEUE_DEPTH.set(len(self.waiters))
+            return True
+
+    def _release(self, priority: str, held_seconds: Optional[float] = None):
+        """
+        Free a slot and hand it on (uses the last known limit - runs in finally blocks, never awaits).
+        """
+        with self.lock:
+            self.running[priority] = max(0, self.running[priority] - 1)
+            if held_seconds is not None:
+                self.service_seconds = held_seconds if self.service_seconds is None else (
+                    0.8 * self.service_seconds + 0.2 * held_seconds
+                )
+            self._dispatch(self.limit or 0)
+
+    def _dispatch(self, limit: int):
+        """
+        Hand free slots to queued calls in priority order (caller must hold the lock).
+        """
+        while self.waiters:
+            waiter = self.waiters[0]
+            if not self._can_run(waiter.priority, limit):
+                return
+            heapq.heappop(self.waiters)
+            waiter.state = "granted"
+            self.running[waiter.priority] += 1
+            self.stats['admitted'] += 1
+            waiter.loop.call_soon_threadsafe(self._grant, waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters))
+
+    def _grant(self, waiter: _Waiter):
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+
+    def get_statistics(self) -> Dict:
+        with self.lock:
+            return {
+                'slots': self.limit if self.limit is not None else 'N/A',
+                'running': dict(self.running),
+                'queued_now': len(self.waiters),
+                'service_seconds_ewma': round(self.service_seconds, 2) if self.service_seconds is not None else 'N/A',
+                **self.stats,
+            }
+
+
+# Global admission controller (singleton pattern)
+_global_controller: Optional[AdmissionController] = None
+_global_controller_loaded = False
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """
+    Get the global admission controller, or None when ADMISSION_ENABLED is false.
+
+    Environment:
+        ADMISSION_ENABLED: true/false (default: true)
+        ADMISSION_MAX_QUEUE_DEPTH: calls allowed to wait (default: 16)
+        ADMISSION_MAX_QUEUE_WAIT_SECONDS: interactive wait cap (default: 15)
+        ADMISSION_BATCH_MAX_QUEUE_WAIT_SECONDS: batch wait cap (default: 60)
+        ADMISSION_BATCH_SHARE: share of slots batch calls may hold (default: 0.75)
+        ADMISSION_PER_KEY: slots per key without a per-key concurrency limit (default: 4)
+    """
+    global _global_controller, _global_controller_loaded
+
+    if not _global_controller_loaded:
+        if os.getenv('ADMISSION_ENABLED', 'true').strip().lower() in ('true', '1', 'yes'):
+            _global_controller = AdmissionController(
+                max_queue_depth=int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', '16')),
+                max_queue_wait_seconds=float(os.getenv('ADMISSION_MAX_QUEUE_WAIT_SECONDS', '15')),
+                batch_max_queue_wait_seconds=float(os.getenv('ADMISSION_BATCH_MAX_QUEUE_WAIT_SECONDS', '60')),
+                batch_share=float(os.getenv('ADMISSION_BATCH_SHARE', '0.75')),
+                per_key=int(os.getenv('ADMISSION_PER_KEY', '4'))
+            )
+        _global_controller_loaded = True
+    return _global_controller
+
+
+def reset_admission_controller():
+    """
+    Reset global admission controller (useful for testing or re-initialization).
+    """
+    global _global_controller, _global_controller_loaded
+    _global_controller = None
+    _global_controller_loaded = False
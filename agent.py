@@ -4,6 +4,7 @@
 from google.adk.agents import LlmAgent
 from tools import (
     remove_and_place_object,
+    shed_as_error,
     virtual_tryon
 )
 
@@ -102,7 +103,8 @@ visual_agent = LlmAgent(
     - ALWAYS request mask for furniture placement
     - ALWAYS confirm before executing
     """,
-    tools=[remove_and_place_object, virtual_tryon]
+    # Admission rejections come back as "❌" results the agent can relay, not exceptions
+    tools=[shed_as_error(remove_and_place_object), shed_as_error(virtual_tryon)]
 )
 
 # ===== ROOT AGENT: SIMPLE ROUTER =====
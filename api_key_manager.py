@@ -2,11 +2,25 @@
 
 import os
 import time
+import random
+import asyncio
 import logging
-from typing import List, Optional, Dict
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Collection, List, Optional, Dict, Tuple
 from threading import Lock
 from datetime import datetime, timedelta
 
+# Support both relative and absolute imports
+try:
+    from .key_state_store import SharedKeyStateStore, key_fingerprint
+    from .metrics import KEY_CALL_LATENCY, KEY_COOLDOWNS, KEY_IN_FLIGHT, KEY_REQUESTS, KEY_RETRIES, KEY_SLOT_WAIT
+except ImportError:
+    from key_state_store import SharedKeyStateStore, key_fingerprint
+    from metrics import KEY_CALL_LATENCY, KEY_COOLDOWNS, KEY_IN_FLIGHT, KEY_REQUESTS, KEY_RETRIES, KEY_SLOT_WAIT
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,24 +29,214 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class ErrorKind(str, Enum):
+    """
+    Classification of an API error, used to decide how the key manager reacts.
+    """
+    RATE_LIMIT = "rate_limit"   # 429 / RESOURCE_EXHAUSTED -> cooldown key, switch
+    AUTH = "auth"               # 401 / 403 -> long cooldown, switch
+    SERVER = "server"           # 5xx -> switch key, no cooldown
+    TRANSIENT = "transient"     # timeouts / connection drops -> switch key, no cooldown
+    FATAL = "fatal"             # bad request, safety block, bugs -> raise immediately
+
+
+class NoKeyCapacityError(RuntimeError):
+    """
+    Raised when no key gets a free request slot within the allowed wait.
+    retry_after_seconds is the earliest time any key will have headroom again.
+    """
+    
+    def __init__(self, message: str, retry_after_seconds: float):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to `capacity` tokens, refilled continuously so that
+    a full bucket is restored over `period_seconds`.
+    Not thread-safe on its own - the key manager guards its buckets with its lock.
+    """
+    
+    def __init__(self, capacity: float, period_seconds: float):
+        self.capacity = capacity
+        self.rate = capacity / period_seconds  # tokens per second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def available(self) -> float:
+        """
+        Tokens currently in the bucket.
+        """
+        self._refill()
+        return self.tokens
+    
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """
+        Seconds until `tokens` tokens are available (0 if available now).
+        """
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+    
+    def consume(self, tokens: float = 1.0) -> bool:
+        """
+        Take `tokens` tokens if available. Returns False (taking nothing) otherwise.
+        """
+        self._refill()
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose level lives in a SharedKeyStateStore, so every process
+    using the store draws from the same budget.
+    """
+    
+    def __init__(self, store: SharedKeyStateStore, fingerprint: str, name: str, capacity: float, period_seconds: float):
+        super().__init__(capacity, period_seconds)
+        self.store = store
+        self.fingerprint = fingerprint
+        self.name = name
+    
+    def available(self) -> float:
+        return self.store.bucket_level(self.fingerprint, self.name, self.capacity, self.rate)
+    
+    def wait_time(self, tokens: float = 1.0) -> float:
+        return max(0.0, (tokens - self.available()) / self.rate)
+    
+    def consume(self, tokens: float = 1.0) -> bool:
+        return self.store.take_tokens(self.fingerprint, {self.name: (self.capacity, self.rate)}, tokens)
+
+
+def _read_limit(name: str) -> Optional[float]:
+    """
+    Read a per-key budget from the environment. Unset, empty or <= 0 means unlimited.
+    """
+    value = os.getenv(name, '').strip()
+    if not value:
+        return None
+    limit = float(value)
+    return limit if limit > 0 else None
+
+
+RATE_LIMIT_STATUSES = {'RESOURCE_EXHAUSTED'}
+AUTH_STATUSES = {'UNAUTHENTICATED', 'PERMISSION_DENIED'}
+SERVER_STATUSES = {'UNAVAILABLE', 'INTERNAL', 'DEADLINE_EXCEEDED'}
+
+
+def classify_error(error: Exception) -> ErrorKind:
+    """
+    Classify an error from a Gemini call.
+    
+    Uses the HTTP status code / RPC status carried by google.genai.errors.APIError
+    (duck-typed via `code` and `status`). Falls back to keyword matching only for
+    errors that carry no status, e.g. wrapped errors from other libraries.
+    """
+    code = getattr(error, 'code', None)
+    status = str(getattr(error, 'status', '') or '').upper()
+    
+    if isinstance(code, int):
+        if code == 429 or status in RATE_LIMIT_STATUSES:
+            return ErrorKind.RATE_LIMIT
+        if code in (401, 403) or status in AUTH_STATUSES:
+            return ErrorKind.AUTH
+        if code >= 500 or status in SERVER_STATUSES:
+            return ErrorKind.SERVER
+        if code == 408:
+            return ErrorKind.TRANSIENT
+        return ErrorKind.FATAL
+    
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return ErrorKind.TRANSIENT
+    
+    try:
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return ErrorKind.TRANSIENT
+    except ImportError:
+        pass
+    
+    # No status available - fall back to message keywords
+    error_str = str(error).lower()
+    
+    if any(kw in error_str for kw in [
+        'rate limit', 'quota', '429', 'too many requests',
+        'resource exhausted', 'limit exceeded'
+    ]):
+        return ErrorKind.RATE_LIMIT
+    
+    if any(kw in error_str for kw in [
+        'invalid api key', 'unauthorized', '401', '403',
+        'permission denied', 'api key not valid'
+    ]):
+        return ErrorKind.AUTH
+    
+    if any(kw in error_str for kw in [
+        'service unavailable', '503', 'temporarily unavailable',
+        'server error', '500', '502', '504'
+    ]):
+        return ErrorKind.SERVER
+    
+    return ErrorKind.FATAL
+
+
+# Key selection strategies (see GoogleAPIKeyManager._score_key)
+SELECTION_STRATEGIES = ("adaptive", "sticky")
+
+# Error rates are capped below 1 so a failing key's score stays finite and it is still probed
+MAX_SCORED_ERROR_RATE = 0.95
+
+# Longest pause between attempts of a coroutine waiting for the manager lock
+ASYNC_LOCK_MAX_BACKOFF_SECONDS = 0.005
+
+
 class GoogleAPIKeyManager:
     """
     Manages multiple Google API keys with automatic rotation and failover.
     
     Features:
-    - Round-robin key rotation (luân phiên)
+    - Round-robin key rotation (luân phiên), or adaptive selection that routes each
+      call to the key with the best latency / load / error-rate score
     - Automatic failover on errors (rate limit, quota exceeded, invalid key)
     - Retry logic with exponential backoff
     - Temporary key blacklisting (auto-recovery after cooldown)
     - Thread-safe operations
     - Usage statistics and monitoring
+    - Pooled genai clients per key (connections reused across calls)
+    - Per-key request-per-minute / image-per-day budgets (token buckets);
+      callers wait for a free slot instead of running into 429s
+    - `async with manager.lease() as key:` - per-key in-flight limits with automatic
+      outcome / latency recording
+    - Optional SQLite-backed state shared by all processes on a host
+      (cooldowns, budgets and stats), so one process's 429 protects the others
     """
     
     def __init__(
         self, 
         api_keys: Optional[List[str]] = None,
         max_retries_per_key: int = 3,
-        cooldown_minutes: int = 5
+        cooldown_minutes: int = 5,
+        max_pooled_clients: int = 16,
+        client_evict_cooldown_minutes: int = 10,
+        client_factory: Optional[Callable[[str], Any]] = None,
+        auth_cooldown_minutes: int = 60,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 8.0,
+        requests_per_minute: Optional[float] = None,
+        images_per_day: Optional[float] = None,
+        max_slot_wait_seconds: float = 300.0,
+        selection_strategy: Optional[str] = None,
+        ewma_alpha: float = 0.2,
+        max_concurrent_per_key: Optional[int] = None,
+        shared_state_path: Optional[str] = None
     ):
         """
         Initialize API Key Manager.
@@ -41,6 +245,23 @@ class GoogleAPIKeyManager:
             api_keys: List of Google API keys. If None, reads from GOOGLE_API_KEY env var
             max_retries_per_key: Maximum retry attempts per key before switching
             cooldown_minutes: Minutes to wait before re-trying a failed key
+            max_pooled_clients: Maximum number of cached clients (least recently used evicted)
+            client_evict_cooldown_minutes: Cooldowns at least this long also drop the key's client
+            client_factory: Callable building a client for a key (defaults to genai.Client)
+            auth_cooldown_minutes: Cooldown for keys rejected as invalid/unauthorized
+            backoff_base_seconds: Base delay of the jittered exponential backoff between retries
+            backoff_max_seconds: Upper bound of a single backoff delay
+            requests_per_minute: Per-key request budget. If None, reads GOOGLE_API_RPM_PER_KEY (unset = unlimited)
+            images_per_day: Per-key image budget. If None, reads GOOGLE_API_IMAGES_PER_DAY_PER_KEY (unset = unlimited)
+            max_slot_wait_seconds: Longest acquire_key() waits for a free slot before raising NoKeyCapacityError
+            selection_strategy: "adaptive" (score keys by live latency, load and errors) or
+                "sticky" (stay on the current key until it fails). If None, reads
+                GOOGLE_API_KEY_SELECTION (default: adaptive)
+            ewma_alpha: Weight of the newest sample in the latency / error-rate moving averages
+            max_concurrent_per_key: Max leased (in-flight) calls per key. If None, reads
+                GOOGLE_API_MAX_CONCURRENT_PER_KEY (default: 4, 0 = unlimited)
+            shared_state_path: SQLite file for cooldowns / budgets / stats shared between
+                processes. If None, reads KEY_STATE_DB (unset = process-local state only)
         """
         # Load API keys
         if api_keys is None:
@@ -57,10 +278,54 @@ class GoogleAPIKeyManager:
         self.current_index = 0
         self.max_retries_per_key = max_retries_per_key
         self.cooldown_minutes = cooldown_minutes
+        self.auth_cooldown_minutes = auth_cooldown_minutes
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
         
         # Track key status
         self.key_stats: Dict[str, Dict] = {}
         self.failed_keys: Dict[str, datetime] = {}  # key -> failure_time
+        self.cooldown_durations: Dict[str, float] = {}  # key -> cooldown minutes (overrides default)
+        
+        # Client pool (key -> client, least recently used first)
+        self.max_pooled_clients = max_pooled_clients
+        self.client_evict_cooldown_minutes = client_evict_cooldown_minutes
+        self.client_factory = client_factory or self._default_client_factory
+        self.client_pool: "OrderedDict[str, Any]" = OrderedDict()
+        
+        # Shared state between processes (optional)
+        if shared_state_path is None:
+            shared_state_path = os.getenv('KEY_STATE_DB', '').strip() or None
+        self.shared_state = SharedKeyStateStore(shared_state_path) if shared_state_path else None
+        
+        # Per-key rate budgets (key -> {"rpm": bucket, "images": bucket})
+        if requests_per_minute is None:
+            requests_per_minute = _read_limit('GOOGLE_API_RPM_PER_KEY')
+        if images_per_day is None:
+            images_per_day = _read_limit('GOOGLE_API_IMAGES_PER_DAY_PER_KEY')
+        self.requests_per_minute = requests_per_minute
+        self.images_per_day = images_per_day
+        self.max_slot_wait_seconds = max_slot_wait_seconds
+        self.rate_buckets: Dict[str, Dict[str, TokenBucket]] = {
+            key: self._make_buckets(key) for key in self.api_keys
+        }
+        
+        # Key selection - live per-key signals (key -> latency EWMA, error-rate EWMA, in-flight calls)
+        if selection_strategy is None:
+            selection_strategy = os.getenv('GOOGLE_API_KEY_SELECTION', 'adaptive').strip().lower()
+        if selection_strategy not in SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown selection_strategy '{selection_strategy}' (expected one of {SELECTION_STRATEGIES})")
+        self.selection_strategy = selection_strategy
+        self.ewma_alpha = ewma_alpha
+        self.key_health: Dict[str, Dict] = {key: self._new_health() for key in self.api_keys}
+        
+        # Per-key concurrency limit, enforced by lease() with one semaphore set per event loop
+        if max_concurrent_per_key is None:
+            max_concurrent_per_key = int(os.getenv('GOOGLE_API_MAX_CONCURRENT_PER_KEY', '4'))
+        self.max_concurrent_per_key = max_concurrent_per_key if max_concurrent_per_key > 0 else None
+        self._lease_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
         
         # Thread safety
         self.lock = Lock()
@@ -96,9 +361,154 @@ class GoogleAPIKeyManager:
     
     def _get_key_id(self, key: str) -> str:
         """
-        Get shortened key identifier for logging (first 8 chars).
+        Get a stable key identifier for logs, statistics and metrics (hash of the key).
+        A key prefix would collide - every Google key starts with "AIzaSy".
+        """
+        return f"key-{key_fingerprint(key)[:8]}"
+    
+    def _make_buckets(self, key: str) -> Dict[str, TokenBucket]:
+        """
+        Create the token buckets enforcing one key's configured budgets
+        (shared between processes when a shared state store is configured).
         """
-        return key[:8] + "..." if len(key) > 8 else key
+        limits = {}
+        if self.requests_per_minute:
+            limits['rpm'] = (self.requests_per_minute, 60)
+        if self.images_per_day:
+            limits['images'] = (self.images_per_day, 24 * 3600)
+        
+        if self.shared_state is not None:
+            fingerprint = key_fingerprint(key)
+            return {
+                name: SharedTokenBucket(self.shared_state, fingerprint, name, capacity, period)
+                for name, (capacity, period) in limits.items()
+            }
+        return {name: TokenBucket(capacity, period) for name, (capacity, period) in limits.items()}
+    
+    def _refresh_shared_state(self):
+        """
+        Re-read the shared state database when the cached view is stale.
+        Blocks on SQLite - call before taking the lock, and never on the event loop.
+        """
+        if self.shared_state is not None and self.shared_state.sync_due():
+            self.shared_state.sync()
+    
+    async def _refresh_shared_state_async(self):
+        """
+        _refresh_shared_state() for coroutines: the database is read on a worker thread.
+        """
+        if self.shared_state is not None and self.shared_state.sync_due():
+            await asyncio.to_thread(self.shared_state.sync)
+    
+    def _sync_shared_state(self):
+        """
+        Adopt cooldowns published by other processes from the cached view (caller must hold the lock).
+        """
+        if self.shared_state is None:
+            return
+        
+        cooldowns = self.shared_state.get_cooldowns()
+        for key in self.api_keys:
+            entry = cooldowns.get(key_fingerprint(key))
+            if entry is None:
+                continue
+            
+            failed_at, cooldown_minutes, error = entry
+            failed_time = datetime.fromtimestamp(failed_at)
+            if key in self.failed_keys and self.failed_keys[key] >= failed_time:
+                continue
+            
+            self.failed_keys[key] = failed_time
+            self.cooldown_durations[key] = cooldown_minutes
+            logger.warning(f"❌ Key {self._get_key_id(key)} in cooldown (reported by another process): {error}")
+    
+    @staticmethod
+    def _new_health() -> Dict:
+        return {'latency_ewma': None, 'error_ewma': 0.0, 'in_flight': 0}
+    
+    def _score_key(self, key: str, default_latency: float) -> float:
+        """
+        Expected cost of sending the next call to a key (lower is better, caller must hold the lock).
+        
+        cost = latency EWMA x (in-flight calls + 1) / (1 - error-rate EWMA)
+        
+        Keys without latency samples yet are scored at default_latency (the pool average),
+        so they receive traffic and get measured.
+        """
+        health = self.key_health[key]
+        latency = health['latency_ewma'] if health['latency_ewma'] is not None else default_latency
+        success_rate = 1.0 - min(health['error_ewma'], MAX_SCORED_ERROR_RATE)
+        return latency * (health['in_flight'] + 1) / success_rate
+    
+    def _order_candidates(self, candidates: List[str]) -> List[str]:
+        """
+        Order candidate keys by preference for the configured strategy (caller must hold the lock).
+        Ties keep rotation order.
+        """
+        if self.selection_strategy == "sticky" or len(candidates) < 2:
+            return candidates
+        
+        measured = [h['latency_ewma'] for h in self.key_health.values() if h['latency_ewma'] is not None]
+        default_latency = sum(measured) / len(measured) if measured else 1.0
+        return sorted(candidates, key=lambda key: self._score_key(key, default_latency))
+    
+    @asynccontextmanager
+    async def _async_lock(self) -> AsyncIterator[None]:
+        """
+        Hold self.lock from a coroutine without blocking the event loop.
+        Critical sections are short and never await, so while another thread
+        holds the lock the coroutine sleeps and tries again, backing off
+        exponentially (up to ASYNC_LOCK_MAX_BACKOFF_SECONDS) instead of spinning.
+        """
+        delay = 0.0
+        while not self.lock.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(ASYNC_LOCK_MAX_BACKOFF_SECONDS, max(delay * 2, 0.0001))
+        try:
+            yield
+        finally:
+            self.lock.release()
+    
+    def _get_lease_slots(self) -> Dict[str, asyncio.Semaphore]:
+        """
+        Per-key concurrency semaphores for the running event loop (caller must hold the lock).
+        asyncio primitives belong to a single loop, so each loop using the manager gets its own set.
+        """
+        if self.max_concurrent_per_key is None:
+            return {}
+        
+        loop = asyncio.get_running_loop()
+        slots = self._lease_slots.get(loop)
+        if slots is None:
+            slots = self._lease_slots[loop] = {}
+        for key in self.api_keys:
+            if key not in slots:
+                slots[key] = asyncio.Semaphore(self.max_concurrent_per_key)
+        return slots
+    
+    def _update_health(self, key: str, failed: bool, latency_seconds: Optional[float]):
+        """
+        Fold one call outcome into a key's moving averages (caller must hold the lock).
+        """
+        health = self.key_health.get(key)
+        if health is None:
+            return
+        
+        alpha = self.ewma_alpha
+        health['error_ewma'] = (1 - alpha) * health['error_ewma'] + (alpha if failed else 0.0)
+        if latency_seconds is not None:
+            if health['latency_ewma'] is None:
+                health['latency_ewma'] = latency_seconds
+            else:
+                health['latency_ewma'] = (1 - alpha) * health['latency_ewma'] + alpha * latency_seconds
+    
+    @staticmethod
+    def _default_client_factory(key: str):
+        """
+        Build a genai client for a key (imported lazily so the manager has no hard dependency).
+        """
+        from google import genai
+        return genai.Client(api_key=key)
     
     def _is_key_available(self, key: str) -> bool:
         """
@@ -109,101 +519,472 @@ class GoogleAPIKeyManager:
         
         # Check if cooldown period has passed
         failure_time = self.failed_keys[key]
-        cooldown_end = failure_time + timedelta(minutes=self.cooldown_minutes)
+        cooldown = self.cooldown_durations.get(key, self.cooldown_minutes)
+        cooldown_end = failure_time + timedelta(minutes=cooldown)
         
         if datetime.now() >= cooldown_end:
             # Cooldown period passed, remove from failed list
             del self.failed_keys[key]
+            self.cooldown_durations.pop(key, None)
             key_id = self._get_key_id(key)
             logger.info(f"🔄 Key {key_id} recovered from cooldown")
             return True
         
         return False
     
+    def _rotation_order(self) -> List[str]:
+        """
+        Keys not in cooldown, in rotation order starting from the current key
+        (caller must hold the lock). Moves current_index past keys in cooldown.
+        """
+        self._sync_shared_state()
+        
+        count = len(self.api_keys)
+        order = [self.api_keys[(self.current_index + i) % count] for i in range(count)]
+        available = [key for key in order if self._is_key_available(key)]
+        
+        if available:
+            self.current_index = self.api_keys.index(available[0])
+        return available
+    
+    def _slot_wait_time(self, key: str) -> float:
+        """
+        Seconds until a key has room for one more request (caller must hold the lock).
+        """
+        buckets = self.rate_buckets.get(key, {})
+        return max((bucket.wait_time() for bucket in buckets.values()), default=0.0)
+    
     def get_current_key(self) -> str:
         """
         Get current API key (thread-safe).
-        Returns the next available key in rotation.
+        Returns the preferred key (see selection_strategy) that is out of cooldown and
+        has budget headroom. Does not consume budget - use acquire_key() to reserve a request slot.
         """
+        self._refresh_shared_state()
         with self.lock:
-            attempts = 0
-            max_attempts = len(self.api_keys)
+            candidates = self._order_candidates(self._rotation_order())
             
-            while attempts < max_attempts:
-                key = self.api_keys[self.current_index]
-                
-                if self._is_key_available(key):
-                    key_id = self._get_key_id(key)
-                    logger.debug(f"🔑 Using key {key_id} (index {self.current_index})")
+            for key in candidates:
+                if self._slot_wait_time(key) == 0:
+                    logger.debug(f"🔑 Using key {self._get_key_id(key)} (index {self.api_keys.index(key)})")
                     return key
-                
-                # Key not available, try next
-                self.current_index = (self.current_index + 1) % len(self.api_keys)
-                attempts += 1
+            
+            if candidates:
+                # Every budget is exhausted - stay on the current key
+                logger.debug("⏳ All available keys are at their rate budget")
+                return candidates[0]
             
             # All keys are in cooldown - return current anyway (will trigger retry logic)
             logger.warning("⚠️ All keys in cooldown, using current key anyway")
             return self.api_keys[self.current_index]
     
+    def _keys_with_headroom(self, exclude_keys: Collection[str] = ()) -> Tuple[List[str], float]:
+        """
+        Keys with budget headroom, most preferred first (caller must hold the lock).
+        Returns (keys, 0) or, when no key has headroom, ([], seconds until a slot frees up).
+        Raises NoKeyCapacityError if exclude_keys leaves no key at all.
+        """
+        # All keys in cooldown - fall back to every key, as get_current_key does
+        candidates = self._order_candidates(self._rotation_order() or self.api_keys)
+        candidates = [key for key in candidates if key not in exclude_keys]
+        if not candidates:
+            raise NoKeyCapacityError("No API key left besides the excluded ones", retry_after_seconds=0.0)
+        
+        with_headroom = [key for key in candidates if self._slot_wait_time(key) == 0]
+        if not with_headroom:
+            return [], min(self._slot_wait_time(key) for key in candidates)
+        return with_headroom, 0.0
+    
+    def _take_local_budget_locked(self, key: str) -> bool:
+        """
+        Consume one request from every process-local budget of a key (caller must hold the lock).
+        Returns False, consuming nothing, if any budget is exhausted.
+        """
+        buckets = self.rate_buckets.get(key, {})
+        if self._slot_wait_time(key) > 0:
+            return False
+        return all([bucket.consume() for bucket in buckets.values()])
+    
+    async def _take_budget(self, key: str) -> bool:
+        """
+        Consume one request from every budget of a key, all or nothing.
+        Returns False, consuming nothing, if any budget is exhausted.
+        Shared budgets are taken in one SQLite transaction on a worker thread.
+        """
+        buckets = self.rate_buckets.get(key, {})
+        if self.shared_state is not None and buckets:
+            limits = {name: (bucket.capacity, bucket.rate) for name, bucket in buckets.items()}
+            return await asyncio.to_thread(self.shared_state.take_tokens, key_fingerprint(key), limits)
+        
+        async with self._async_lock():
+            return self._take_local_budget_locked(key)
+    
+    async def acquire_key(self, max_wait_seconds: Optional[float] = None) -> str:
+        """
+        Reserve a request slot and return the key to use for it.
+        When every key is at its budget, waits (without blocking the event loop)
+        until a slot frees up. Raises NoKeyCapacityError if that would take longer
+        than max_wait_seconds (default: max_slot_wait_seconds).
+        Does not count toward per-key concurrency - prefer lease().
+        """
+        if max_wait_seconds is None:
+            max_wait_seconds = self.max_slot_wait_seconds
+        deadline = time.monotonic() + max_wait_seconds
+        
+        while True:
+            await self._refresh_shared_state_async()
+            async with self._async_lock():
+                keys, wait = self._keys_with_headroom()
+            
+            for key in keys:
+                if await self._take_budget(key):
+                    return key
+            
+            if not keys:
+                await self._wait_for_budget(wait, deadline)
+            # Otherwise other processes took the budget first - the failed takes refreshed
+            # the cached levels, so the next pass sees the real wait
+    
+    async def _wait_for_budget(self, wait: float, deadline: float):
+        """
+        Sleep until a budget slot should be free, or raise NoKeyCapacityError past the deadline.
+        """
+        remaining = deadline - time.monotonic()
+        if wait > remaining:
+            raise NoKeyCapacityError(
+                f"All API keys are at their rate budget (next slot in {wait:.1f}s)",
+                retry_after_seconds=wait
+            )
+        
+        logger.debug(f"⏳ Waiting {wait:.2f}s for a free request slot")
+        # Other waiters may take the slot first - callers re-check after waking
+        await asyncio.sleep(wait)
+    
+    async def _acquire_any_slot(self, slots: Dict[str, asyncio.Semaphore], keys: List[str], deadline: float) -> str:
+        """
+        Queue on the concurrency slots of all `keys` at once and return the key whose
+        slot frees up first (its slot stays acquired). Raises NoKeyCapacityError at the deadline.
+        """
+        waiters = {asyncio.ensure_future(slots[key].acquire()): key for key in keys}
+        try:
+            await asyncio.wait(waiters, timeout=max(0.0, deadline - time.monotonic()),
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+        
+        # Keep the most preferred slot we got, hand back any others
+        acquired = [key for waiter, key in waiters.items() if not waiter.cancelled() and waiter.exception() is None]
+        acquired.sort(key=keys.index)
+        for key in acquired[1:]:
+            slots[key].release()
+        
+        if not acquired:
+            latencies = [self.key_health[key]['latency_ewma'] or 1.0 for key in keys if key in self.key_health]
+            raise NoKeyCapacityError(
+                f"All API keys are at their concurrency limit ({self.max_concurrent_per_key} per key)",
+                retry_after_seconds=min(latencies, default=1.0)
+            )
+        return acquired[0]
+    
+    @asynccontextmanager
+    async def lease(
+        self,
+        max_wait_seconds: Optional[float] = None,
+        exclude_keys: Collection[str] = ()
+    ) -> AsyncIterator[str]:
+        """
+        Lease a key for one API call.
+        
+        Usage:
+            async with manager.lease() as key:
+                await call_model(api_key=key)
+        
+        On entry: picks a key (see selection_strategy) with budget headroom and a free
+        concurrency slot (max_concurrent_per_key), waiting for either if needed.
+        Raises NoKeyCapacityError if no slot is free within max_wait_seconds
+        (default: max_slot_wait_seconds). Keys in exclude_keys are never leased
+        (e.g. the key a hedged request's primary call is running on).
+        
+        On exit: records success and latency, or the failure - rate-limited keys go
+        into cooldown, rejected keys into the long auth cooldown, and the rotation
+        moves on for any key-related error. Exceptions are re-raised.
+        """
+        if max_wait_seconds is None:
+            max_wait_seconds = self.max_slot_wait_seconds
+        deadline = time.monotonic() + max_wait_seconds
+        wait_start = time.perf_counter()
+        
+        while True:
+            await self._refresh_shared_state_async()
+            async with self._async_lock():
+                slots = self._get_lease_slots()
+                keys, wait = self._keys_with_headroom(exclude_keys)
+            
+            if not keys:
+                await self._wait_for_budget(wait, deadline)
+                continue
+            
+            # A free slot is taken without yielding, so concurrent callers can't pile onto
+            # the same key between selection and acquisition. Only queue when every key
+            # with headroom is saturated.
+            free = [key for key in keys if key not in slots or not slots[key].locked()]
+            if free:
+                key = free[0]
+                if key in slots:
+                    await slots[key].acquire()
+            else:
+                key = await self._acquire_any_slot(slots, keys, deadline)
+            slot = slots.get(key)
+            
+            try:
+                taken = await self._take_budget(key)
+                if taken:
+                    async with self._async_lock():
+                        if key in self.key_health:
+                            self.key_health[key]['in_flight'] += 1
+            except BaseException:
+                if slot is not None:
+                    slot.release()
+                raise
+            
+            if taken:
+                break
+            
+            # Budget went to another caller (or process) while queued for the slot - pick again
+            if slot is not None:
+                slot.release()
+        
+        key_id = self._get_key_id(key)
+        start = time.perf_counter()
+        KEY_SLOT_WAIT.observe(start - wait_start)
+        KEY_IN_FLIGHT.inc(key=key_id)
+        try:
+            yield key
+        except Exception as e:
+            latency = time.perf_counter() - start
+            outcome = classify_error(e).value
+            async with self._async_lock():
+                self._handle_failure_locked(key, e)
+            KEY_REQUESTS.inc(key=key_id, outcome=outcome)
+            KEY_CALL_LATENCY.observe(latency, key=key_id, outcome=outcome)
+            raise
+        else:
+            latency = time.perf_counter() - start
+            async with self._async_lock():
+                self._record_success_locked(key, latency)
+            KEY_REQUESTS.inc(key=key_id, outcome="success")
+            KEY_CALL_LATENCY.observe(latency, key=key_id, outcome="success")
+        finally:
+            async with self._async_lock():
+                if key in self.key_health:
+                    self.key_health[key]['in_flight'] = max(0, self.key_health[key]['in_flight'] - 1)
+            KEY_IN_FLIGHT.dec(key=key_id)
+            if slot is not None:
+                slot.release()
+    
     def rotate_key(self, reason: str = "manual rotation") -> str:
         """
         Manually rotate to next key (thread-safe).
         Returns the new current key.
         """
         with self.lock:
-            old_key = self.api_keys[self.current_index]
-            old_key_id = self._get_key_id(old_key)
-            
-            self.current_index = (self.current_index + 1) % len(self.api_keys)
-            
-            new_key = self.api_keys[self.current_index]
-            new_key_id = self._get_key_id(new_key)
-            
-            logger.info(f"🔄 Rotated key: {old_key_id} → {new_key_id} (reason: {reason})")
-            return new_key
+            return self._rotate_key_locked(reason)
     
-    def mark_key_failed(self, key: str, error: Exception):
+    def _rotate_key_locked(self, reason: str) -> str:
+        """
+        Rotate to next key (caller must hold the lock).
+        """
+        old_key = self.api_keys[self.current_index]
+        old_key_id = self._get_key_id(old_key)
+        
+        self.current_index = (self.current_index + 1) % len(self.api_keys)
+        
+        new_key = self.api_keys[self.current_index]
+        new_key_id = self._get_key_id(new_key)
+        
+        logger.info(f"🔄 Rotated key: {old_key_id} → {new_key_id} (reason: {reason})")
+        return new_key
+    
+    def mark_key_failed(self, key: str, error: Exception, cooldown_minutes: Optional[float] = None):
         """
         Mark a key as failed and put it in cooldown (thread-safe).
+        
+        Args:
+            key: The failing API key
+            error: The error that caused the failure
+            cooldown_minutes: Override the default cooldown for this failure
         """
         with self.lock:
-            key_id = self._get_key_id(key)
-            self.failed_keys[key] = datetime.now()
+            self._mark_key_failed_locked(key, error, cooldown_minutes)
+    
+    def _mark_key_failed_locked(self, key: str, error: Exception, cooldown_minutes: Optional[float] = None):
+        """
+        Put a key in cooldown (caller must hold the lock).
+        """
+        key_id = self._get_key_id(key)
+        failed_time = datetime.now()
+        self.failed_keys[key] = failed_time
+        
+        cooldown = self.cooldown_minutes if cooldown_minutes is None else cooldown_minutes
+        self.cooldown_durations[key] = cooldown
+        
+        # Let the other processes skip this key too
+        if self.shared_state is not None:
+            self.shared_state.set_cooldown(key_fingerprint(key), failed_time.timestamp(), cooldown, str(error))
+        
+        # The failed call itself is counted by record_failure
+        if key_id in self.key_stats:
+            self.key_stats[key_id]['last_error'] = str(error)
+        KEY_COOLDOWNS.inc(key=key_id, kind=classify_error(error).value)
+        
+        # Long cooldown: drop the pooled client instead of keeping it idle
+        if cooldown >= self.client_evict_cooldown_minutes:
+            self._evict_client(key)
+        
+        cooldown_end = datetime.now() + timedelta(minutes=cooldown)
+        logger.warning(
+            f"❌ Key {key_id} marked as failed: {str(error)}\n"
+            f"   Cooldown until: {cooldown_end.strftime('%H:%M:%S')}"
+        )
+    
+    def remove_key(self, key: str):
+        """
+        Remove a key from rotation and drop its pooled client (thread-safe).
+        """
+        with self.lock:
+            if key not in self.api_keys:
+                return
             
-            # Update stats
-            if key_id in self.key_stats:
-                self.key_stats[key_id]['failed_requests'] += 1
-                self.key_stats[key_id]['last_error'] = str(error)
+            if len(self.api_keys) == 1:
+                raise ValueError("Cannot remove the last API key")
             
-            cooldown_end = datetime.now() + timedelta(minutes=self.cooldown_minutes)
-            logger.warning(
-                f"❌ Key {key_id} marked as failed: {str(error)}\n"
-                f"   Cooldown until: {cooldown_end.strftime('%H:%M:%S')}"
-            )
+            index = self.api_keys.index(key)
+            self.api_keys.remove(key)
+            if self.current_index > index or self.current_index >= len(self.api_keys):
+                self.current_index = max(0, self.current_index - 1) % len(self.api_keys)
+            
+            self.failed_keys.pop(key, None)
+            self.cooldown_durations.pop(key, None)
+            self.rate_buckets.pop(key, None)
+            self.key_health.pop(key, None)
+            self.key_stats.pop(self._get_key_id(key), None)
+            self._evict_client(key)
+            
+            logger.info(f"🗑️ Removed key {self._get_key_id(key)} from rotation")
+    
+    def get_client(self, key: Optional[str] = None) -> Tuple[str, Any]:
+        """
+        Get (api_key, client) from the pool (thread-safe).
+        Uses the current key in rotation when no key is given.
+        Clients are created lazily and reused so HTTP connections survive across calls.
+        """
+        if key is None:
+            key = self.get_current_key()
+        
+        with self.lock:
+            return key, self._get_client_locked(key)
+    
+    async def get_client_async(self, key: str) -> Tuple[str, Any]:
+        """
+        get_client() for coroutines. A pooled client is returned without waiting for the
+        lock (its LRU position is only updated if the lock is free); a miss builds the
+        client under the lock, taken without blocking the event loop.
+        """
+        client = self.client_pool.get(key)
+        if client is not None:
+            if self.lock.acquire(blocking=False):
+                try:
+                    if key in self.client_pool:
+                        self.client_pool.move_to_end(key)
+                finally:
+                    self.lock.release()
+            return key, client
+        
+        async with self._async_lock():
+            return key, self._get_client_locked(key)
     
-    def record_success(self, key: str):
+    def _get_client_locked(self, key: str) -> Any:
+        """
+        Pooled client for a key, created if missing (caller must hold the lock).
+        """
+        client = self.client_pool.get(key)
+        if client is not None:
+            self.client_pool.move_to_end(key)
+            return client
+        
+        client = self.client_factory(key)
+        self.client_pool[key] = client
+        
+        # Bounded pool: evict least recently used clients
+        while len(self.client_pool) > self.max_pooled_clients:
+            evicted_key, _ = self.client_pool.popitem(last=False)
+            logger.debug(f"♻️ Evicted pooled client for key {self._get_key_id(evicted_key)}")
+        
+        return client
+    
+    def _evict_client(self, key: str):
+        """
+        Drop the pooled client for a key (caller must hold the lock).
+        In-flight calls keep their reference; the client is released once they finish.
+        """
+        if self.client_pool.pop(key, None) is not None:
+            logger.info(f"♻️ Dropped pooled client for key {self._get_key_id(key)}")
+    
+    def record_success(self, key: str, latency_seconds: Optional[float] = None):
         """
         Record successful API call (thread-safe).
         """
         with self.lock:
-            key_id = self._get_key_id(key)
-            
-            if key_id in self.key_stats:
-                self.key_stats[key_id]['total_requests'] += 1
-                self.key_stats[key_id]['successful_requests'] += 1
-                self.key_stats[key_id]['last_used'] = datetime.now()
+            self._record_success_locked(key, latency_seconds)
+    
+    def _record_success_locked(self, key: str, latency_seconds: Optional[float]):
+        key_id = self._get_key_id(key)
+        self._update_health(key, failed=False, latency_seconds=latency_seconds)
+        if self.shared_state is not None:
+            self.shared_state.record_call(key_fingerprint(key), success=True)
+        
+        if key_id in self.key_stats:
+            self.key_stats[key_id]['total_requests'] += 1
+            self.key_stats[key_id]['successful_requests'] += 1
+            self.key_stats[key_id]['last_used'] = datetime.now()
     
     def record_failure(self, key: str, error: Exception):
         """
         Record failed API call (thread-safe).
         """
         with self.lock:
-            key_id = self._get_key_id(key)
-            
-            if key_id in self.key_stats:
-                self.key_stats[key_id]['total_requests'] += 1
-                self.key_stats[key_id]['failed_requests'] += 1
-                self.key_stats[key_id]['last_error'] = str(error)
+            self._record_failure_locked(key, error)
+    
+    def _record_failure_locked(self, key: str, error: Exception):
+        key_id = self._get_key_id(key)
+        self._update_health(key, failed=True, latency_seconds=None)
+        if self.shared_state is not None:
+            self.shared_state.record_call(key_fingerprint(key), success=False, error=str(error))
+        
+        if key_id in self.key_stats:
+            self.key_stats[key_id]['total_requests'] += 1
+            self.key_stats[key_id]['failed_requests'] += 1
+            self.key_stats[key_id]['last_error'] = str(error)
+    
+    def _handle_failure_locked(self, key: str, error: Exception):
+        """
+        Apply the failure policy for a call made with `key` (caller must hold the lock).
+        - Rate limit: key goes into cooldown
+        - Auth: key goes into long cooldown (client dropped)
+        - Any key-related error (incl. server / transient): rotation moves on
+        """
+        self._record_failure_locked(key, error)
+        
+        kind = classify_error(error)
+        if kind == ErrorKind.RATE_LIMIT:
+            self._mark_key_failed_locked(key, error)
+        elif kind == ErrorKind.AUTH:
+            self._mark_key_failed_locked(key, error, cooldown_minutes=self.auth_cooldown_minutes)
+        
+        if kind != ErrorKind.FATAL and self.api_keys[self.current_index] == key:
+            self._rotate_key_locked(reason=f"{kind.value}: {str(error)[:50]}")
     
     def should_retry_with_new_key(self, error: Exception) -> bool:
         """
@@ -213,45 +994,48 @@ class GoogleAPIKeyManager:
         - Rate limit errors (429)
         - Quota exceeded errors (429)
         - Invalid API key errors (403, 401)
-        - Service unavailable (503)
+        - Service errors (5xx) and transient network errors
         """
-        error_str = str(error).lower()
+        kind = classify_error(error)
         
-        # Rate limit / Quota errors
-        if any(kw in error_str for kw in [
-            'rate limit', 'quota', '429', 'too many requests',
-            'resource exhausted', 'limit exceeded'
-        ]):
+        if kind == ErrorKind.RATE_LIMIT:
             logger.warning(f"⚠️ Rate limit/Quota error detected: {error}")
-            return True
-        
-        # Authentication errors
-        if any(kw in error_str for kw in [
-            'invalid api key', 'unauthorized', '401', '403',
-            'permission denied', 'api key not valid'
-        ]):
+        elif kind == ErrorKind.AUTH:
             logger.error(f"🔒 Authentication error detected: {error}")
-            return True
-        
-        # Service errors
-        if any(kw in error_str for kw in [
-            'service unavailable', '503', 'temporarily unavailable',
-            'server error', '500', '502', '504'
-        ]):
+        elif kind in (ErrorKind.SERVER, ErrorKind.TRANSIENT):
             logger.warning(f"⚠️ Service error detected: {error}")
-            return True
         
         # Other errors - don't switch key
-        return False
+        return kind != ErrorKind.FATAL
+    
+    def get_backoff_delay(self, attempt: int) -> float:
+        """
+        Jittered exponential backoff ("full jitter"): uniform in [0, min(max, base * 2^attempt)].
+        Spreads retries out so concurrent callers don't hit the next key in lockstep.
+        """
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
     
     async def execute_with_retry(
         self, 
         async_func, 
         *args, 
+        exclude_keys: Collection[str] = (),
+        max_wait_seconds: Optional[float] = None,
         **kwargs
     ):
         """
         Execute an async function with automatic retry and key rotation.
+        The function receives the leased key as the `api_key` keyword argument.
+        Every attempt runs inside lease(), so it waits for budget headroom and a
+        free per-key concurrency slot instead of overloading a key
+        (exclude_keys / max_wait_seconds are passed on to lease()).
+        
+        Error handling (see classify_error):
+        - Rate limit: key goes into cooldown, retry on next key
+        - Auth: key goes into long cooldown (client dropped), retry on next key
+        - Server / transient: retry on next key without cooldown
+        - Anything else: raised immediately
         
         Usage:
             result = await manager.execute_with_retry(
@@ -265,51 +1049,110 @@ class GoogleAPIKeyManager:
         last_error = None
         
         while attempts < max_total_attempts:
-            current_key = self.get_current_key()
-            
             try:
-                # Execute function with current key
-                result = await async_func(*args, api_key=current_key, **kwargs)
-                
-                # Success! Record and return
-                self.record_success(current_key)
-                return result
+                async with self.lease(max_wait_seconds, exclude_keys) as current_key:
+                    return await async_func(*args, api_key=current_key, **kwargs)
                 
+            except NoKeyCapacityError:
+                raise
+            
             except Exception as e:
                 attempts += 1
                 last_error = e
                 
-                # Record failure
-                self.record_failure(current_key, e)
-                
-                # Check if we should switch key
-                if self.should_retry_with_new_key(e):
-                    # Mark key as failed (cooldown)
-                    self.mark_key_failed(current_key, e)
-                    
-                    # Rotate to next key
-                    self.rotate_key(reason=f"error: {str(e)[:50]}")
-                    
-                    # Small delay before retry
-                    await asyncio.sleep(0.5)
-                else:
+                # Check if we should switch key (the lease already recorded the failure)
+                if not self.should_retry_with_new_key(e):
                     # Error not related to API key - raise immediately
                     logger.error(f"❌ Non-recoverable error: {e}")
                     raise
+                
+                if attempts < max_total_attempts:
+                    KEY_RETRIES.inc(kind=classify_error(e).value)
+                    await asyncio.sleep(self.get_backoff_delay(attempts - 1))
         
         # All attempts failed
         logger.error(f"❌ All retry attempts exhausted ({max_total_attempts} attempts)")
         raise last_error
     
+    def get_capacity(self) -> Dict:
+        """
+        Snapshot of how much work the key pool can take right now (used by admission control).
+        
+        Returns:
+            available_keys: keys out of cooldown
+            max_in_flight: available_keys x max_concurrent_per_key (None if concurrency is unlimited)
+            in_flight: calls currently leased
+            budget_wait_seconds: time until any available key has rate budget again (0 = now)
+            recovery_seconds: time until the first key leaves cooldown (0 unless every key is cooling down)
+        """
+        self._refresh_shared_state()
+        with self.lock:
+            return self._capacity_locked()
+    
+    async def has_free_key(self, exclude_keys: Collection[str] = ()) -> bool:
+        """
+        Whether lease(max_wait_seconds=0, exclude_keys=...) would get a key right now
+        (budget headroom and a free concurrency slot), from the cached view. Reserves nothing.
+        """
+        await self._refresh_shared_state_async()
+        async with self._async_lock():
+            try:
+                keys, _ = self._keys_with_headroom(exclude_keys)
+            except NoKeyCapacityError:
+                return False
+            slots = self._get_lease_slots()
+            return any(key not in slots or not slots[key].locked() for key in keys)
+    
+    async def get_capacity_async(self) -> Dict:
+        """
+        get_capacity() for coroutines: never blocks the event loop on the lock or the shared state database.
+        """
+        await self._refresh_shared_state_async()
+        async with self._async_lock():
+            return self._capacity_locked()
+    
+    def _capacity_locked(self) -> Dict:
+        """
+        Capacity snapshot (caller must hold the lock).
+        """
+        available = self._rotation_order()
+        now = datetime.now()
+        recovery = 0.0
+        if not available and self.failed_keys:
+            recovery = min(
+                (failed_at + timedelta(minutes=self.cooldown_durations.get(key, self.cooldown_minutes)) - now).total_seconds()
+                for key, failed_at in self.failed_keys.items()
+            )
+        return {
+            'available_keys': len(available),
+            'max_in_flight': len(available) * self.max_concurrent_per_key if self.max_concurrent_per_key else None,
+            'in_flight': sum(health['in_flight'] for health in self.key_health.values()),
+            'budget_wait_seconds': min((self._slot_wait_time(key) for key in available), default=0.0),
+            'recovery_seconds': max(0.0, recovery),
+        }
+    
     def get_statistics(self) -> Dict:
         """
         Get usage statistics for all keys.
+        With shared state, request counters are totals across all processes
+        (reads the database - call off the event loop).
         """
+        self._refresh_shared_state()
+        shared_stats = self.shared_state.get_stats() if self.shared_state is not None else {}
+        
         with self.lock:
+            self._sync_shared_state()
+            
             stats = {
                 'total_keys': len(self.api_keys),
                 'active_keys': len([k for k in self.api_keys if self._is_key_available(k)]),
                 'failed_keys': len(self.failed_keys),
+                'pooled_clients': len(self.client_pool),
+                'requests_per_minute': self.requests_per_minute or 'unlimited',
+                'images_per_day': self.images_per_day or 'unlimited',
+                'selection_strategy': self.selection_strategy,
+                'max_concurrent_per_key': self.max_concurrent_per_key or 'unlimited',
+                'shared_state': str(self.shared_state.path) if self.shared_state is not None else 'disabled',
                 'current_key_index': self.current_index,
                 'key_details': {}
             }
@@ -317,6 +1160,12 @@ class GoogleAPIKeyManager:
             for key in self.api_keys:
                 key_id = self._get_key_id(key)
                 key_data = self.key_stats.get(key_id, {})
+                if self.shared_state is not None:
+                    key_data = dict(shared_stats.get(key_fingerprint(key), {}))
+                    if key_data.get('last_used'):
+                        key_data['last_used'] = datetime.fromtimestamp(key_data['last_used'])
+                buckets = self.rate_buckets.get(key, {})
+                health = self.key_health.get(key, self._new_health())
                 
                 stats['key_details'][key_id] = {
                     'status': 'available' if self._is_key_available(key) else 'cooldown',
@@ -329,7 +1178,12 @@ class GoogleAPIKeyManager:
                     ),
                     'last_used': key_data.get('last_used').strftime('%Y-%m-%d %H:%M:%S') 
                                  if key_data.get('last_used') else 'Never',
-                    'last_error': key_data.get('last_error', 'None')
+                    'last_error': key_data.get('last_error') or 'None',
+                    'rpm_headroom': int(buckets['rpm'].available()) if 'rpm' in buckets else 'unlimited',
+                    'images_headroom': int(buckets['images'].available()) if 'images' in buckets else 'unlimited',
+                    'latency_ewma_ms': round(health['latency_ewma'] * 1000, 1) if health['latency_ewma'] is not None else 'N/A',
+                    'error_rate': f"{health['error_ewma'] * 100:.1f}%",
+                    'in_flight': health['in_flight']
                 }
             
             return stats
@@ -346,6 +1200,11 @@ class GoogleAPIKeyManager:
         print(f"Total Keys: {stats['total_keys']}")
         print(f"Active Keys: {stats['active_keys']}")
         print(f"Keys in Cooldown: {stats['failed_keys']}")
+        print(f"Pooled Clients: {stats['pooled_clients']}")
+        print(f"Budget per Key: {stats['requests_per_minute']} RPM, {stats['images_per_day']} images/day")
+        print(f"Selection Strategy: {stats['selection_strategy']}")
+        print(f"Max In-Flight per Key: {stats['max_concurrent_per_key']}")
+        print(f"Shared State: {stats['shared_state']}")
         print(f"Current Key Index: {stats['current_key_index']}")
         print("\n" + "-"*80)
         print("KEY DETAILS:")
@@ -359,6 +1218,8 @@ class GoogleAPIKeyManager:
             print(f"   Failed: {details['failed_requests']}")
             print(f"   Success Rate: {details['success_rate']}")
             print(f"   Last Used: {details['last_used']}")
+            print(f"   Headroom: {details['rpm_headroom']} requests this minute, {details['images_headroom']} images today")
+            print(f"   Latency (EWMA): {details['latency_ewma_ms']} ms, Error Rate (EWMA): {details['error_rate']}, In Flight: {details['in_flight']}")
             if details['last_error'] != 'None':
                 print(f"   Last Error: {details['last_error'][:60]}...")
         
@@ -381,16 +1242,19 @@ def get_api_key_manager() -> GoogleAPIKeyManager:
     return _global_manager
 
 
+def init_api_key_manager(**kwargs) -> GoogleAPIKeyManager:
+    """
+    Create the global manager with explicit settings (e.g. keys or client_factory),
+    replacing any existing instance. Accepts GoogleAPIKeyManager constructor arguments.
+    """
+    global _global_manager
+    _global_manager = GoogleAPIKeyManager(**kwargs)
+    return _global_manager
+
+
 def reset_api_key_manager():
     """
     Reset global manager (useful for testing or re-initialization).
     """
     global _global_manager
     _global_manager = None
-
-
-# For convenience - import asyncio if needed
-try:
-    import asyncio
-except ImportError:
-    logger.warning("asyncio not available - execute_with_retry will not work")
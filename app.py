@@ -1,84 +1,44 @@
 # app_v2.py - FIXED VERSION with Native Streamlit File Uploader
 
 import streamlit as st
-import asyncio
 from PIL import Image
 import json
+import time
 import uuid
 
 # Import modules
 from tools import remove_and_place_object, virtual_tryon, RemoveAndPlaceObjectInput, VirtualTryOnInput
-from google.adk.tools import ToolContext
-from google.genai import types
+from tool_context import LocalToolContext
+from job_queue import get_job_queue, JobStatus, report_progress
+from admission import AdmissionRejected
+from metrics import start_metrics_exporter
 from utils import classify_user_intent, generate_clarification_prompt
 from pathlib import Path
-import tempfile
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Replaying cassettes (CASSETTE_MODE=replay) never reaches the model - no real key needed
+if os.getenv("CASSETTE_MODE", "").strip().lower() == "replay" and not os.getenv("GOOGLE_API_KEY"):
+    os.environ["GOOGLE_API_KEY"] = "cassette-replay"
+
 # Verify API key
 if not os.getenv("GOOGLE_API_KEY"):
     st.error("❗ GOOGLE_API_KEY not found in environment variables!")
     st.stop()
 
+# Prometheus metrics via METRICS_PORT / METRICS_FILE (no-op on reruns)
+start_metrics_exporter()
+
+# How often the page re-checks a running generation job
+JOB_POLL_INTERVAL_SECONDS = 1.0
+
 
 # ===== STREAMLIT TOOL CONTEXT =====
-class StreamlitToolContext(ToolContext):
+class StreamlitToolContext(LocalToolContext):
     """ToolContext implementation for Streamlit app"""
-    
-    def __init__(self, output_dir: Path):
-        self.output_dir = output_dir
-        self.output_dir.mkdir(exist_ok=True, parents=True)
-        self.version_counters = {}
-    
-    async def load_artifact(self, filename: str):
-        """Load image from file"""
-        file_path = Path(filename)
-        if not file_path.is_absolute():
-            file_path = self.output_dir.parent / filename
-        
-        if not file_path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
-        
-        with open(file_path, 'rb') as f:
-            image_data = f.read()
-        
-        # Determine MIME type
-        suffix = file_path.suffix.lower()
-        mime_type = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.webp': 'image/webp'
-        }.get(suffix, 'image/jpeg')
-        
-        return types.Part(
-            inline_data=types.Blob(
-                mime_type=mime_type,
-                data=image_data
-            )
-        )
-    
-    async def save_artifact(self, filename: str, artifact):
-        """Save generated image"""
-        output_path = self.output_dir / filename
-        
-        if hasattr(artifact, 'inline_data') and artifact.inline_data:
-            with open(output_path, 'wb') as f:
-                f.write(artifact.inline_data.data)
-                f.flush()  # Force flush to disk
-                os.fsync(f.fileno())  # Ensure data written to disk
-            
-            # Verify file exists and has content
-            if output_path.exists() and output_path.stat().st_size > 0:
-                return output_path
-            else:
-                raise ValueError(f"Failed to save artifact to {output_path}")
-        else:
-            raise ValueError("Artifact does not contain inline_data")
 
 # Page config
 st.set_page_config(
@@ -399,6 +359,8 @@ if 'processed_message_ids' not in st.session_state:
     st.session_state.processed_message_ids = set()  # Track all processed message IDs
 if 'generating_image' not in st.session_state:
     st.session_state.generating_image = False  # Track image generation status
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = None  # Background generation job being polled
 
 # === SIDEBAR ===
 with st.sidebar:
@@ -481,6 +443,8 @@ with col2:
         st.session_state.processing = False
         st.session_state.last_generated_image = None
         st.session_state.processed_message_ids = set()  # Reset processed IDs
+        st.session_state.active_job_id = None
+        st.session_state.generating_image = False
         st.rerun()
 
 # Chat messages display
@@ -526,6 +490,33 @@ for message in st.session_state.messages:
         </div>
         """, unsafe_allow_html=True)
 
+def render_job_progress(job):
+    """Show a running job's stage timings and its intermediate (emptied room) image"""
+    if job is None or not job.progress:
+        return
+
+    events = list(job.progress)  # Appended to by the job queue thread
+    finished = {(e["tool"], e["stage"]): e["duration_ms"] for e in events if e["event"] == "stage_finished"}
+    lines = []
+    for e in events:
+        if e["event"] != "stage_started":
+            continue
+        duration_ms = finished.get((e["tool"], e["stage"]))
+        if duration_ms is None:
+            lines.append(f"<i class='fas fa-spinner fa-spin'></i> {e['stage']}...")
+        else:
+            lines.append(f"<i class='fas fa-check'></i> {e['stage']} - {duration_ms / 1000:.1f}s")
+    if lines:
+        st.markdown(
+            f"<div style='color: #a0a0a0; font-size: 0.9rem; margin-bottom: 1rem;'>{'<br>'.join(lines)}</div>",
+            unsafe_allow_html=True
+        )
+
+    removal = next((e for e in reversed(events) if e["event"] == "removal_ready" and e.get("data")), None)
+    if removal is not None:
+        # Shown from the event's bytes - the file may still be waiting to be written (ARTIFACT_DURABILITY=memory)
+        st.image(removal["data"], caption="Step 1: room after removal - placing furniture...", use_column_width=True)
+
 # Display last generated image if exists
 # Show loading state if generating image
 if st.session_state.generating_image:
@@ -538,6 +529,7 @@ if st.session_state.generating_image:
         </span>
     </div>
     """, unsafe_allow_html=True)
+    render_job_progress(get_job_queue().get(st.session_state.active_job_id) if st.session_state.active_job_id else None)
 elif st.session_state.last_generated_image:
     st.markdown("---")
     st.markdown("### <i class='fas fa-image'></i> Generated Image", unsafe_allow_html=True)
@@ -596,8 +588,126 @@ else:
 user_input = st.chat_input(placeholder_text)
 
 # Process user input
-async def process_message(user_message: str, files: list):
-    """Process user message with REAL ROOT AGENT from Google ADK"""
+async def run_visual_task(user_message: str, uploads: list, session_id: str) -> dict:
+    """
+    Run furniture placement / virtual try-on for one message.
+    Executed on the background job queue, outside the Streamlit script thread,
+    so it must not touch st.session_state.
+    
+    Args:
+        user_message: The user's request text
+        uploads: List of (filename, bytes) for the 2 uploaded images
+        session_id: Streamlit session - results live in its own namespace
+    
+    Returns:
+        {"response": assistant message, "image_path": generated image path or None}
+    """
+    # No canvas coordinates (canvas feature removed)
+    coords = None
+    
+    # Hand the uploaded bytes to the tools in memory (no temp files);
+    # the index prefix keeps two uploads with the same name apart
+    in_memory = {f"upload_{index}_{name}": data for index, (name, data) in enumerate(uploads)}
+    file_paths = list(in_memory)
+    
+    # Create tool context
+    output_dir = Path("generated_images")
+    tool_context = StreamlitToolContext(
+        output_dir, progress_callback=report_progress, namespace=session_id, uploads=in_memory
+    )
+    
+    # Classify task type from user message
+    furniture_keywords = ["xóa", "đặt", "thay", "phòng", "bàn", "ghế", "tủ", "nội thất", "sofa", "kệ"]
+    fashion_keywords = ["thử", "mặc", "áo", "quần", "đồ", "váy", "jacket", "dress", "shirt", "pants"]
+    
+    is_furniture = any(kw in user_message.lower() for kw in furniture_keywords)
+    is_fashion = any(kw in user_message.lower() for kw in fashion_keywords)
+    
+    # Default to furniture if unclear
+    if not is_fashion:
+        # FURNITURE PLACEMENT
+        tool_input = RemoveAndPlaceObjectInput(
+            room_image_filename=file_paths[0],
+            furniture_image_filename=file_paths[1],
+            mask_coordinates=json.dumps(coords) if coords else "{}",
+            removal_prompt=user_message,
+            placement_description=user_message,
+            asset_name="furniture_placement"
+        )
+        
+        try:
+            result = await remove_and_place_object(tool_context, tool_input)
+        except AdmissionRejected as e:
+            return busy_response(e)
+        
+    else:
+        # VIRTUAL TRY-ON
+        # Auto-detect clothing type
+        if "áo" in user_message.lower() or "shirt" in user_message.lower():
+            clothing_type = "shirt"
+        elif "quần" in user_message.lower() or "pants" in user_message.lower():
+            clothing_type = "pants"
+        elif "váy" in user_message.lower() or "dress" in user_message.lower():
+            clothing_type = "dress"
+        elif "jacket" in user_message.lower():
+            clothing_type = "jacket"
+        else:
+            clothing_type = "shirt"  # Default
+        
+        tool_input = VirtualTryOnInput(
+            person_image_filename=file_paths[0],
+            clothing_image_filename=file_paths[1],
+            clothing_type=clothing_type,
+            asset_name="virtual_tryon"
+        )
+        
+        try:
+            result = await virtual_tryon(tool_context, tool_input)
+        except AdmissionRejected as e:
+            return busy_response(e)
+    
+    # Display result - the tool hands back the artifact it saved
+    # (the page shows it from disk, so wait for background writes in ARTIFACT_DURABILITY=memory)
+    await tool_context.wait_for_spills()
+    image_path = None
+    artifact = getattr(result, "artifact", None)
+    if artifact is not None:
+        image_path = str(artifact.path)
+        
+        response = f"""<i class='fas fa-check-circle' style='color: #10b981;'></i> **Processing completed!**
+
+<i class='fas fa-chart-line'></i> **Result:** {result}
+
+<i class='fas fa-image'></i> **Generated:** `{artifact.filename}` ({artifact.size / 1024:.1f} KB)"""
+    else:
+        response = f"""<i class='fas fa-exclamation-triangle' style='color: #f59e0b;'></i> **Tool executed but no image found**
+
+<i class='fas fa-chart-line'></i> **Result:** {result}"""
+    
+    return {"response": response, "image_path": image_path}
+
+def busy_response(rejection: AdmissionRejected) -> dict:
+    """Chat reply for a generation shed by admission control (server overloaded)"""
+    response = f"""<i class='fas fa-hourglass-half' style='color: #f59e0b;'></i> **Server is busy right now**
+
+Too many images are being generated at the moment. Please send your request again in about {int(rejection.retry_after_seconds)} seconds."""
+    return {"response": response, "image_path": None}
+
+def format_error_message(error: str, error_details: str) -> str:
+    """Format an error for the chat"""
+    return f"""<i class='fas fa-times-circle' style='color: #ef4444;'></i> **Error occurred:**
+
+{error}
+
+**Technical Details:**
+```
+{error_details}
+```
+
+<i class='fas fa-lightbulb' style='color: #3b82f6;'></i> Please try again or contact support."""
+
+def submit_message(user_message: str, files: list):
+    """Classify user message and hand visual tasks to the background job queue"""
     try:
         # Classify intent
         intent, confidence = classify_user_intent(user_message, files)
@@ -608,96 +718,13 @@ async def process_message(user_message: str, files: list):
             st.session_state.messages.append({"role": "assistant", "content": clarification})
             return
         
-        # VISUAL INTENT - Call REAL AGENT
+        # VISUAL INTENT - Run tools on the job queue, this script run returns immediately
         if intent == "visual" and len(files) == 2:
-            # No canvas coordinates (canvas feature removed)
-            coords = None
-            
-            # Save uploaded files to temp directory
-            temp_dir = Path(tempfile.gettempdir()) / "ai_visual_assistant"
-            temp_dir.mkdir(exist_ok=True, parents=True)
-            
-            # Save files
-            file_paths = []
-            for file in files:
-                file_path = temp_dir / file.name
-                with open(file_path, 'wb') as f:
-                    f.write(file.getvalue())
-                file_paths.append(str(file_path))
-            
-            # Create tool context
-            output_dir = Path("generated_images")
-            output_dir.mkdir(exist_ok=True, parents=True)
-            tool_context = StreamlitToolContext(output_dir)
-            
-            # Classify task type from user message
-            furniture_keywords = ["xóa", "đặt", "thay", "phòng", "bàn", "ghế", "tủ", "nội thất", "sofa", "kệ"]
-            fashion_keywords = ["thử", "mặc", "áo", "quần", "đồ", "váy", "jacket", "dress", "shirt", "pants"]
-            
-            is_furniture = any(kw in user_message.lower() for kw in furniture_keywords)
-            is_fashion = any(kw in user_message.lower() for kw in fashion_keywords)
-            
-            # Default to furniture if unclear
-            if not is_fashion:
-                # FURNITURE PLACEMENT
-                tool_input = RemoveAndPlaceObjectInput(
-                    room_image_filename=file_paths[0],
-                    furniture_image_filename=file_paths[1],
-                    mask_coordinates=json.dumps(coords) if coords else "{}",
-                    removal_prompt=user_message,
-                    placement_description=user_message,
-                    asset_name="furniture_placement"
-                )
-                
-                result = await remove_and_place_object(tool_context, tool_input)
-                
-                # Find generated image
-                generated_files = sorted(output_dir.glob("furniture_placement_v*.png"), 
-                                       key=lambda p: p.stat().st_mtime, reverse=True)
-                
-            else:
-                # VIRTUAL TRY-ON
-                # Auto-detect clothing type
-                if "áo" in user_message.lower() or "shirt" in user_message.lower():
-                    clothing_type = "shirt"
-                elif "quần" in user_message.lower() or "pants" in user_message.lower():
-                    clothing_type = "pants"
-                elif "váy" in user_message.lower() or "dress" in user_message.lower():
-                    clothing_type = "dress"
-                elif "jacket" in user_message.lower():
-                    clothing_type = "jacket"
-                else:
-                    clothing_type = "shirt"  # Default
-                
-                tool_input = VirtualTryOnInput(
-                    person_image_filename=file_paths[0],
-                    clothing_image_filename=file_paths[1],
-                    clothing_type=clothing_type,
-                    asset_name="virtual_tryon"
-                )
-                
-                result = await virtual_tryon(tool_context, tool_input)
-                
-                # Find generated image
-                generated_files = sorted(output_dir.glob("virtual_tryon_v*.png"), 
-                                       key=lambda p: p.stat().st_mtime, reverse=True)
-            
-            # Display result
-            if generated_files:
-                latest_image = generated_files[0]
-                st.session_state.last_generated_image = str(latest_image)
-                
-                response = f"""<i class='fas fa-check-circle' style='color: #10b981;'></i> **Processing completed!**
-
-<i class='fas fa-chart-line'></i> **Result:** {result}
-
-<i class='fas fa-image'></i> **Generated:** `{latest_image.name}` ({latest_image.stat().st_size / 1024:.1f} KB)"""
-            else:
-                response = f"""<i class='fas fa-exclamation-triangle' style='color: #f59e0b;'></i> **Tool executed but no image found**
-
-<i class='fas fa-chart-line'></i> **Result:** {result}"""
-            
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            uploads = [(file.name, file.getvalue()) for file in files]
+            st.session_state.active_job_id = get_job_queue().submit(
+                run_visual_task, user_message, uploads, st.session_state.session_id
+            )
+            st.session_state.generating_image = True
         
         else:
             response = f"""<i class='fas fa-exclamation-triangle' style='color: #f59e0b;'></i> **Request not supported**
@@ -713,20 +740,23 @@ Currently requires exactly 2 images for processing.
     
     except Exception as e:
         import traceback
-        error_details = traceback.format_exc()
-        error_msg = f"""<i class='fas fa-times-circle' style='color: #ef4444;'></i> **Error occurred:**
-
-{str(e)}
-
-**Technical Details:**
-```
-{error_details}
-```
+        error_msg = format_error_message(str(e), traceback.format_exc())
+        st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
-<i class='fas fa-lightbulb' style='color: #3b82f6;'></i> Please try again or contact support."""
+def collect_job_result(job):
+    """Move a finished job's result into the chat"""
+    if job is None:
+        error_msg = format_error_message("Generation job was lost (server restarted?)", "")
+        st.session_state.messages.append({"role": "assistant", "content": error_msg})
+    elif job.status == JobStatus.DONE:
+        if job.result["image_path"]:
+            st.session_state.last_generated_image = job.result["image_path"]
+        st.session_state.messages.append({"role": "assistant", "content": job.result["response"]})
+    else:
+        error_msg = format_error_message(job.error, job.error_details)
         st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
-if user_input and not st.session_state.processing:
+if user_input and not st.session_state.processing and not st.session_state.active_job_id:
     # Create unique message ID
     message_id = str(uuid.uuid4())
     
@@ -782,20 +812,14 @@ if st.session_state.processing:
             st.session_state.processed_message_ids.add(msg.get("id"))
             msg["processed"] = True
             
-            # Set generating state before processing
-            st.session_state.generating_image = True
-            
-            # Process message
-            asyncio.run(process_message(msg["content"], st.session_state.uploaded_files))
-            
-            # Reset generating state after processing
-            st.session_state.generating_image = False
+            # Submit message - generation runs on the job queue, not in this script run
+            submit_message(msg["content"], st.session_state.uploaded_files)
             
             # Reset processing flag BEFORE rerun
             st.session_state.processing = False
             st.session_state.processed_message_id = None
             
-            # IMPORTANT: Only rerun once to show response
+            # IMPORTANT: Only rerun once to show response / generating state
             # After this rerun, processing=False so won't enter this block again
             st.rerun()
             break
@@ -812,3 +836,16 @@ st.markdown("""
     <i class="fas fa-robot"></i> AI Visual Assistant | Powered by Google ADK & Gemini 2.5 Flash
 </div>
 """, unsafe_allow_html=True)
+
+# Poll background generation job (page is fully rendered at this point)
+if st.session_state.active_job_id:
+    job = get_job_queue().get(st.session_state.active_job_id)
+    
+    if job is None or job.done:
+        collect_job_result(job)
+        st.session_state.active_job_id = None
+        st.session_state.generating_image = False
+        st.rerun()
+    else:
+        time.sleep(JOB_POLL_INTERVAL_SECONDS)
+        st.rerun()
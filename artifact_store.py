@@ -0,0 +1,237 @@
+# artifact_store.py - Versioned, concurrency-safe storage for generated images
+#
+# Layout: <root>/<namespace>/<name>_v<version><ext>
+#   namespace   one per session / client (e.g. the Streamlit session id), so sessions
+#               sharing generated_images/ never see or overwrite each other's files
+#   version     monotonic per (namespace, name), allocated atomically: the final filename
+#               is claimed with O_CREAT | O_EXCL, so concurrent saves - from other threads
+#               or other processes - always get distinct versions
+#
+# Files are written to a temp file in the same directory and renamed into place, so a
+# reader never sees a partially written image. How hard a save waits for the disk:
+#   ARTIFACT_DURABILITY=fsync    write + fsync before returning (default, survives a crash)
+#   ARTIFACT_DURABILITY=flush    write without fsync (the OS writes back later)
+#   ARTIFACT_DURABILITY=memory   return at once with the bytes kept on the Artifact; a
+#                                background thread spills them to disk (no fsync)
+
+import os
+import re
+import uuid
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+try:
+    from .result_cache import EXTENSIONS
+except ImportError:
+    from result_cache import EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+DURABILITY_MODES = ("fsync", "flush", "memory")
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """
+    Handle to one saved artifact version.
+    """
+    namespace: Optional[str]
+    name: str
+    version: int
+    path: Path
+    mime_type: str
+    size: int
+    data: Optional[bytes] = field(default=None, repr=False, compare=False)  # Kept in "memory" durability
+    spill: Optional[Future] = field(default=None, repr=False, compare=False)  # Pending background write
+
+    @property
+    def filename(self) -> str:
+        return self.path.name
+
+    def read_bytes(self) -> bytes:
+        """
+        The artifact's bytes - from memory when still held, otherwise from disk.
+        """
+        return self.data if self.data is not None else self.path.read_bytes()
+
+
+class ArtifactResult(str):
+    """
+    A tool's result message that also carries the artifact it saved (None on failure).
+    Behaves as the plain message everywhere a string is expected.
+    """
+    artifact: Optional[Artifact]
+
+    def __new__(cls, message: str, artifact: Optional[Artifact] = None):
+        result = super().__new__(cls, message)
+        result.artifact = artifact
+        return result
+
+
+def write_atomic(path: Path, data: bytes, fsync: bool = True):
+    """
+    Write-then-rename: readers see the old file or the complete new one, never a partial write.
+    """
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class ArtifactStore:
+    """
+    Per-namespace, versioned artifact files under one root directory.
+
+    Features:
+    - Monotonic versions per (namespace, name), unique across threads and processes
+    - Next version known in memory after the first save (no directory scans per save)
+    - Atomic writes (temp file + rename)
+    - Durability per save: fsync, flush only, or in memory with a background spill
+    """
+
+    def __init__(self, root: Path):
+        """
+        Initialize artifact store.
+
+        Args:
+            root: Directory holding one sub-directory per namespace (files go directly
+                into root when no namespace is given)
+        """
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True, parents=True)
+        self.next_versions: Dict[Tuple[Optional[str], str], int] = {}
+        self.lock = Lock()
+        self.spill_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="artifact-spill")
+
+    def namespace_dir(self, namespace: Optional[str]) -> Path:
+        if namespace is None:
+            return self.root
+        if not _SAFE_NAME.match(namespace):
+            raise ValueError(f"Invalid artifact namespace: {namespace!r}")
+        directory = self.root / namespace
+        directory.mkdir(exist_ok=True)
+        return directory
+
+    def _first_free_version(self, directory: Path, name: str, extension: str) -> int:
+        """
+        One directory scan per (namespace, name) and process: highest existing version + 1.
+        """
+        pattern = re.compile(rf"^{re.escape(name)}_v(\d+){re.escape(extension)}$")
+        versions = [int(m.group(1)) for m in (pattern.match(p.name) for p in directory.iterdir()) if m]
+        return max(versions, default=0) + 1
+
+    def _claim_version(self, directory: Path, namespace: Optional[str], name: str, extension: str) -> Tuple[int, Path]:
+        """
+        Reserve the next version's filename (O_EXCL create - another process may hold the
+        in-memory "next" version already, in which case the following one is tried).
+        """
+        key = (namespace, name)
+        with self.lock:
+            if key not in self.next_versions:
+                self.next_versions[key] = self._first_free_version(directory, name, extension)
+            while True:
+                version = self.next_versions[key]
+                self.next_versions[key] = version + 1
+                path = directory / f"{name}_v{version}{extension}"
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    return version, path
+                except FileExistsError:
+                    continue
+
+    def spill(self, path: Path, data: bytes, reserved: bool = False) -> Future:
+        """
+        Write data to path on a background thread (no fsync). Failures are logged; a
+        reserved (still empty) version filename is released.
+        """
+        def write():
+            try:
+                write_atomic(path, data, fsync=False)
+            except Exception as e:
+                if reserved:
+                    path.unlink(missing_ok=True)
+                logger.error(f"❌ Could not spill artifact {path}: {e}")
+                raise
+
+        return self.spill_executor.submit(write)
+
+    def save_version(
+        self,
+        namespace: Optional[str],
+        name: str,
+        data: bytes,
+        mime_type: str = "image/png",
+        durability: str = "fsync"
+    ) -> Artifact:
+        """
+        Store data as the next version of `name` in `namespace` and return its handle.
+        Characters not allowed in filenames are replaced in `name`.
+
+        In "memory" durability the handle holds the bytes and artifact.spill the pending
+        write - until it completes the file exists but is empty (use artifact.read_bytes()).
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability: {durability} (expected one of {DURABILITY_MODES})")
+        name = _UNSAFE_CHARS.sub("_", name).lstrip(".") or "artifact"
+
+        directory = self.namespace_dir(namespace)
+        extension = EXTENSIONS.get(mime_type, '.png')
+        version, path = self._claim_version(directory, namespace, name, extension)
+        if durability == "memory":
+            return Artifact(
+                namespace=namespace, name=name, version=version, path=path, mime_type=mime_type,
+                size=len(data), data=data, spill=self.spill(path, data, reserved=True)
+            )
+
+        try:
+            write_atomic(path, data, fsync=durability == "fsync")
+        except BaseException:
+            path.unlink(missing_ok=True)  # Give up the reserved (still empty) filename
+            raise
+
+        logger.debug(f"💾 Saved {path} ({len(data)} bytes)")
+        return Artifact(namespace=namespace, name=name, version=version, path=path, mime_type=mime_type, size=len(data))
+
+
+# One store per root directory, shared by every context in the process (keeps version counters warm)
+_stores: Dict[Path, ArtifactStore] = {}
+_stores_lock = Lock()
+
+
+def get_artifact_store(root: Path) -> ArtifactStore:
+    """
+    Get or create the artifact store for a root directory.
+    """
+    key = Path(root).resolve()
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ArtifactStore(key)
+        return store
+
+
+def get_artifact_durability() -> str:
+    """
+    Durability for saved artifacts.
+
+    Environment:
+        ARTIFACT_DURABILITY: fsync, flush or memory (default: fsync)
+    """
+    durability = os.getenv('ARTIFACT_DURABILITY', 'fsync').strip().lower() or 'fsync'
+    if durability not in DURABILITY_MODES:
+        raise ValueError(f"Unknown ARTIFACT_DURABILITY: {durability} (expected one of {DURABILITY_MODES})")
+    return durability
@@ -0,0 +1,283 @@
+# batch_runner.py - Catalog-scale batch runs of furniture placement and virtual try-on
+#
+# Usage:
+#   python batch_runner.py manifest.csv --output-dir previews/
+#   python batch_runner.py manifest.jsonl --output-dir previews/ --concurrency 8
+#
+# Manifest columns (CSV header or JSONL keys):
+#   id                     Unique item id (defaults to the row number), used as output filename
+#   task                   "placement" (remove_and_place_object) or "tryon" (virtual_tryon)
+#   base_image             Room photo (placement) or person photo (try-on)
+#   product_image          Furniture/object image (placement) or clothing image (try-on)
+#   clothing_type          Try-on only: shirt, pants, dress or jacket
+#   placement_description  Placement only: where to place the object
+#   removal_prompt         Placement only (optional): what to remove first
+#   mask_coordinates       Placement only (optional): JSON {"x", "y", "width", "height"}
+#
+# Relative image paths are resolved against the manifest's directory.
+# Items run at batch admission priority: interactive requests in the same process are
+# served first, and items shed under overload are deferred and retried after the
+# server's retry-after hint (up to MAX_DEFERRALS times).
+# Results are appended to <output-dir>/results.jsonl; re-running the same command
+# skips items that already succeeded, so an interrupted run can simply be restarted.
+# Prometheus metrics are written to <output-dir>/metrics.prom when the run ends
+# (and exported live with METRICS_PORT / METRICS_FILE).
+
+import argparse
+import asyncio
+import csv
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Set
+
+from dotenv import load_dotenv
+
+from admission import AdmissionRejected
+from api_key_manager import get_api_key_manager
+from metrics import REGISTRY, start_metrics_exporter
+from tool_context import LocalToolContext
+from tools import (
+    remove_and_place_object,
+    virtual_tryon,
+    RemoveAndPlaceObjectInput,
+    VirtualTryOnInput
+)
+
+TASK_ALIASES = {
+    "placement": "placement",
+    "furniture": "placement",
+    "remove_and_place_object": "placement",
+    "tryon": "tryon",
+    "try-on": "tryon",
+    "virtual_tryon": "tryon",
+}
+
+# Times an item shed by admission control is deferred before it is recorded as failed
+MAX_DEFERRALS = 20
+
+# Alternative column names accepted in manifests
+COLUMN_ALIASES = {
+    "room_image": "base_image",
+    "person_image": "base_image",
+    "furniture_image": "product_image",
+    "clothing_image": "product_image",
+}
+
+
+# === MANIFEST ===
+def load_manifest(manifest_path: Path) -> List[Dict]:
+    """
+    Read a CSV or JSONL manifest into normalized item dicts.
+    """
+    if manifest_path.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(manifest_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    items = []
+    seen_ids: Set[str] = set()
+    for index, row in enumerate(rows, start=1):
+        item = {COLUMN_ALIASES.get(k.strip(), k.strip()): (v.strip() if isinstance(v, str) else v)
+                for k, v in row.items() if k}
+
+        task = TASK_ALIASES.get(str(item.get("task", "")).lower())
+        if task is None:
+            raise ValueError(f"Row {index}: unknown task '{item.get('task')}'")
+        if not item.get("base_image") or not item.get("product_image"):
+            raise ValueError(f"Row {index}: base_image and product_image are required")
+
+        # Item id doubles as output asset name - keep it filesystem safe
+        item_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(item.get("id") or index))
+        if item_id in seen_ids:
+            raise ValueError(f"Row {index}: duplicate id '{item_id}'")
+        seen_ids.add(item_id)
+
+        item["id"] = item_id
+        item["task"] = task
+        for column in ("base_image", "product_image"):
+            path = Path(item[column])
+            item[column] = str(path if path.is_absolute() else (manifest_path.parent / path).resolve())
+        items.append(item)
+
+    return items
+
+
+def load_completed_ids(results_path: Path) -> Set[str]:
+    """
+    Ids of items that already succeeded in a previous run.
+    """
+    completed = set()
+    if not results_path.exists():
+        return completed
+
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from an interrupted run
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+# === EXECUTION ===
+async def run_item(item: Dict, output_dir: Path) -> Dict:
+    """
+    Run one manifest item through its tool and build its result record.
+    """
+    tool_context = LocalToolContext(output_dir, request_id=str(item["id"]), priority="batch")
+    start = time.perf_counter()
+
+    for deferrals in range(MAX_DEFERRALS + 1):
+        try:
+            if item["task"] == "placement":
+                result = await remove_and_place_object(tool_context, RemoveAndPlaceObjectInput(
+                    room_image_filename=item["base_image"],
+                    furniture_image_filename=item["product_image"],
+                    mask_coordinates=item.get("mask_coordinates") or "{}",
+                    removal_prompt=item.get("removal_prompt") or "",
+                    placement_description=item.get("placement_description") or "",
+                    asset_name=item["id"]
+                ))
+            else:
+                result = await virtual_tryon(tool_context, VirtualTryOnInput(
+                    person_image_filename=item["base_image"],
+                    clothing_image_filename=item["product_image"],
+                    clothing_type=item.get("clothing_type") or "shirt",
+                    asset_name=item["id"]
+                ))
+            break
+        except AdmissionRejected as e:
+            result = f"❌ Error: {str(e)}"
+            if deferrals == MAX_DEFERRALS:
+                break
+            print(f"⏸️ {item['id']} deferred {e.retry_after_seconds:.0f}s (server busy)")
+            await asyncio.sleep(e.retry_after_seconds)
+
+    # Only record "ok" once the output is on disk (ARTIFACT_DURABILITY=memory spills in the background)
+    spill_failures = await tool_context.wait_for_spills()
+    latency_ms = (time.perf_counter() - start) * 1000
+    artifact = getattr(result, "artifact", None)
+    ok = artifact is not None and not spill_failures
+
+    return {
+        "id": item["id"],
+        "task": item["task"],
+        "status": "ok" if ok else "error",
+        "output": str(artifact.path) if ok else None,
+        "message": result,
+        "latency_ms": round(latency_ms, 1),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+async def run_batch(items: List[Dict], output_dir: Path, concurrency: int) -> Dict:
+    """
+    Run all items with at most `concurrency` in flight, appending one JSONL record per item.
+    Returns a summary of the run.
+    """
+    output_dir.mkdir(exist_ok=True, parents=True)
+    results_path = output_dir / "results.jsonl"
+
+    completed = load_completed_ids(results_path)
+    pending = [item for item in items if item["id"] not in completed]
+    print(f"📋 {len(items)} item(s) in manifest, {len(completed & {i['id'] for i in items})} already done, {len(pending)} to run")
+    print(f"⚙️ Concurrency: {concurrency}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = {"ok": 0, "error": 0, "latencies": []}
+    batch_start = time.perf_counter()
+
+    with open(results_path, "a", encoding="utf-8") as results_file:
+
+        async def worker(item: Dict):
+            async with semaphore:
+                try:
+                    record = await run_item(item, output_dir)
+                except Exception as e:
+                    record = {
+                        "id": item["id"],
+                        "task": item["task"],
+                        "status": "error",
+                        "output": None,
+                        "message": f"❌ Error: {str(e)}",
+                        "latency_ms": None,
+                        "finished_at": datetime.now().isoformat(timespec="seconds"),
+                    }
+
+            # Flush every record so a crash loses at most the items in flight
+            results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            results_file.flush()
+
+            summary[record["status"]] += 1
+            if record["latency_ms"] is not None:
+                summary["latencies"].append(record["latency_ms"])
+            done = summary["ok"] + summary["error"]
+            icon = "✅" if record["status"] == "ok" else "❌"
+            print(f"{icon} [{done}/{len(pending)}] {record['id']} ({record['latency_ms']} ms)")
+
+        await asyncio.gather(*(worker(item) for item in pending))
+
+    summary["elapsed_s"] = round(time.perf_counter() - batch_start, 1)
+    summary["results_path"] = str(results_path)
+    return summary
+
+
+def print_summary(summary: Dict):
+    """
+    Print run summary with latency percentiles.
+    """
+    latencies = sorted(summary["latencies"])
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+
+    print("\n" + "="*80)
+    print("📊 BATCH RUN SUMMARY")
+    print("="*80)
+    print(f"Succeeded: {summary['ok']}")
+    print(f"Failed: {summary['error']}")
+    print(f"Elapsed: {summary['elapsed_s']} s")
+    if latencies:
+        print(f"Latency p50/p95/p99: {percentile(50):.0f} / {percentile(95):.0f} / {percentile(99):.0f} ms")
+    print(f"Results: {summary['results_path']}")
+    print("="*80 + "\n")
+
+
+# === CLI ===
+def main():
+    parser = argparse.ArgumentParser(description="Batch furniture placement / virtual try-on runner")
+    parser.add_argument("manifest", help="CSV or JSONL manifest")
+    parser.add_argument("--output-dir", default="batch_output", help="Directory for images and results.jsonl")
+    parser.add_argument("--concurrency", type=int, help="Max items in flight (default: keys x --per-key)")
+    parser.add_argument("--per-key", type=int, default=2, help="In-flight items per configured API key")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    manifest_path = Path(args.manifest)
+    items = load_manifest(manifest_path)
+
+    manager = get_api_key_manager()
+    concurrency = args.concurrency or max(1, len(manager.api_keys) * args.per_key)
+    start_metrics_exporter()
+
+    summary = asyncio.run(run_batch(items, Path(args.output_dir), concurrency))
+    print_summary(summary)
+    manager.print_statistics()
+
+    metrics_path = Path(args.output_dir) / "metrics.prom"
+    REGISTRY.write_textfile(metrics_path)
+    print(f"📈 Metrics: {metrics_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,745 @@
+# benchmark.py - Performance benchmarks for the VisualAgent pipeline
+#
+# Usage:
+#   python benchmark.py preprocess                      # synthetic phone-photo sample set
+#   python benchmark.py preprocess room.jpg sofa.png    # your own images
+#   python benchmark.py preprocess --tool virtual_tryon --bandwidth-mbps 5 --output preprocess.json
+#   python benchmark.py keys                            # key selection: sticky vs adaptive
+#   python benchmark.py keys --requests 800 --concurrency 32 --output keys.json
+#   python benchmark.py keys --max-per-key 4            # with per-key in-flight limits (lease)
+#   python benchmark.py load                            # tools + key manager on the fake backend
+#   python benchmark.py load --concurrency 1,8,32 --distribution lognormal --rate-limit-rate 0.05 --output load.json
+#   python benchmark.py load --baseline load.json       # compare p95 / throughput with a previous run
+#   python benchmark.py memory                          # peak Python memory per request: copy vs mmap vs in-memory inputs
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from google.genai import types
+from PIL import Image
+
+from api_key_manager import GoogleAPIKeyManager, init_api_key_manager, reset_api_key_manager
+from fake_gemini import LATENCY_DISTRIBUTIONS, FakeBackendConfig, FakeGeminiClient, make_fake_client_factory
+from image_preprocessing import as_bytes, get_preprocess_config, normalize_image_bytes
+from result_cache import reset_result_cache
+from tool_context import LocalToolContext
+from tools import RemoveAndPlaceObjectInput, VirtualTryOnInput, remove_and_place_object, virtual_tryon
+
+
+# === SAMPLE DATA ===
+def make_sample_images(seed: int = 0) -> List[Tuple[str, bytes]]:
+    """
+    Build a synthetic sample set resembling real uploads:
+    large phone photos (with EXIF orientation) and a transparent product PNG.
+    """
+    rng = random.Random(seed)
+    samples = []
+
+    for idx, size in enumerate([(4032, 3024), (3024, 4032), (4000, 3000)]):
+        # Gradient + sensor-like noise so the JPEG size is realistic
+        base = Image.linear_gradient("L").resize(size).convert("RGB")
+        noise = Image.effect_noise(size, rng.randint(20, 40)).convert("RGB")
+        img = Image.blend(base, noise, 0.35)
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW
+        exif[0x010F] = "BenchmarkPhone"  # Make
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=95, exif=exif)
+        samples.append((f"phone_photo_{idx + 1}.jpg", buffer.getvalue()))
+
+    product = Image.new("RGBA", (2000, 2000), (0, 0, 0, 0))
+    product.paste(Image.effect_noise((1200, 1200), 30).convert("RGBA"), (400, 400))
+    buffer = BytesIO()
+    product.save(buffer, format="PNG")
+    samples.append(("product_cutout.png", buffer.getvalue()))
+
+    return samples
+
+
+def load_images(paths: List[str]) -> List[Tuple[str, bytes]]:
+    """
+    Read image files given on the command line.
+    """
+    return [(Path(p).name, Path(p).read_bytes()) for p in paths]
+
+
+# === PREPROCESSING BENCHMARK ===
+def run_preprocess_benchmark(
+    images: List[Tuple[str, bytes]],
+    tool_name: str,
+    bandwidth_mbps: float,
+    uploads_per_image: int
+) -> Dict:
+    """
+    Compare bytes sent and estimated end-to-end time with and without normalization.
+
+    End-to-end time covers the client side of a request: normalization time plus the
+    time to upload the image `uploads_per_image` times at `bandwidth_mbps`
+    (furniture replacement uploads the room image twice: removal + placement).
+    """
+    config = get_preprocess_config(tool_name)
+    bytes_per_second = bandwidth_mbps * 1_000_000 / 8
+    rows = []
+
+    for name, data in images:
+        start = time.perf_counter()
+        normalized, mime_type = normalize_image_bytes(data, config)
+        preprocess_s = time.perf_counter() - start
+
+        bytes_before = len(data) * uploads_per_image
+        bytes_after = len(normalized) * uploads_per_image
+        time_before = bytes_before / bytes_per_second
+        time_after = preprocess_s + bytes_after / bytes_per_second
+
+        rows.append({
+            "image": name,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "preprocess_ms": round(preprocess_s * 1000, 1),
+            "e2e_ms_before": round(time_before * 1000, 1),
+            "e2e_ms_after": round(time_after * 1000, 1),
+            "mime_type": mime_type,
+        })
+
+    total_before = sum(r["bytes_before"] for r in rows)
+    total_after = sum(r["bytes_after"] for r in rows)
+    return {
+        "benchmark": "preprocess",
+        "tool": tool_name,
+        "config": config.model_dump(),
+        "bandwidth_mbps": bandwidth_mbps,
+        "uploads_per_image": uploads_per_image,
+        "images": rows,
+        "summary": {
+            "bytes_before": total_before,
+            "bytes_after": total_after,
+            "bytes_reduction": f"{(1 - total_after / total_before) * 100:.1f}%" if total_before else "N/A",
+            "e2e_ms_before": round(sum(r["e2e_ms_before"] for r in rows), 1),
+            "e2e_ms_after": round(sum(r["e2e_ms_after"] for r in rows), 1),
+            "preprocess_ms_median": statistics.median(r["preprocess_ms"] for r in rows) if rows else 0,
+        },
+    }
+
+
+def print_preprocess_report(result: Dict):
+    """
+    Print a before/after table for the preprocessing benchmark.
+    """
+    print("\n" + "="*80)
+    print(f"🖼️ PREPROCESS BENCHMARK - {result['tool']} @ {result['bandwidth_mbps']} Mbps")
+    print("="*80)
+    print(f"{'Image':<24}{'KB before':>12}{'KB after':>12}{'prep ms':>10}{'e2e ms before':>15}{'e2e ms after':>14}")
+    print("-"*80)
+    for row in result["images"]:
+        print(
+            f"{row['image'][:23]:<24}{row['bytes_before'] / 1024:>12.1f}{row['bytes_after'] / 1024:>12.1f}"
+            f"{row['preprocess_ms']:>10.1f}{row['e2e_ms_before']:>15.1f}{row['e2e_ms_after']:>14.1f}"
+        )
+    summary = result["summary"]
+    print("-"*80)
+    print(f"Bytes sent: {summary['bytes_before'] / 1024:.1f} KB → {summary['bytes_after'] / 1024:.1f} KB ({summary['bytes_reduction']} less)")
+    print(f"End-to-end: {summary['e2e_ms_before']:.1f} ms → {summary['e2e_ms_after']:.1f} ms")
+    print("="*80 + "\n")
+
+
+# === KEY SELECTION SIMULATION ===
+# Stand-in keys (listed in rotation order). Latencies are in "model seconds" and
+# scaled by --time-scale when simulated; each key serves `slots` calls at once
+# and queues the rest, like a per-key throughput limit.
+SIMULATED_KEYS = {
+    "slow": {"latency": 12.0, "error_rate": 0.0, "slots": 4},
+    "flaky": {"latency": 4.0, "error_rate": 0.25, "slots": 4},
+    "fast-1": {"latency": 4.0, "error_rate": 0.0, "slots": 4},
+    "fast-2": {"latency": 4.0, "error_rate": 0.0, "slots": 4},
+}
+
+
+class SimulatedServiceError(Exception):
+    """
+    503 from a stand-in key (classified as a server error by the key manager).
+    """
+    code = 503
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def simulate_key_selection(
+    strategy: str,
+    requests: int,
+    concurrency: int,
+    time_scale: float,
+    seed: int,
+    max_per_key: int = 0
+) -> Dict:
+    """
+    Push `requests` calls through a fresh key manager using `strategy` and
+    measure end-to-end latency (including retries) per call.
+    max_per_key is the manager's per-key in-flight limit (0 = unlimited).
+    """
+    rng = random.Random(seed)
+    slots = {name: asyncio.Semaphore(profile["slots"]) for name, profile in SIMULATED_KEYS.items()}
+    calls_per_key = {name: 0 for name in SIMULATED_KEYS}
+
+    async def call_model(api_key: str):
+        profile = SIMULATED_KEYS[api_key]
+        calls_per_key[api_key] += 1
+        async with slots[api_key]:
+            latency = max(0.1, rng.gauss(profile["latency"], profile["latency"] * 0.2))
+            if rng.random() < profile["error_rate"]:
+                # Failures surface after a partial wait
+                await asyncio.sleep(latency * 0.5 * time_scale)
+                raise SimulatedServiceError("503 UNAVAILABLE (simulated)")
+            await asyncio.sleep(latency * time_scale)
+
+    manager = GoogleAPIKeyManager(
+        api_keys=list(SIMULATED_KEYS),
+        client_factory=lambda key: None,
+        backoff_base_seconds=0.5 * time_scale,
+        backoff_max_seconds=8.0 * time_scale,
+        requests_per_minute=0,
+        images_per_day=0,
+        selection_strategy=strategy,
+        max_concurrent_per_key=max_per_key
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one_request():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await manager.execute_with_retry(call_model)
+            except Exception:
+                failures += 1
+                return
+            latencies.append((time.perf_counter() - start) / time_scale)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    wall_s = (time.perf_counter() - start) / time_scale
+
+    return {
+        "strategy": strategy,
+        "requests": requests,
+        "failed": failures,
+        "throughput_per_min": round((requests - failures) / wall_s * 60, 1) if wall_s else 0,
+        "p50_s": round(percentile(latencies, 50), 2),
+        "p95_s": round(percentile(latencies, 95), 2),
+        "p99_s": round(percentile(latencies, 99), 2),
+        "calls_per_key": calls_per_key,
+    }
+
+
+def run_key_selection_benchmark(
+    requests: int,
+    concurrency: int,
+    time_scale: float,
+    seed: int,
+    max_per_key: int = 0
+) -> Dict:
+    """
+    Compare the sticky (stay on the current key until it fails) and adaptive strategies
+    on the same simulated key pool.
+    """
+    # The manager logs every key failure - keep the report readable
+    logging.getLogger("api_key_manager").setLevel(logging.ERROR)
+
+    results = [
+        asyncio.run(simulate_key_selection(strategy, requests, concurrency, time_scale, seed, max_per_key))
+        for strategy in ("sticky", "adaptive")
+    ]
+    return {
+        "benchmark": "keys",
+        "keys": SIMULATED_KEYS,
+        "requests": requests,
+        "concurrency": concurrency,
+        "time_scale": time_scale,
+        "max_per_key": max_per_key,
+        "strategies": results,
+    }
+
+
+def print_key_selection_report(result: Dict):
+    """
+    Print a latency comparison table for the key selection simulation.
+    """
+    print("\n" + "="*80)
+    limit = result["max_per_key"] or "unlimited"
+    print(f"🔑 KEY SELECTION SIMULATION - {result['requests']} requests, concurrency {result['concurrency']}, {limit} in flight per key")
+    print("="*80)
+    print("Keys: " + ", ".join(
+        f"{name} ({p['latency']:.0f}s, {p['error_rate'] * 100:.0f}% errors)" for name, p in result["keys"].items()
+    ))
+    print("-"*80)
+    print(f"{'Strategy':<12}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'req/min':>10}{'failed':>8}   calls per key")
+    print("-"*80)
+    for row in result["strategies"]:
+        calls = " ".join(f"{name}={count}" for name, count in row["calls_per_key"].items())
+        print(
+            f"{row['strategy']:<12}{row['p50_s']:>9.2f}{row['p95_s']:>9.2f}{row['p99_s']:>9.2f}"
+            f"{row['throughput_per_min']:>10.1f}{row['failed']:>8}   {calls}"
+        )
+    print("="*80 + "\n")
+
+
+# === LOAD BENCHMARK (fake backend) ===
+LOAD_TARGETS = ("virtual_tryon", "remove_and_place_object", "key_manager")
+
+
+def make_load_images(work_dir: Path) -> Dict[str, str]:
+    """
+    Write the inputs used by the load benchmark: a 1600x1200 photo
+    (room / person) and a transparent 800x800 product PNG.
+    """
+    photo = Image.blend(
+        Image.linear_gradient("L").resize((1600, 1200)).convert("RGB"),
+        Image.effect_noise((1600, 1200), 30).convert("RGB"),
+        0.35
+    )
+    photo_path = work_dir / "photo.jpg"
+    photo.save(photo_path, format="JPEG", quality=90)
+
+    product = Image.new("RGBA", (800, 800), (0, 0, 0, 0))
+    product.paste(Image.effect_noise((500, 500), 30).convert("RGBA"), (150, 150))
+    product_path = work_dir / "product.png"
+    product.save(product_path, format="PNG")
+
+    return {"photo": str(photo_path), "product": str(product_path)}
+
+
+async def run_load_level(
+    target: str,
+    concurrency: int,
+    requests: int,
+    backend: FakeBackendConfig,
+    keys: int,
+    max_per_key: int,
+    images: Dict[str, str],
+    work_dir: Path
+) -> Dict:
+    """
+    Push `requests` calls through `target` with `concurrency` in flight against a
+    fresh key manager on the fake backend, and measure per-call latency.
+    """
+    clients: List[FakeGeminiClient] = []
+    manager = init_api_key_manager(
+        api_keys=[f"bench-key-{i + 1}" for i in range(keys)],
+        client_factory=make_fake_client_factory(config=backend, clients=clients),
+        requests_per_minute=0,
+        images_per_day=0,
+        max_concurrent_per_key=max_per_key,
+        # Injected 429s should not bench a key for the rest of the run
+        cooldown_minutes=max(backend.latency_seconds, 0.5) / 60,
+        backoff_base_seconds=0.05,
+        backoff_max_seconds=0.5
+    )
+    output_dir = work_dir / f"{target}_c{concurrency}"
+
+    async def call_model(api_key: str):
+        _, client = await manager.get_client_async(api_key)
+        stream = await client.aio.models.generate_content_stream(
+            model="fake", contents=[types.Content(role="user", parts=[types.Part(text="benchmark")])]
+        )
+        async for _ in stream:
+            pass
+
+    async def one_call(index: int) -> bool:
+        if target == "key_manager":
+            await manager.execute_with_retry(call_model)
+            return True
+        tool_context = LocalToolContext(output_dir, request_id=f"bench-{target}-{concurrency}-{index}")
+        if target == "virtual_tryon":
+            result = await virtual_tryon(tool_context, VirtualTryOnInput(
+                person_image_filename=images["photo"],
+                clothing_image_filename=images["product"],
+                clothing_type="shirt",
+                asset_name=f"bench_{index}"
+            ))
+        else:
+            result = await remove_and_place_object(tool_context, RemoveAndPlaceObjectInput(
+                room_image_filename=images["photo"],
+                furniture_image_filename=images["product"],
+                removal_prompt="Remove the old sofa",
+                placement_description="against the back wall",
+                asset_name=f"bench_{index}"
+            ))
+        return result.startswith("✅")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one_request(index: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await one_call(index)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(requests)))
+    wall_s = time.perf_counter() - start
+
+    injected = {}
+    for client in clients:
+        for code, count in client.aio.models.errors.items():
+            injected[str(code)] = injected.get(str(code), 0) + count
+
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": requests,
+        "failed": failures,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round((requests - failures) / wall_s, 2) if wall_s else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "model_calls": sum(client.aio.models.calls for client in clients),
+        "injected_errors": injected,
+    }
+
+
+def run_load_benchmark(
+    targets: List[str],
+    concurrency_levels: List[int],
+    requests_per_level: int,
+    backend: FakeBackendConfig,
+    keys: int,
+    max_per_key: int
+) -> Dict:
+    """
+    Throughput and p50/p95/p99 for each target at each concurrency level,
+    all against the fake backend (no network or quota).
+    """
+    unknown = set(targets) - set(LOAD_TARGETS)
+    if unknown:
+        raise ValueError(f"Unknown targets: {sorted(unknown)} (expected some of {LOAD_TARGETS})")
+
+    # Every request must reach the backend, and failures are counted, not logged
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    reset_result_cache()
+    for name in ("api_key_manager", "tools"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+    async def run_all() -> List[Dict]:
+        rows = []
+        with tempfile.TemporaryDirectory(prefix="visual_bench_") as work_dir:
+            images = make_load_images(Path(work_dir))
+            for target in targets:
+                for concurrency in concurrency_levels:
+                    requests = max(requests_per_level, concurrency)
+                    rows.append(await run_load_level(
+                        target, concurrency, requests, backend, keys, max_per_key, images, Path(work_dir)
+                    ))
+        return rows
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        reset_api_key_manager()
+
+    return {
+        "benchmark": "load",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": backend.model_dump(),
+        "keys": keys,
+        "max_per_key": max_per_key,
+        "requests_per_level": requests_per_level,
+        "results": results,
+    }
+
+
+def compare_load_results(result: Dict, baseline: Dict) -> List[Dict]:
+    """
+    Per (target, concurrency) change in p95 latency and throughput versus a previous run.
+    """
+    previous = {(row["target"], row["concurrency"]): row for row in baseline.get("results", [])}
+    changes = []
+    for row in result["results"]:
+        before = previous.get((row["target"], row["concurrency"]))
+        if before is None:
+            continue
+        changes.append({
+            "target": row["target"],
+            "concurrency": row["concurrency"],
+            "p95_change": (row["p95_ms"] / before["p95_ms"] - 1) if before["p95_ms"] else None,
+            "throughput_change": (row["throughput_rps"] / before["throughput_rps"] - 1) if before["throughput_rps"] else None,
+        })
+    return changes
+
+
+def print_load_report(result: Dict):
+    """
+    Print the load benchmark table (and the comparison with a baseline run, if any).
+    """
+    backend = result["backend"]
+    print("\n" + "="*80)
+    print(
+        f"🏋️ LOAD BENCHMARK - fake backend {backend['distribution']} {backend['latency_seconds']}s ± {backend['jitter_seconds']}s, "
+        f"{backend['rate_limit_rate']:.0%} 429s, {backend['server_error_rate']:.0%} 5xx, {result['keys']} keys"
+    )
+    print("="*80)
+    print(f"{'Target':<26}{'conc':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'failed':>8}{'calls':>7}")
+    print("-"*80)
+    for row in result["results"]:
+        print(
+            f"{row['target']:<26}{row['concurrency']:>6}{row['throughput_rps']:>9.2f}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['failed']:>8}{row['model_calls']:>7}"
+        )
+
+    if result.get("comparison"):
+        print("-"*80)
+        print(f"vs baseline {result['baseline']}:")
+        for change in result["comparison"]:
+            p95 = f"{change['p95_change']:+.1%}" if change["p95_change"] is not None else "N/A"
+            throughput = f"{change['throughput_change']:+.1%}" if change["throughput_change"] is not None else "N/A"
+            print(f"  {change['target']:<26} c={change['concurrency']:<5} p95 {p95:>8}   req/s {throughput:>8}")
+    print("="*80 + "\n")
+
+
+# === MEMORY BENCHMARK (fake backend) ===
+INPUT_MODES = ("copy", "mmap", "in_memory")
+
+
+class CopyingToolContext(LocalToolContext):
+    """
+    Input handling before zero-copy loading: every input file is read into a new bytes object.
+    """
+
+    @contextmanager
+    def open_artifact(self, filename: str):
+        with super().open_artifact(filename) as (buffer, mime_type):
+            yield as_bytes(buffer), mime_type
+
+
+async def measure_request_memory(mode: str, uploads: List[Tuple[str, bytes]], work_dir: Path, index: int) -> Dict:
+    """
+    Peak traced Python memory of one virtual_tryon request whose two inputs arrive as upload bytes:
+      copy       written to temp files and read back into bytes (previous app / HTTP API behaviour)
+      mmap       written to temp files and memory-mapped (files already on disk, e.g. batch runs)
+      in_memory  handed to the context without touching disk
+    Mapped file pages live in the OS page cache and are not counted by tracemalloc.
+    """
+    output_dir = work_dir / "output"
+    request_dir = work_dir / f"{mode}_{index}"
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    if mode == "in_memory":
+        in_memory = {f"upload_{i}_{name}": data for i, (name, data) in enumerate(uploads)}
+        filenames = list(in_memory)
+        tool_context = LocalToolContext(output_dir, request_id=f"bench-memory-{mode}-{index}", uploads=in_memory)
+    else:
+        request_dir.mkdir()
+        filenames = []
+        for name, data in uploads:
+            (request_dir / name).write_bytes(data)
+            filenames.append(str(request_dir / name))
+        context_class = CopyingToolContext if mode == "copy" else LocalToolContext
+        tool_context = context_class(output_dir, request_id=f"bench-memory-{mode}-{index}")
+
+    result = await virtual_tryon(tool_context, VirtualTryOnInput(
+        person_image_filename=filenames[0],
+        clothing_image_filename=filenames[1],
+        clothing_type="shirt",
+        asset_name=f"bench_{mode}"
+    ))
+    _, peak = tracemalloc.get_traced_memory()
+    return {"ok": result.startswith("✅"), "peak_bytes": peak - baseline}
+
+
+def run_memory_benchmark(uploads: List[Tuple[str, bytes]], requests: int) -> Dict:
+    """
+    Peak traced memory per request for each input mode, all against the fake backend.
+    """
+    if len(uploads) != 2:
+        raise ValueError("The memory benchmark needs exactly 2 images (person, clothing)")
+
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    reset_result_cache()
+    for name in ("api_key_manager", "tools"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+    init_api_key_manager(
+        api_keys=["bench-key-1"],
+        client_factory=make_fake_client_factory(config=FakeBackendConfig(latency_seconds=0.0, seed=0)),
+        requests_per_minute=0,
+        images_per_day=0
+    )
+
+    async def run_all() -> Dict[str, List[Dict]]:
+        samples = {mode: [] for mode in INPUT_MODES}
+        with tempfile.TemporaryDirectory(prefix="visual_bench_") as work_dir:
+            await measure_request_memory("in_memory", uploads, Path(work_dir), -1)  # Warm-up (imports, caches)
+            for index in range(requests):
+                for mode in INPUT_MODES:  # Interleaved so drift affects every mode alike
+                    samples[mode].append(await measure_request_memory(mode, uploads, Path(work_dir), index))
+        return samples
+
+    tracemalloc.start()
+    try:
+        samples = asyncio.run(run_all())
+    finally:
+        tracemalloc.stop()
+        reset_api_key_manager()
+
+    results = []
+    for mode in INPUT_MODES:
+        peaks = [s["peak_bytes"] for s in samples[mode]]
+        results.append({
+            "mode": mode,
+            "requests": requests,
+            "failed": sum(1 for s in samples[mode] if not s["ok"]),
+            "peak_kb_median": round(statistics.median(peaks) / 1024, 1),
+            "peak_kb_max": round(max(peaks) / 1024, 1),
+        })
+
+    return {
+        "benchmark": "memory",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "inputs": [{"image": name, "bytes": len(data)} for name, data in uploads],
+        "results": results,
+    }
+
+
+def print_memory_report(result: Dict):
+    """
+    Print peak memory per request for each input mode, relative to the copying path.
+    """
+    input_kb = sum(i["bytes"] for i in result["inputs"]) / 1024
+    print("\n" + "="*80)
+    print(f"🧠 MEMORY BENCHMARK - virtual_tryon, {input_kb:.1f} KB of input images per request (tracemalloc peak)")
+    print("="*80)
+    print(f"{'Input mode':<14}{'peak KB median':>16}{'peak KB max':>14}{'vs copy':>10}{'failed':>8}")
+    print("-"*80)
+    copy_peak = next(row["peak_kb_median"] for row in result["results"] if row["mode"] == "copy")
+    for row in result["results"]:
+        change = f"{row['peak_kb_median'] / copy_peak - 1:+.1%}" if copy_peak else "N/A"
+        print(
+            f"{row['mode']:<14}{row['peak_kb_median']:>16.1f}{row['peak_kb_max']:>14.1f}"
+            f"{change:>10}{row['failed']:>8}"
+        )
+    print("="*80 + "\n")
+
+
+# === CLI ===
+def main():
+    parser = argparse.ArgumentParser(description="VisualAgent performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess = subparsers.add_parser("preprocess", help="Bytes sent / time before vs after image normalization")
+    preprocess.add_argument("images", nargs="*", help="Image files (default: synthetic sample set)")
+    preprocess.add_argument("--tool", default="remove_and_place_object", help="Tool whose preprocessing settings to use")
+    preprocess.add_argument("--bandwidth-mbps", type=float, default=10.0, help="Assumed upload bandwidth")
+    preprocess.add_argument("--uploads", type=int, default=2, help="Times each image is uploaded per request")
+    preprocess.add_argument("--output", help="Write results as JSON to this file")
+
+    keys = subparsers.add_parser("keys", help="Simulated p50/p95/p99 for sticky vs adaptive key selection")
+    keys.add_argument("--requests", type=int, default=400, help="Total simulated requests per strategy")
+    keys.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    keys.add_argument("--time-scale", type=float, default=0.01, help="Wall seconds per simulated model second")
+    keys.add_argument("--max-per-key", type=int, default=0, help="Key manager in-flight limit per key (0 = unlimited)")
+    keys.add_argument("--seed", type=int, default=0)
+    keys.add_argument("--output", help="Write results as JSON to this file")
+
+    load = subparsers.add_parser("load", help="Throughput and p50/p95/p99 of the tools and key manager on the fake backend")
+    load.add_argument("--targets", default=",".join(LOAD_TARGETS), help="Comma-separated: " + ", ".join(LOAD_TARGETS))
+    load.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    load.add_argument("--requests", type=int, default=32, help="Requests per level (at least the concurrency)")
+    load.add_argument("--keys", type=int, default=4, help="Number of stand-in API keys")
+    load.add_argument("--max-per-key", type=int, default=4, help="Key manager in-flight limit per key (0 = unlimited)")
+    load.add_argument("--latency", type=float, default=0.25, help="Mean fake model latency (seconds)")
+    load.add_argument("--jitter", type=float, default=0.05, help="Fake latency standard deviation (seconds)")
+    load.add_argument("--distribution", default="normal", choices=LATENCY_DISTRIBUTIONS)
+    load.add_argument("--chunks", type=int, default=1, help="Stream chunks per fake response")
+    load.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of fake calls rejected with 429")
+    load.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction of fake calls failing with 503")
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--baseline", help="Previous --output JSON to compare against")
+    load.add_argument("--output", help="Write results as JSON to this file")
+
+    memory = subparsers.add_parser("memory", help="Peak memory per request: copied vs memory-mapped vs in-memory inputs")
+    memory.add_argument("images", nargs="*", help="Person and clothing image (default: synthetic phone photo + product PNG)")
+    memory.add_argument("--requests", type=int, default=5, help="Requests per input mode")
+    memory.add_argument("--output", help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    if args.command == "preprocess":
+        images = load_images(args.images) if args.images else make_sample_images()
+        result = run_preprocess_benchmark(images, args.tool, args.bandwidth_mbps, args.uploads)
+        print_preprocess_report(result)
+    elif args.command == "keys":
+        result = run_key_selection_benchmark(
+            args.requests, args.concurrency, args.time_scale, args.seed, args.max_per_key
+        )
+        print_key_selection_report(result)
+    elif args.command == "load":
+        backend = FakeBackendConfig(
+            latency_seconds=args.latency,
+            jitter_seconds=args.jitter,
+            distribution=args.distribution,
+            chunks=args.chunks,
+            rate_limit_rate=args.rate_limit_rate,
+            server_error_rate=args.server_error_rate,
+            seed=args.seed
+        )
+        result = run_load_benchmark(
+            [t.strip() for t in args.targets.split(",") if t.strip()],
+            [int(c) for c in args.concurrency.split(",") if c.strip()],
+            args.requests, backend, args.keys, args.max_per_key
+        )
+        if args.baseline:
+            result["baseline"] = args.baseline
+            result["comparison"] = compare_load_results(result, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+        print_load_report(result)
+    elif args.command == "memory":
+        if args.images:
+            images = load_images(args.images)
+        else:
+            samples = make_sample_images()
+            images = [samples[0], samples[-1]]
+        result = run_memory_benchmark(images, args.requests)
+        print_memory_report(result)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
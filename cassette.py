@@ -0,0 +1,339 @@
+# cassette.py - Record / replay of Gemini model calls for offline profiling
+#
+# Enable with:
+#   CASSETTE_MODE=record        save every model call (request fingerprint + streamed
+#                               chunks with their timing) to CASSETTE_DIR
+#   CASSETTE_MODE=replay        serve recorded calls back instead of calling the model
+#   CASSETTE_DIR=cassettes      where cassettes are stored (default: cassettes)
+#   CASSETTE_TIME_SCALE=1.0     replay timing multiplier (1 = original, 0.5 = twice as fast, 0 = no delays)
+#   CASSETTE_MATCH=exact        replay only identical requests; "any" replays any recording
+#                               (in recorded order) when a request was never recorded
+#
+# One file per request fingerprint (<fingerprint>.jsonl), one recorded call per line.
+# Repeated requests replay their recordings in turn, so latency variation is kept.
+# Disable the result cache (RESULT_CACHE_ENABLED=false) so every call reaches the cassette.
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import itertools
+from pathlib import Path
+from threading import Lock
+from typing import AsyncIterator, Dict, List, Optional
+
+from google.genai import errors, types
+
+try:
+    from .result_cache import make_cache_key
+except ImportError:
+    from result_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("off", "record", "replay")
+MATCH_MODES = ("exact", "any")
+
+
+class CassetteMissError(LookupError):
+    """
+    Replay mode got a request that has no recording.
+    """
+    code = 404  # Classified as fatal by the key manager (not retried on other keys)
+
+
+def describe_request(contents: List[types.Content], config: Optional[types.GenerateContentConfig], model: str) -> Dict:
+    """
+    Fingerprint of a model request: prompt hash, input image hashes and sizes, and config.
+    """
+    prompt = hashlib.sha256()
+    images = []
+    for content in contents:
+        for part in content.parts or []:
+            if part.text is not None:
+                prompt.update(part.text.encode('utf-8') + b"\0")
+            elif part.inline_data is not None:
+                data = part.inline_data.data or b''
+                images.append({
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                    "mime_type": part.inline_data.mime_type,
+                    "bytes": len(data),
+                })
+
+    config = config or types.GenerateContentConfig()
+    return {
+        "fingerprint": make_cache_key(contents, config, model, namespace="cassette"),
+        "model": model,
+        "prompt_sha256": prompt.hexdigest(),
+        "images": images,
+        "config": config.model_dump(mode="json", exclude_none=True),
+    }
+
+
+def _describe_error(error: Exception, start: float) -> Dict:
+    return {
+        "offset_ms": round((time.perf_counter() - start) * 1000, 1),
+        "code": getattr(error, "code", None) if isinstance(error, errors.APIError) else None,
+        "status": getattr(error, "status", None),
+        "message": getattr(error, "message", None) or str(error),
+        "type": type(error).__name__,
+    }
+
+
+def _rebuild_error(recorded: Dict) -> Exception:
+    """
+    Turn a recorded error back into the google.genai error the client raised
+    (errors without a status, e.g. dropped connections, become ConnectionError).
+    """
+    code = recorded.get("code")
+    if code is None:
+        return ConnectionError(f"{recorded.get('type')}: {recorded.get('message')} (replayed)")
+    response = {"error": {"code": code, "status": recorded.get("status"), "message": recorded.get("message")}}
+    if 400 <= code < 500:
+        return errors.ClientError(code, response)
+    if code >= 500:
+        return errors.ServerError(code, response)
+    return errors.APIError(code, response)
+
+
+class CassetteStore:
+    """
+    Local store of recorded model calls.
+
+    Features:
+    - Records request fingerprints, streamed chunks with their offsets from the
+      start of the call, and API errors (so failure shapes replay too)
+    - Replays with the original or scaled timing
+    - Append-only files, written one line per call (thread-safe)
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        mode: str = "replay",
+        time_scale: float = 1.0,
+        match: str = "exact"
+    ):
+        """
+        Initialize cassette store.
+
+        Args:
+            directory: Folder holding the cassette files
+            mode: "record" or "replay"
+            time_scale: Multiplier for replayed delays (0 = serve immediately)
+            match: "exact" (fingerprint must match) or "any" (fall back to any recording)
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode} (expected record or replay)")
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown cassette match: {match} (expected one of {MATCH_MODES})")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.mode = mode
+        self.time_scale = time_scale
+        self.match = match
+
+        self.recordings: Dict[str, List[Dict]] = {}  # fingerprint -> recorded calls (replay)
+        self.positions: Dict[str, int] = {}  # fingerprint -> next recording to serve
+        self._any_order: Optional[itertools.cycle] = None
+        if mode == "replay":
+            self._load()
+
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        self.lock = Lock()
+        logger.info(f"📼 Cassette {mode}: {self.directory} (time scale {time_scale}, match {match})")
+
+    def _load(self):
+        """
+        Read every recording in the cassette folder.
+        """
+        for path in sorted(self.directory.glob("*.jsonl")):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        call = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partial line from an interrupted recording
+                    self.recordings.setdefault(call["request"]["fingerprint"], []).append(call)
+
+        every_call = sorted(
+            (call for calls in self.recordings.values() for call in calls),
+            key=lambda call: call.get("recorded_at", 0)
+        )
+        if every_call:
+            self._any_order = itertools.cycle(every_call)
+        logger.info(f"📼 Loaded {len(every_call)} recorded calls ({len(self.recordings)} distinct requests)")
+
+    # === RECORD ===
+    async def record(self, stream: AsyncIterator, request: Dict, start: float) -> AsyncIterator:
+        """
+        Pass a live response stream through, recording every chunk's offset from `start`
+        (perf_counter at the time the call was made). The call is written when the stream
+        ends, fails or is closed early.
+        """
+        chunks = []
+        error = None
+        cancelled = False
+        try:
+            async for chunk in stream:
+                chunks.append({
+                    "offset_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "response": chunk.model_dump(mode="json", exclude_none=True),
+                })
+                yield chunk
+        except asyncio.CancelledError:
+            cancelled = True  # Abandoned by the caller - not a response shape worth replaying
+            raise
+        except Exception as e:
+            error = _describe_error(e, start)
+            raise
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if not cancelled:
+                await asyncio.to_thread(self._append, request, chunks, error)
+
+    def record_error(self, request: Dict, error: Exception, start: float):
+        """
+        Record a call that was rejected before streaming (e.g. 429).
+        """
+        self._append(request, [], _describe_error(error, start))
+
+    def _append(self, request: Dict, chunks: List[Dict], error: Optional[Dict]):
+        line = json.dumps({
+            "request": request,
+            "recorded_at": time.time(),
+            "chunks": chunks,
+            "error": error,
+        }) + "\n"
+        path = self.directory / f"{request['fingerprint']}.jsonl"
+        with self.lock:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.stats['recorded'] += 1
+            except OSError as e:
+                logger.warning(f"⚠️ Could not record model call: {e}")
+
+    # === REPLAY ===
+    def _next_recording(self, request: Dict) -> Dict:
+        fingerprint = request["fingerprint"]
+        with self.lock:
+            calls = self.recordings.get(fingerprint)
+            if calls:
+                position = self.positions.get(fingerprint, 0)
+                self.positions[fingerprint] = position + 1
+                self.stats['replayed'] += 1
+                return calls[position % len(calls)]
+
+            self.stats['misses'] += 1
+            if self.match == "any" and self._any_order is not None:
+                self.stats['replayed'] += 1
+                return next(self._any_order)
+
+        raise CassetteMissError(
+            f"No recorded call for request {fingerprint[:12]} "
+            f"(prompt {request['prompt_sha256'][:12]}, {len(request['images'])} images) in {self.directory}"
+        )
+
+    async def replay(self, request: Dict) -> AsyncIterator[types.GenerateContentResponse]:
+        """
+        Serve a recorded call: yield its chunks (or raise its error) at their recorded
+        offsets times time_scale. Raises CassetteMissError if nothing matches.
+        """
+        recording = self._next_recording(request)
+        start = time.perf_counter()
+
+        async def wait_until(offset_ms: float):
+            delay = offset_ms / 1000 * self.time_scale - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        for chunk in recording["chunks"]:
+            await wait_until(chunk["offset_ms"])
+            yield types.GenerateContentResponse.model_validate(chunk["response"])
+
+        if recording.get("error"):
+            await wait_until(recording["error"]["offset_ms"])
+            raise _rebuild_error(recording["error"])
+
+    def get_statistics(self) -> Dict:
+        with self.lock:
+            return {
+                'mode': self.mode,
+                'directory': str(self.directory),
+                'loaded_requests': len(self.recordings),
+                **self.stats,
+            }
+
+
+async def open_model_stream(
+    client,
+    model: str,
+    contents: List[types.Content],
+    config: Optional[types.GenerateContentConfig] = None
+) -> AsyncIterator[types.GenerateContentResponse]:
+    """
+    client.aio.models.generate_content_stream(), recorded or replayed when a cassette
+    mode is active.
+    """
+    store = get_cassette_store()
+    if store is None:
+        return await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+
+    request = describe_request(contents, config, model)
+    if store.mode == "replay":
+        return store.replay(request)
+
+    start = time.perf_counter()
+    try:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+    except Exception as e:
+        await asyncio.to_thread(store.record_error, request, e, start)
+        raise
+    return store.record(stream, request, start)
+
+
+# Global cassette store (singleton pattern)
+_global_store: Optional[CassetteStore] = None
+_global_store_loaded = False
+
+
+def get_cassette_store() -> Optional[CassetteStore]:
+    """
+    Get the global cassette store, or None when CASSETTE_MODE is off.
+
+    Environment:
+        CASSETTE_MODE: off (default), record or replay
+        CASSETTE_DIR: cassette folder (default: cassettes)
+        CASSETTE_TIME_SCALE: replay timing multiplier (default: 1.0)
+        CASSETTE_MATCH: exact (default) or any
+    """
+    global _global_store, _global_store_loaded
+
+    if not _global_store_loaded:
+        mode = os.getenv('CASSETTE_MODE', 'off').strip().lower() or 'off'
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown CASSETTE_MODE: {mode} (expected one of {CASSETTE_MODES})")
+        if mode != 'off':
+            _global_store = CassetteStore(
+                directory=Path(os.getenv('CASSETTE_DIR', 'cassettes')),
+                mode=mode,
+                time_scale=float(os.getenv('CASSETTE_TIME_SCALE', '1.0')),
+                match=os.getenv('CASSETTE_MATCH', 'exact').strip().lower()
+            )
+        _global_store_loaded = True
+    return _global_store
+
+
+def reset_cassette_store():
+    """
+    Reset global cassette store (useful for testing or re-initialization).
+    """
+    global _global_store, _global_store_loaded
+    _global_store = None
+    _global_store_loaded = False
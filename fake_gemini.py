@@ -0,0 +1,225 @@
+# fake_gemini.py - Local stand-in for the Gemini image generation surface
+#
+# Mimics the part of genai.Client the tools use:
+#   client.aio.models.generate_content_stream(model=..., contents=..., config=...)
+# so the tools, HTTP API, batch runner and benchmarks can run without network or quota.
+#
+# Configurable per backend (FakeBackendConfig):
+# - latency distribution (fixed / normal / lognormal / exponential)
+# - number of stream chunks (text chunks first, the image in the last one)
+# - injected 429 (raised by the call) and 5xx (raised mid-stream) errors,
+#   using the same google.genai error types as the real client
+# Also fakes client.aio.caches.create() so prompt context caching can be exercised.
+
+import math
+import uuid
+import random
+import asyncio
+import logging
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from google.genai import errors, types
+from PIL import Image
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "normal", "lognormal", "exponential")
+
+_canned_png: Optional[bytes] = None
+
+
+def get_canned_image() -> bytes:
+    """
+    PNG returned by the fake backend (1024x1024 gradient, built once).
+    """
+    global _canned_png
+    if _canned_png is None:
+        img = Image.merge("RGB", [
+            Image.linear_gradient("L").resize((1024, 1024)),
+            Image.linear_gradient("L").rotate(90).resize((1024, 1024)),
+            Image.new("L", (1024, 1024), 128),
+        ])
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
+        _canned_png = buffer.getvalue()
+    return _canned_png
+
+
+class FakeBackendConfig(BaseModel):
+    """
+    Behaviour of the fake backend.
+    """
+    latency_seconds: float = Field(default=4.0, description="Mean time until the image chunk")
+    jitter_seconds: float = Field(default=1.0, description="Latency standard deviation (normal / lognormal)")
+    distribution: str = Field(default="normal", description="fixed, normal, lognormal or exponential")
+    chunks: int = Field(default=1, description="Stream chunks per response; the image is in the last one")
+    rate_limit_rate: float = Field(default=0.0, description="Fraction of calls rejected with 429 RESOURCE_EXHAUSTED")
+    server_error_rate: float = Field(default=0.0, description="Fraction of calls failing mid-stream with 503 UNAVAILABLE")
+    error_latency_seconds: float = Field(default=0.05, description="Time until a 429 is returned")
+    seed: Optional[int] = Field(default=None, description="Seed for reproducible latencies and errors")
+
+
+def sample_latency(config: FakeBackendConfig, rng: random.Random) -> float:
+    """
+    Draw one response latency (seconds) from the configured distribution.
+    """
+    mean = config.latency_seconds
+    if config.distribution == "fixed" or mean <= 0:
+        return max(0.0, mean)
+    if config.distribution == "normal":
+        return max(0.0, rng.gauss(mean, config.jitter_seconds))
+    if config.distribution == "lognormal":
+        # Parameters chosen so the samples keep the configured mean and standard deviation
+        sigma_sq = math.log(1 + (config.jitter_seconds / mean) ** 2)
+        return rng.lognormvariate(math.log(mean) - sigma_sq / 2, math.sqrt(sigma_sq))
+    if config.distribution == "exponential":
+        return rng.expovariate(1 / mean)
+    raise ValueError(f"Unknown latency distribution: {config.distribution} (expected one of {LATENCY_DISTRIBUTIONS})")
+
+
+def _error_response(code: int, status: str, message: str) -> Dict:
+    return {"error": {"code": code, "status": status, "message": f"{message} (simulated)"}}
+
+
+def _text_chunk(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)])
+    )])
+
+
+def _image_chunk() -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[
+            types.Part(inline_data=types.Blob(mime_type="image/png", data=get_canned_image()))
+        ])
+    )])
+
+
+class FakeCaches:
+    """
+    Stand-in for client.aio.caches (create only).
+    """
+
+    def __init__(self):
+        self.names: set = set()
+
+    async def create(self, model: str, config: Optional[types.CreateCachedContentConfig] = None) -> types.CachedContent:
+        text = "".join(p.text or "" for c in (config.contents or []) for p in (c.parts or [])) if config else ""
+        name = f"cachedContents/fake-{uuid.uuid4().hex[:12]}"
+        self.names.add(name)
+        return types.CachedContent(
+            name=name,
+            model=model,
+            usage_metadata=types.CachedContentUsageMetadata(total_token_count=max(1, len(text) // 4))
+        )
+
+
+class FakeModels:
+    """
+    Stand-in for client.aio.models.
+    """
+
+    def __init__(self, config: FakeBackendConfig, rng: random.Random, caches: Optional[FakeCaches] = None):
+        self.config = config
+        self.rng = rng
+        self.caches = caches or FakeCaches()
+        self.calls = 0
+        self.cached_calls = 0  # Calls that referenced a cached content
+        self.errors: Dict[int, int] = {}  # status code -> injected errors
+
+    async def generate_content_stream(
+        self,
+        model: str,
+        contents: List[types.Content],
+        config: Optional[types.GenerateContentConfig] = None
+    ):
+        """
+        Return an async stream that yields `chunks` chunks spread over a sampled latency,
+        the last one carrying the canned image - or fails with an injected error.
+        Like the real SDK, the request only goes out when the stream is first iterated,
+        so unknown cached content (404) and rate limits (429) raise from the first
+        iteration, not from this call.
+        """
+        self.calls += 1
+        missing_cache = config is not None and config.cached_content and config.cached_content not in self.caches.names
+        if config is not None and config.cached_content and not missing_cache:
+            self.cached_calls += 1
+        roll = self.rng.random()
+
+        rate_limited = not missing_cache and roll < self.config.rate_limit_rate
+        fail_mid_stream = not missing_cache and not rate_limited and (
+            roll < self.config.rate_limit_rate + self.config.server_error_rate
+        )
+        chunks = max(1, self.config.chunks)
+        chunk_delay = sample_latency(self.config, self.rng) / chunks
+
+        async def stream():
+            if missing_cache:
+                raise errors.ClientError(404, _error_response(404, "NOT_FOUND", "Cached content not found"))
+            if rate_limited:
+                self.errors[429] = self.errors.get(429, 0) + 1
+                await asyncio.sleep(self.config.error_latency_seconds)
+                raise errors.ClientError(429, _error_response(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted"))
+            if fail_mid_stream:
+                self.errors[503] = self.errors.get(503, 0) + 1
+
+            for index in range(chunks - 1):
+                await asyncio.sleep(chunk_delay)
+                yield _text_chunk(f"Generating image ({index + 1}/{chunks - 1})")
+                if fail_mid_stream:
+                    break
+            await asyncio.sleep(chunk_delay)
+            if fail_mid_stream:
+                raise errors.ServerError(503, _error_response(503, "UNAVAILABLE", "The model is overloaded"))
+            yield _image_chunk()
+
+        return stream()
+
+
+class FakeGeminiClient:
+    """
+    Stand-in for genai.Client (async surface only).
+    """
+
+    def __init__(self, api_key: str, config: Optional[FakeBackendConfig] = None):
+        self.api_key = api_key
+        self.config = config or FakeBackendConfig()
+        # Per-key generator: reproducible with a seed, but keys do not share one sequence
+        rng = random.Random(f"{self.config.seed}:{api_key}") if self.config.seed is not None else random.Random()
+        self.aio = type("FakeAsyncClient", (), {})()
+        self.aio.caches = FakeCaches()
+        self.aio.models = FakeModels(self.config, rng, self.aio.caches)
+
+
+def make_fake_client_factory(
+    latency_seconds: float = 4.0,
+    jitter_seconds: float = 1.0,
+    config: Optional[FakeBackendConfig] = None,
+    clients: Optional[List[FakeGeminiClient]] = None
+):
+    """
+    Client factory for GoogleAPIKeyManager(client_factory=...) that builds fake clients.
+
+    Args:
+        latency_seconds: Mean latency (used when no config is given)
+        jitter_seconds: Latency standard deviation (used when no config is given)
+        config: Full backend behaviour (distribution, chunking, error injection)
+        clients: Optional list that collects every client built, e.g. to read call/error counts
+    """
+    config = config or FakeBackendConfig(latency_seconds=latency_seconds, jitter_seconds=jitter_seconds)
+    if config.distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {config.distribution} (expected one of {LATENCY_DISTRIBUTIONS})")
+
+    def factory(api_key: str) -> FakeGeminiClient:
+        client = FakeGeminiClient(api_key, config)
+        if clients is not None:
+            clients.append(client)
+        return client
+
+    logger.info(
+        f"🧪 Using fake Gemini backend ({config.distribution} latency {config.latency_seconds}s ± {config.jitter_seconds}s, "
+        f"{config.chunks} chunks, {config.rate_limit_rate:.0%} 429s, {config.server_error_rate:.0%} 5xx)"
+    )
+    return factory
@@ -0,0 +1,240 @@
+# hedging.py - Hedged model calls to cut tail latency
+#
+# When a generation has not finished after a percentile of recent latency, a duplicate
+# call goes out on a different key. The first successful result wins and the other call
+# is cancelled. Hedges are capped by a per-minute budget so quota use stays bounded.
+#
+# Enable with:
+#   HEDGE_TOOLS=virtual_tryon           tools whose generations are hedged (comma-separated)
+#   HEDGE_PERCENTILE=95                 hedge after this percentile of recent latency
+#   HEDGE_MAX_PER_MINUTE=10             hedge budget
+#   HEDGE_MIN_SAMPLES=20                no hedging until this many latencies were seen
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from threading import Lock
+from typing import Collection, Deque, Dict, Optional
+
+try:
+    from .api_key_manager import GoogleAPIKeyManager, NoKeyCapacityError, TokenBucket
+    from .metrics import HEDGES
+except ImportError:
+    from api_key_manager import GoogleAPIKeyManager, NoKeyCapacityError, TokenBucket
+    from metrics import HEDGES
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: Collection[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class HedgePolicy:
+    """
+    Decides when to hedge a model call and races the primary against the hedge.
+
+    Features:
+    - Hedge delay = percentile of a sliding window of recent latencies, per operation
+      (e.g. "virtual_tryon" vs "remove_and_place_object.removal")
+    - Per-minute hedge budget (token bucket)
+    - Hedge runs on a key other than the primary's and never queues for one; no budget
+      is spent and nothing is counted as hedged unless such a key is free
+    - Thread-safe bookkeeping
+    """
+
+    def __init__(
+        self,
+        tools: Collection[str],
+        percentile: float = 95.0,
+        max_per_minute: float = 10,
+        min_samples: int = 20,
+        window: int = 200
+    ):
+        """
+        Initialize hedge policy.
+
+        Args:
+            tools: Tool names whose operations are hedged (an operation "tool.stage" belongs to "tool")
+            percentile: Hedge once a call runs longer than this percentile of recent latency
+            max_per_minute: Hedge budget (0 = no hedges)
+            min_samples: Latencies needed per operation before hedging starts
+            window: Recent latencies kept per operation
+        """
+        self.tools = set(tools)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = TokenBucket(max_per_minute, 60) if max_per_minute > 0 else None
+
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.stats = {'hedged': 0, 'hedge_won': 0, 'primary_won': 0, 'skipped_budget': 0, 'skipped_no_key': 0}
+        self.lock = Lock()
+
+        if self.tools:
+            logger.info(
+                f"🏇 Hedging {', '.join(sorted(self.tools))} after p{percentile:g} "
+                f"(budget {max_per_minute:g}/min)"
+            )
+
+    def applies_to(self, operation: Optional[str]) -> bool:
+        return operation is not None and operation.split(".")[0] in self.tools
+
+    def record_latency(self, operation: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(operation, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """
+        Seconds after which a call of `operation` is hedged (None while warming up).
+        """
+        with self.lock:
+            samples = self.latencies.get(operation)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return _percentile(samples, self.percentile)
+
+    def _take_hedge(self) -> bool:
+        with self.lock:
+            return self.budget is not None and self.budget.consume()
+
+    def _refund_hedge(self):
+        """
+        Give back the budget of a hedge that never got a key.
+        """
+        with self.lock:
+            if self.budget is not None:
+                self.budget.tokens = min(self.budget.capacity, self.budget.tokens + 1)
+
+    def _count(self, operation: str, outcome: str):
+        with self.lock:
+            self.stats[outcome] += 1
+        HEDGES.inc(operation=operation, outcome=outcome)
+
+    async def execute(self, manager: GoogleAPIKeyManager, operation: Optional[str], async_func, *args, **kwargs):
+        """
+        manager.execute_with_retry(async_func, ...) with hedging for operations of hedged tools.
+        """
+        if not self.applies_to(operation):
+            return await manager.execute_with_retry(async_func, *args, **kwargs)
+
+        primary_keys = []  # Key of the primary's current attempt (last entry)
+
+        async def primary_call(*call_args, api_key: str, **call_kwargs):
+            primary_keys.append(api_key)
+            return await async_func(*call_args, api_key=api_key, **call_kwargs)
+
+        hedge_keys = []
+
+        async def hedge_call(*call_args, api_key: str, **call_kwargs):
+            # Counted once the hedge actually holds a key
+            if not hedge_keys:
+                self._count(operation, 'hedged')
+                logger.debug(f"🏇 Hedged {operation} after {delay:.2f}s")
+            hedge_keys.append(api_key)
+            return await async_func(*call_args, api_key=api_key, **call_kwargs)
+
+        start = time.perf_counter()
+        delay = self.hedge_delay(operation)
+        primary = asyncio.ensure_future(manager.execute_with_retry(primary_call, *args, **kwargs))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            skipped = None
+            if not done:
+                # Never queue the hedge: it only helps if another key is free right now
+                if not await manager.has_free_key(exclude_keys=primary_keys[-1:]):
+                    skipped = 'skipped_no_key'
+                elif not self._take_hedge():
+                    skipped = 'skipped_budget'
+            if done or skipped:
+                if skipped:
+                    self._count(operation, skipped)
+                result = await primary
+                self.record_latency(operation, time.perf_counter() - start)
+                return result
+
+            hedge_start = time.perf_counter()
+            hedge = asyncio.ensure_future(manager.execute_with_retry(
+                hedge_call, *args, exclude_keys=primary_keys[-1:], max_wait_seconds=0, **kwargs
+            ))
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if hedge in done and not hedge_keys and isinstance(hedge.exception(), NoKeyCapacityError):
+                    # The free key was taken in the meantime - the hedge never ran
+                    self._refund_hedge()
+                    self._count(operation, 'skipped_no_key')
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is None:
+                    continue
+
+                now = time.perf_counter()
+                if winner is primary:
+                    self._count(operation, 'primary_won')
+                    self.record_latency(operation, now - start)
+                else:
+                    self._count(operation, 'hedge_won')
+                    self.record_latency(operation, now - hedge_start)
+                    # The cancelled primary took at least this long - keep the tail in the window
+                    self.record_latency(operation, now - start)
+                return winner.result()
+
+            # Both failed - report the primary's error
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+            await asyncio.gather(*(task for task in (primary, hedge) if task is not None), return_exceptions=True)
+
+    def get_statistics(self) -> Dict:
+        with self.lock:
+            return {
+                'tools': sorted(self.tools),
+                'percentile': self.percentile,
+                'delays': {
+                    operation: round(_percentile(samples, self.percentile), 3)
+                    for operation, samples in self.latencies.items()
+                    if len(samples) >= self.min_samples
+                },
+                **self.stats,
+            }
+
+
+# Global hedge policy (singleton pattern)
+_global_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """
+    Get or create the global hedge policy.
+
+    Environment:
+        HEDGE_TOOLS: comma-separated tool names to hedge (default: none - hedging off)
+        HEDGE_PERCENTILE: latency percentile that triggers a hedge (default: 95)
+        HEDGE_MAX_PER_MINUTE: hedge budget (default: 10)
+        HEDGE_MIN_SAMPLES: latencies needed before hedging (default: 20)
+    """
+    global _global_policy
+
+    if _global_policy is None:
+        _global_policy = HedgePolicy(
+            tools=[t.strip() for t in os.getenv('HEDGE_TOOLS', '').split(',') if t.strip()],
+            percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+            max_per_minute=float(os.getenv('HEDGE_MAX_PER_MINUTE', '10')),
+            min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+        )
+    return _global_policy
+
+
+def reset_hedge_policy():
+    """
+    Reset global hedge policy (useful for testing or re-initialization).
+    """
+    global _global_policy
+    _global_policy = None
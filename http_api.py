@@ -0,0 +1,365 @@
+# http_api.py - Headless HTTP API for furniture placement and virtual try-on
+#
+# Usage:
+#   python http_api.py --port 8080                     # real Gemini (GOOGLE_API_KEY)
+#   python http_api.py --port 8080 --fake-backend      # local stand-in, no network/quota
+#   python http_api.py --fake-backend --fake-distribution lognormal --fake-429-rate 0.05
+#
+# Endpoints:
+#   POST /v1/virtual-tryon          multipart: person_image, clothing_image, clothing_type
+#   POST /v1/furniture-placement    multipart: room_image, furniture_image, placement_description,
+#                                              removal_prompt (optional), mask_coordinates (optional)
+#   GET  /v1/stats                  key manager, admission and prompt context cache statistics
+#   GET  /metrics                   Prometheus metrics (keys, tools, stages, caches)
+#   GET  /healthz
+#
+# By default the generated image is returned as the response body (with its own media type, e.g. image/png).
+# With ?stream=true the response is NDJSON progress events:
+#   accepted, admitted (after a queue wait), stage_started / stage_finished (with duration_ms), removal_ready (furniture
+#   placement: the emptied room as base64), final_ready, running (heartbeat while idle),
+#   then completed (the image as base64) or failed.
+# ?priority=batch queues the request behind interactive ones (admission control, see
+# admission.py). When the key pool is saturated requests are shed with 503 + Retry-After
+# (streams that were already accepted end with a "rejected" event instead).
+# Every response carries a request id (X-Request-Id header / "request_id" field), which
+# labels the request's row in the trace file when TRACE_FILE is set.
+
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import FastAPI, File, Form, Query, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from dotenv import load_dotenv
+
+from admission import PRIORITIES, AdmissionRejected, get_admission_controller
+from api_key_manager import get_api_key_manager, init_api_key_manager
+from metrics import REGISTRY
+from prompt_templates import get_prompt_context_cache
+from tool_context import LocalToolContext
+from tools import (
+    remove_and_place_object,
+    virtual_tryon,
+    RemoveAndPlaceObjectInput,
+    VirtualTryOnInput
+)
+
+# Seconds between "running" heartbeat events on streaming responses
+HEARTBEAT_SECONDS = 1.0
+
+app = FastAPI(
+    title="AI Visual Assistant API",
+    description="Furniture placement and virtual try-on powered by Gemini image generation"
+)
+
+
+# === TOOL EXECUTION ===
+async def run_tool(
+    tool_call: Callable[[LocalToolContext, Dict[str, str]], Awaitable[str]],
+    uploads: Dict[str, Tuple[str, bytes]],
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    priority: str = "interactive"
+) -> Dict:
+    """
+    Run a tool against the uploaded images (handed over in memory) with a private output directory.
+    uploads maps form field -> (original filename, bytes); progress_callback receives
+    the tool's progress events (see LocalToolContext.emit_progress).
+    Returns {"ok", "message", "image", "mime_type", "latency_ms", "request_id",
+    "retry_after_seconds"} - retry_after_seconds is set when admission control shed the call.
+    """
+    start = time.perf_counter()
+    request_id = uuid.uuid4().hex[:16]  # Also labels the request's trace
+
+    with tempfile.TemporaryDirectory(prefix="visual_api_") as work_dir:
+        work_path = Path(work_dir)
+        in_memory = {}
+        paths = {}
+        for field, (filename, data) in uploads.items():
+            suffix = Path(filename or "").suffix.lower() or ".jpg"
+            paths[field] = f"{field}{suffix}"
+            in_memory[paths[field]] = data
+
+        tool_context = LocalToolContext(
+            work_path / "output", request_id=request_id, progress_callback=progress_callback,
+            priority=priority, uploads=in_memory
+        )
+        retry_after = None
+        try:
+            message = await tool_call(tool_context, paths)
+        except AdmissionRejected as e:
+            message, retry_after = str(e), e.retry_after_seconds
+
+        image = None
+        artifact = getattr(message, "artifact", None)
+        if artifact is not None:
+            image = await asyncio.to_thread(artifact.read_bytes)
+        await tool_context.wait_for_spills()  # Before the working directory is removed
+
+    return {
+        "ok": image is not None,
+        "message": message,
+        "image": image,
+        "mime_type": artifact.mime_type if artifact is not None else None,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "request_id": request_id,
+        "retry_after_seconds": retry_after,
+    }
+
+
+def rejected_response(message: str, retry_after_seconds: float, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """
+    503 for a request shed by admission control.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"error": message, "retry_after_seconds": retry_after_seconds},
+        headers={**(headers or {}), "Retry-After": str(int(retry_after_seconds))}
+    )
+
+
+def error_status(message: str) -> int:
+    """
+    HTTP status for a failed tool run.
+    """
+    if "File not found" in message:
+        return 400
+    return 502  # Upstream model failure
+
+
+def encode_event(event: Dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def progress_event(event: Dict) -> Dict:
+    """
+    Turn a tool progress event into a stream event: local paths are dropped and the
+    intermediate removal image is inlined from the bytes the event carries, next to the
+    mime_type the tool reported (runs on the event loop, so it never reads the file -
+    which may not even be written yet).
+    """
+    event = dict(event)
+    event.pop("path", None)
+    data = event.pop("data", None)
+    if event["event"] == "removal_ready" and data:
+        event["image_base64"] = base64.b64encode(data).decode("ascii")
+    return event
+
+
+async def respond(
+    tool_name: str,
+    tool_call: Callable[[LocalToolContext, Dict[str, str]], Awaitable[str]],
+    uploads: Dict[str, UploadFile],
+    stream: bool,
+    priority: str = "interactive"
+):
+    """
+    Run a tool and build either a binary image response or an NDJSON event stream.
+    """
+    if priority not in PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"priority must be one of {PRIORITIES}"})
+
+    # Read uploads up front - the request's files are closed once streaming starts
+    contents = {field: (upload.filename, await upload.read()) for field, upload in uploads.items()}
+
+    if not stream:
+        result = await run_tool(tool_call, contents, priority=priority)
+        if result["retry_after_seconds"] is not None:
+            return rejected_response(result["message"], result["retry_after_seconds"], {"X-Request-Id": result["request_id"]})
+        if result["ok"]:
+            return Response(
+                content=result["image"],
+                media_type=result["mime_type"],
+                headers={"X-Latency-Ms": str(result["latency_ms"]), "X-Request-Id": result["request_id"]}
+            )
+        return JSONResponse(
+            status_code=error_status(result["message"]),
+            content={"error": result["message"], "latency_ms": result["latency_ms"]},
+            headers={"X-Request-Id": result["request_id"]}
+        )
+
+    # Shed before the 200 goes out if the request cannot be queued at all
+    controller = get_admission_controller()
+    if controller is not None:
+        try:
+            await controller.check(tool_name, priority)
+        except AdmissionRejected as e:
+            return rejected_response(str(e), e.retry_after_seconds)
+
+    async def events():
+        start = time.perf_counter()
+        yield encode_event({"event": "accepted", "tool": tool_name})
+
+        progress: "asyncio.Queue[Dict]" = asyncio.Queue()
+        task = asyncio.create_task(run_tool(
+            tool_call, contents, lambda e: progress.put_nowait(progress_event(e)), priority=priority
+        ))
+        next_event = None
+        try:
+            while not task.done():
+                next_event = next_event or asyncio.ensure_future(progress.get())
+                done, _ = await asyncio.wait({task, next_event}, timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in done:
+                    yield encode_event(next_event.result())
+                    next_event = None
+                elif not done:
+                    yield encode_event({
+                        "event": "running",
+                        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+                    })
+
+            # Events emitted just before the tool returned
+            if next_event is not None and next_event.done():
+                yield encode_event(next_event.result())
+                next_event = None
+            while not progress.empty():
+                yield encode_event(progress.get_nowait())
+
+            result = task.result()
+            if result["retry_after_seconds"] is not None:
+                yield encode_event({
+                    "event": "rejected",
+                    "error": result["message"],
+                    "retry_after_seconds": result["retry_after_seconds"],
+                    "request_id": result["request_id"],
+                })
+            elif result["ok"]:
+                yield encode_event({
+                    "event": "completed",
+                    "latency_ms": result["latency_ms"],
+                    "request_id": result["request_id"],
+                    "mime_type": result["mime_type"],
+                    "image_base64": base64.b64encode(result["image"]).decode("ascii"),
+                })
+            else:
+                yield encode_event({
+                    "event": "failed",
+                    "error": result["message"],
+                    "latency_ms": result["latency_ms"],
+                    "request_id": result["request_id"],
+                })
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+            # Client disconnected mid-stream - stop the generation
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# === ENDPOINTS ===
+@app.post("/v1/virtual-tryon")
+async def virtual_tryon_endpoint(
+    person_image: UploadFile = File(..., description="Photo of the person"),
+    clothing_image: UploadFile = File(..., description="Photo of the clothing item"),
+    clothing_type: str = Form("shirt", description="shirt, pants, dress or jacket"),
+    stream: bool = Query(False, description="Stream NDJSON progress events"),
+    priority: str = Query("interactive", description="Admission priority: interactive or batch")
+):
+    async def call(tool_context: LocalToolContext, paths: Dict[str, str]) -> str:
+        return await virtual_tryon(tool_context, VirtualTryOnInput(
+            person_image_filename=paths["person_image"],
+            clothing_image_filename=paths["clothing_image"],
+            clothing_type=clothing_type,
+            asset_name="virtual_tryon"
+        ))
+
+    uploads = {"person_image": person_image, "clothing_image": clothing_image}
+    return await respond("virtual_tryon", call, uploads, stream, priority)
+
+
+@app.post("/v1/furniture-placement")
+async def furniture_placement_endpoint(
+    room_image: UploadFile = File(..., description="Photo of the room/scene"),
+    furniture_image: UploadFile = File(..., description="Photo of the object to place"),
+    placement_description: str = Form(..., description="Where to place the object"),
+    removal_prompt: str = Form("", description="Object to remove first (optional)"),
+    mask_coordinates: str = Form("{}", description='JSON {"x", "y", "width", "height"} (optional)'),
+    stream: bool = Query(False, description="Stream NDJSON progress events"),
+    priority: str = Query("interactive", description="Admission priority: interactive or batch")
+):
+    async def call(tool_context: LocalToolContext, paths: Dict[str, str]) -> str:
+        return await remove_and_place_object(tool_context, RemoveAndPlaceObjectInput(
+            room_image_filename=paths["room_image"],
+            furniture_image_filename=paths["furniture_image"],
+            mask_coordinates=mask_coordinates or "{}",
+            removal_prompt=removal_prompt,
+            placement_description=placement_description,
+            asset_name="furniture_placement"
+        ))
+
+    uploads = {"room_image": room_image, "furniture_image": furniture_image}
+    return await respond("remove_and_place_object", call, uploads, stream, priority)
+
+
+@app.get("/v1/stats")
+async def stats_endpoint():
+    controller = get_admission_controller()
+    # Key statistics read the shared state database - keep it off the event loop
+    key_statistics = await asyncio.to_thread(get_api_key_manager().get_statistics)
+    return {
+        **key_statistics,
+        "admission": controller.get_statistics() if controller is not None else "disabled",
+        "prompt_cache": get_prompt_context_cache().get_statistics(),
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def health_endpoint():
+    return {"status": "ok"}
+
+
+# === CLI ===
+def main():
+    parser = argparse.ArgumentParser(description="AI Visual Assistant HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fake-backend", action="store_true", help="Serve from the local stand-in model (no network)")
+    parser.add_argument("--fake-keys", type=int, default=4, help="Number of stand-in keys when GOOGLE_API_KEY is unset")
+    parser.add_argument("--fake-latency", type=float, default=4.0, help="Mean stand-in generation latency (seconds)")
+    parser.add_argument("--fake-jitter", type=float, default=1.0, help="Stand-in latency standard deviation (seconds)")
+    parser.add_argument("--fake-distribution", default="normal", help="Stand-in latency distribution: fixed, normal, lognormal, exponential")
+    parser.add_argument("--fake-chunks", type=int, default=1, help="Stand-in stream chunks per response")
+    parser.add_argument("--fake-429-rate", type=float, default=0.0, help="Fraction of stand-in calls rejected with 429")
+    parser.add_argument("--fake-5xx-rate", type=float, default=0.0, help="Fraction of stand-in calls failing with 503")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    if args.fake_backend:
+        from fake_gemini import FakeBackendConfig, make_fake_client_factory
+
+        keys = [k.strip() for k in os.getenv("GOOGLE_API_KEY", "").split(",") if k.strip()]
+        init_api_key_manager(
+            api_keys=keys or [f"fake-key-{i + 1}" for i in range(args.fake_keys)],
+            client_factory=make_fake_client_factory(config=FakeBackendConfig(
+                latency_seconds=args.fake_latency,
+                jitter_seconds=args.fake_jitter,
+                distribution=args.fake_distribution,
+                chunks=args.fake_chunks,
+                rate_limit_rate=args.fake_429_rate,
+                server_error_rate=args.fake_5xx_rate
+            ))
+        )
+    else:
+        # Fail fast on missing keys instead of on the first request
+        get_api_key_manager()
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# image_preprocessing.py - Input image normalization before upload to Gemini
+
+import asyncio
+import logging
+import mmap
+from io import BytesIO
+from typing import Dict, Tuple, Union
+
+from google.genai import types
+from PIL import Image, ImageOps
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePreprocessConfig(BaseModel):
+    """
+    Settings for normalizing an input image before it is sent to the model.
+    """
+    enabled: bool = Field(default=True, description="Disable to send the raw uploaded bytes")
+    max_edge: int = Field(default=1536, description="Longest edge in pixels after downscaling")
+    format: str = Field(default="JPEG", description="Output encoding: JPEG or WEBP")
+    quality: int = Field(default=85, description="Encoder quality (1-100)")
+
+
+# Per-tool settings - room photos keep more detail than person/clothing shots
+TOOL_PREPROCESS_CONFIGS: Dict[str, ImagePreprocessConfig] = {
+    "remove_and_place_object": ImagePreprocessConfig(max_edge=1536, quality=85),
+    "virtual_tryon": ImagePreprocessConfig(max_edge=1024, quality=85),
+}
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+# Encoded image held in memory: bytes, a memoryview over an upload or an mmap of a file
+ImageBuffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def get_preprocess_config(tool_name: str) -> ImagePreprocessConfig:
+    """
+    Get preprocessing settings for a tool (defaults if the tool is not configured).
+    """
+    return TOOL_PREPROCESS_CONFIGS.get(tool_name, ImagePreprocessConfig())
+
+
+def set_preprocess_config(tool_name: str, config: ImagePreprocessConfig):
+    """
+    Override preprocessing settings for a tool.
+    """
+    TOOL_PREPROCESS_CONFIGS[tool_name] = config
+
+
+def as_bytes(buffer: ImageBuffer) -> bytes:
+    """
+    bytes for a types.Blob. bytes (and a memoryview spanning a whole bytes object) are
+    passed through without a copy; mmaps, bytearrays and slices are copied once.
+    """
+    if isinstance(buffer, bytes):
+        return buffer
+    if (isinstance(buffer, memoryview) and isinstance(buffer.obj, bytes)
+            and buffer.c_contiguous and buffer.nbytes == len(buffer.obj)):
+        return buffer.obj
+    return bytes(buffer)
+
+
+def normalize_image_bytes(data: ImageBuffer, config: ImagePreprocessConfig) -> Tuple[bytes, str]:
+    """
+    Normalize an encoded image. An mmap is decoded straight from the mapping (read in
+    chunks), bytes through a BytesIO that shares their buffer.
+
+    Steps:
+    - Apply EXIF orientation (phone photos are often stored rotated)
+    - Downscale so the longest edge is at most config.max_edge
+    - Re-encode to JPEG/WebP at config.quality, dropping EXIF/ICC/XMP metadata
+
+    Returns (encoded_bytes, mime_type).
+    """
+    output_format = config.format.upper()
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format: {config.format}")
+
+    with Image.open(data if isinstance(data, mmap.mmap) else BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+
+        if max(img.size) > config.max_edge:
+            img.thumbnail((config.max_edge, config.max_edge), Image.Resampling.LANCZOS)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if output_format == "JPEG" and has_alpha:
+            # JPEG has no alpha channel - flatten onto white like product photos
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        elif output_format == "WEBP" and has_alpha:
+            img = img.convert("RGBA")
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        buffer = BytesIO()
+        # No exif/icc_profile arguments: metadata is not carried over
+        img.save(buffer, format=output_format, quality=config.quality, optimize=True)
+
+    return buffer.getvalue(), MIME_TYPES[output_format]
+
+
+async def normalize_image_data(data: ImageBuffer, mime_type: str, config: ImagePreprocessConfig) -> types.Part:
+    """
+    Normalize an encoded image held in memory (upload buffer or memory-mapped file) into a Part.
+    The raw image is only decoded, never copied whole - unless preprocessing is off or
+    decoding fails, in which case it is sent as-is.
+    """
+    if config.enabled and len(data):
+        try:
+            normalized, normalized_mime_type = await asyncio.to_thread(normalize_image_bytes, data, config)
+        except Exception as e:
+            logger.warning(f"⚠️ Image normalization skipped: {e}")
+        else:
+            logger.debug(f"🖼️ Normalized image: {len(data) / 1024:.1f} KB → {len(normalized) / 1024:.1f} KB")
+            return types.Part(inline_data=types.Blob(mime_type=normalized_mime_type, data=normalized))
+
+    # Copying an mmap reads the whole file - keep that off the event loop
+    raw = await asyncio.to_thread(as_bytes, data) if isinstance(data, mmap.mmap) else as_bytes(data)
+    return types.Part(inline_data=types.Blob(mime_type=mime_type, data=raw))
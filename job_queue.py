@@ -0,0 +1,193 @@
+# job_queue.py - Process-wide background job queue for image generation
+
+import os
+import uuid
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job:
+    """
+    A unit of work submitted to the JobQueue.
+    Fields are written by the worker thread and only read by callers.
+    """
+
+    def __init__(self, job_id: str, func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JobStatus.PENDING
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.error_details: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: List[Dict] = []  # Events reported by the job via report_progress()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.submitted_at)
+
+
+# Job being run by the current worker task (read by report_progress)
+_current_job: ContextVar[Optional[Job]] = ContextVar("current_job", default=None)
+
+
+def report_progress(event: Dict):
+    """
+    Append a progress event to the job running in the current task (no-op outside a job).
+    Usable as a LocalToolContext progress_callback.
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.progress.append(event)
+
+
+class JobQueue:
+    """
+    Runs async jobs on a long-lived event loop in a background thread.
+
+    Features:
+    - Fixed pool of worker tasks shared by every caller in the process
+    - submit() returns a job id immediately; callers poll get(job_id)
+    - Finished jobs are kept (bounded) so late pollers still see the result
+    """
+
+    def __init__(self, num_workers: int = 8, max_finished_jobs: int = 1000):
+        """
+        Initialize and start the job queue.
+
+        Args:
+            num_workers: Number of jobs processed concurrently
+            max_finished_jobs: Finished jobs retained for polling (oldest dropped first)
+        """
+        self.num_workers = num_workers
+        self.max_finished_jobs = max_finished_jobs
+
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, name="job-queue", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+        logger.info(f"✅ Job queue started with {num_workers} worker(s)")
+
+    def _run_loop(self):
+        """
+        Thread target: own the event loop and run the workers forever.
+        """
+        asyncio.set_event_loop(self.loop)
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue()
+        self.workers = [self.loop.create_task(self._worker(i)) for i in range(self.num_workers)]
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    async def _worker(self, worker_id: int):
+        """
+        Take jobs off the queue and run them one at a time.
+        """
+        while True:
+            job = await self.queue.get()
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+            token = _current_job.set(job)
+            try:
+                job.result = await job.func(*job.args, **job.kwargs)
+                job.status = JobStatus.DONE
+            except Exception as e:
+                job.error = str(e)
+                job.error_details = traceback.format_exc()
+                job.status = JobStatus.FAILED
+                logger.error(f"❌ Job {job.id} failed: {e}")
+            finally:
+                _current_job.reset(token)
+                job.finished_at = time.time()
+                self.queue.task_done()
+                self._prune()
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> str:
+        """
+        Queue `await func(*args, **kwargs)` and return its job id (thread-safe).
+        """
+        job = Job(uuid.uuid4().hex, func, args, kwargs)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, job)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Look up a job by id (thread-safe). Returns None for unknown/pruned jobs.
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self):
+        """
+        Drop the oldest finished jobs beyond max_finished_jobs.
+        """
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.done]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job_id]
+
+    def get_statistics(self) -> Dict:
+        """
+        Get queue statistics.
+        """
+        with self.lock:
+            counts = {status.value: 0 for status in JobStatus}
+            for job in self.jobs.values():
+                counts[job.status.value] += 1
+        return {
+            'workers': self.num_workers,
+            'queued': counts[JobStatus.PENDING.value],
+            'running': counts[JobStatus.RUNNING.value],
+            'done': counts[JobStatus.DONE.value],
+            'failed': counts[JobStatus.FAILED.value],
+        }
+
+
+# Global queue instance (singleton pattern)
+_global_queue: Optional[JobQueue] = None
+_global_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get or create the process-wide job queue (singleton).
+    Worker count comes from JOB_QUEUE_WORKERS (default: 8).
+    """
+    global _global_queue
+
+    with _global_queue_lock:
+        if _global_queue is None:
+            _global_queue = JobQueue(num_workers=int(os.getenv('JOB_QUEUE_WORKERS', '8')))
+
+    return _global_queue
@@ -0,0 +1,300 @@
+# key_state_store.py - Key health state (cooldowns, budgets, stats) shared between processes
+
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cooldowns (
+    fingerprint TEXT PRIMARY KEY,
+    failed_at REAL NOT NULL,
+    cooldown_minutes REAL NOT NULL,
+    until REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    fingerprint TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (fingerprint, name)
+);
+CREATE TABLE IF NOT EXISTS key_stats (
+    fingerprint TEXT PRIMARY KEY,
+    total_requests INTEGER NOT NULL DEFAULT 0,
+    successful_requests INTEGER NOT NULL DEFAULT 0,
+    failed_requests INTEGER NOT NULL DEFAULT 0,
+    last_used REAL,
+    last_error TEXT
+);
+"""
+
+
+@lru_cache(maxsize=256)
+def key_fingerprint(key: str) -> str:
+    """
+    Stable identifier for an API key that is safe to store and log (never the key itself).
+    """
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+class SharedKeyStateStore:
+    """
+    SQLite (WAL mode) database that lets every process on a host share
+    key cooldowns, rate budgets and usage counters.
+
+    Features:
+    - Cooldowns written by one process are seen by the others on their next sync
+      (at most sync_interval_seconds later)
+    - All of a key's token buckets are consumed in one write transaction (all or nothing),
+      so budgets hold across processes
+    - Cooldowns and call counters are written by a background writer thread; callers
+      only queue them and never wait on the database
+    - Reads of the cached view (get_cooldowns, bucket_level) never touch the database.
+      sync(), take_tokens() and get_stats() do and can wait up to busy_timeout_seconds -
+      call them off the event loop
+    - Keys are stored by fingerprint, never in plain text
+    - Database errors are logged and never fail an API call (the manager keeps
+      working on its process-local state)
+    - Thread-safe operations
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        sync_interval_seconds: float = 0.05,
+        busy_timeout_seconds: float = 5.0
+    ):
+        """
+        Open (or create) the shared state database.
+
+        Args:
+            path: SQLite database file, shared by all processes on the host
+            sync_interval_seconds: Minimum time between refreshes of the cached cooldowns / bucket levels
+            busy_timeout_seconds: How long a write waits for another process's transaction
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.sync_interval_seconds = sync_interval_seconds
+
+        self.conn = sqlite3.connect(
+            str(self.path),
+            timeout=busy_timeout_seconds,
+            isolation_level=None,  # Autocommit; transactions are explicit
+            check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        # Cached view of the database, refreshed by sync() (guarded by cache_lock, never held during I/O)
+        self._cooldowns: Dict[str, Tuple[float, float, str]] = {}  # fingerprint -> (failed_at, minutes, error)
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}  # (fingerprint, name) -> (tokens, updated_at)
+        self._synced_at = 0.0
+        self.cache_lock = threading.Lock()
+
+        # Database connection (lock) and the queue of fire-and-forget writes
+        self.lock = threading.Lock()
+        self.writes: "queue.Queue[Optional[Tuple[str, List[Tuple[str, tuple]]]]]" = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name="key-state-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)  # Don't lose queued cooldowns / counters at interpreter exit
+        logger.info(f"🗄️ Shared key state: {self.path}")
+
+    def sync_due(self) -> bool:
+        """
+        True when the cached view is older than the sync interval.
+        """
+        return time.monotonic() - self._synced_at >= self.sync_interval_seconds
+
+    def sync(self, force: bool = False):
+        """
+        Refresh the cached cooldowns and bucket levels (at most once per sync interval).
+        Reads the database - call off the event loop.
+        """
+        if not force and not self.sync_due():
+            return
+
+        with self.lock:
+            try:
+                cooldowns = self.conn.execute(
+                    "SELECT fingerprint, failed_at, cooldown_minutes, error FROM cooldowns WHERE until > ?",
+                    (time.time(),)
+                ).fetchall()
+                buckets = self.conn.execute("SELECT fingerprint, name, tokens, updated_at FROM buckets").fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Shared key state sync failed: {e}")
+                return
+
+        with self.cache_lock:
+            # Cooldowns this process published but the writer has not stored yet stay cached
+            pending = {fp: entry for fp, entry in self._cooldowns.items() if entry[0] + entry[1] * 60 > time.time()}
+            self._cooldowns = {**pending, **{fp: (failed_at, minutes, error) for fp, failed_at, minutes, error in cooldowns}}
+            self._buckets = {(fp, name): (tokens, updated_at) for fp, name, tokens, updated_at in buckets}
+            self._synced_at = time.monotonic()
+
+    # === WRITER ===
+    def _write_loop(self):
+        """
+        Background writer: applies queued writes in order until close() queues None.
+        """
+        while True:
+            item = self.writes.get()
+            try:
+                if item is None:
+                    return
+                description, statements = item
+                with self.lock:
+                    try:
+                        for sql, params in statements:
+                            self.conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        logger.warning(f"⚠️ Could not {description}: {e}")
+            finally:
+                self.writes.task_done()
+
+    def flush(self):
+        """
+        Wait until every queued write has been applied.
+        """
+        self.writes.join()
+
+    # === COOLDOWNS ===
+    def get_cooldowns(self) -> Dict[str, Tuple[float, float, str]]:
+        """
+        Active cooldowns from the cached view: fingerprint -> (failed_at epoch seconds, cooldown minutes, error).
+        """
+        with self.cache_lock:
+            return dict(self._cooldowns)
+
+    def set_cooldown(self, fingerprint: str, failed_at: float, cooldown_minutes: float, error: str):
+        """
+        Publish a key cooldown to every process (written in the background).
+        """
+        until = failed_at + cooldown_minutes * 60
+        with self.cache_lock:
+            self._cooldowns[fingerprint] = (failed_at, cooldown_minutes, error)
+        self.writes.put(("publish cooldown", [
+            ("INSERT INTO cooldowns (fingerprint, failed_at, cooldown_minutes, until, error) "
+             "VALUES (?, ?, ?, ?, ?) "
+             "ON CONFLICT(fingerprint) DO UPDATE SET failed_at = excluded.failed_at, "
+             "cooldown_minutes = excluded.cooldown_minutes, until = excluded.until, error = excluded.error",
+             (fingerprint, failed_at, cooldown_minutes, until, error)),
+            ("DELETE FROM cooldowns WHERE until <= ?", (time.time(),)),
+        ]))
+
+    # === TOKEN BUCKETS ===
+    def bucket_level(self, fingerprint: str, name: str, capacity: float, rate: float) -> float:
+        """
+        Current tokens in a shared bucket, from the cached view (a full bucket if never used).
+        """
+        with self.cache_lock:
+            tokens, updated_at = self._buckets.get((fingerprint, name), (capacity, time.time()))
+        return min(capacity, tokens + max(0.0, time.time() - updated_at) * rate)
+
+    def take_tokens(self, fingerprint: str, buckets: Dict[str, Tuple[float, float]], tokens: float = 1.0) -> bool:
+        """
+        Atomically take `tokens` from every bucket of a key in one transaction.
+        Returns False, taking nothing, if any bucket does not hold enough.
+        Fails open if the database is unavailable.
+
+        Args:
+            fingerprint: Key fingerprint
+            buckets: Bucket name -> (capacity, refill rate in tokens per second)
+            tokens: Tokens to take from each bucket
+        """
+        with self.lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    now = time.time()
+                    levels = {}
+                    for name, (capacity, rate) in buckets.items():
+                        row = self.conn.execute(
+                            "SELECT tokens, updated_at FROM buckets WHERE fingerprint = ? AND name = ?",
+                            (fingerprint, name)
+                        ).fetchone()
+                        levels[name] = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+
+                    taken = all(level >= tokens for level in levels.values())
+                    if taken:
+                        levels = {name: level - tokens for name, level in levels.items()}
+                        self.conn.executemany(
+                            "INSERT INTO buckets (fingerprint, name, tokens, updated_at) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT(fingerprint, name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                            [(fingerprint, name, level, now) for name, level in levels.items()]
+                        )
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Shared budget unavailable, allowing request: {e}")
+                return True
+
+        # Cache the levels just read, so a caller that lost the race sees the real wait
+        with self.cache_lock:
+            for name, level in levels.items():
+                self._buckets[(fingerprint, name)] = (level, now)
+        return taken
+
+    # === STATS ===
+    def record_call(self, fingerprint: str, success: bool, error: str = None):
+        """
+        Add one call outcome to the shared per-key counters (written in the background).
+        """
+        self.writes.put(("record shared stats", [(
+            "INSERT INTO key_stats (fingerprint, total_requests, successful_requests, failed_requests, last_used, last_error) "
+            "VALUES (?, 1, ?, ?, ?, ?) "
+            "ON CONFLICT(fingerprint) DO UPDATE SET "
+            "total_requests = total_requests + 1, "
+            "successful_requests = successful_requests + excluded.successful_requests, "
+            "failed_requests = failed_requests + excluded.failed_requests, "
+            "last_used = COALESCE(excluded.last_used, last_used), "
+            "last_error = COALESCE(excluded.last_error, last_error)",
+            (fingerprint, int(success), int(not success), time.time() if success else None, error)
+        )]))
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Per-key counters summed over all processes: fingerprint -> stats dict.
+        This process's queued calls are written first.
+        """
+        self.flush()
+        with self.lock:
+            try:
+                rows = self.conn.execute(
+                    "SELECT fingerprint, total_requests, successful_requests, failed_requests, last_used, last_error FROM key_stats"
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Could not read shared stats: {e}")
+                return {}
+
+        return {
+            fp: {
+                'total_requests': total,
+                'successful_requests': successful,
+                'failed_requests': failed,
+                'last_used': last_used,
+                'last_error': last_error,
+            }
+            for fp, total, successful, failed, last_used, last_error in rows
+        }
+
+    def close(self):
+        """
+        Apply the queued writes, stop the writer and close the database.
+        """
+        self.writes.put(None)
+        self.writer.join()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,301 @@
+# metrics.py - Prometheus text-format metrics for the key manager, tools and caches
+#
+# Export (any combination):
+#   METRICS_PORT=9464          serve http://<host>:9464/metrics from a background thread
+#   METRICS_HOST=127.0.0.1     interface the METRICS_PORT endpoint binds to (default: loopback;
+#                              0.0.0.0 exposes it to the network)
+#   METRICS_FILE=metrics.prom  rewrite the file every METRICS_FILE_INTERVAL_SECONDS (default 15),
+#                              e.g. for node_exporter's textfile collector
+#   http_api.py                always serves GET /metrics
+
+import os
+import time
+import math
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Image generations take seconds; cache hits and preprocessing take milliseconds
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """
+    Base for labelled metrics. Children are keyed by label values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self.collect()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self.lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self.values.items())
+            ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+    ):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> ([count per bucket], sum, count)
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Observe the wall time of a with-block (works across awaits).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.label_names, key, (("le", _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds metrics and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path):
+        """
+        Write the current metrics to a file atomically (temp file + rename).
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+# Global registry and the metrics recorded across the pipeline
+REGISTRY = MetricsRegistry()
+
+KEY_REQUESTS = REGISTRY.counter(
+    "visual_key_requests_total", "Model calls per API key by outcome", ["key", "outcome"])
+KEY_CALL_LATENCY = REGISTRY.histogram(
+    "visual_key_call_latency_seconds", "Duration of model calls per API key", ["key", "outcome"])
+KEY_SLOT_WAIT = REGISTRY.histogram(
+    "visual_key_slot_wait_seconds", "Time spent waiting for a key's budget or concurrency slot")
+KEY_IN_FLIGHT = REGISTRY.gauge(
+    "visual_key_in_flight", "Model calls currently in flight per API key", ["key"])
+KEY_RETRIES = REGISTRY.counter(
+    "visual_key_retries_total", "Model calls retried on another key, by error kind", ["kind"])
+KEY_COOLDOWNS = REGISTRY.counter(
+    "visual_key_cooldowns_total", "API keys put into cooldown, by error kind", ["key", "kind"])
+TOOL_LATENCY = REGISTRY.histogram(
+    "visual_tool_latency_seconds", "End-to-end tool latency", ["tool", "status"])
+STAGE_LATENCY = REGISTRY.histogram(
+    "visual_stage_latency_seconds", "Latency of each tool stage", ["tool", "stage"])
+CACHE_LOOKUPS = REGISTRY.counter(
+    "visual_cache_lookups_total", "Result cache lookups by cache and result", ["cache", "result"])
+SINGLE_PASS_RESULTS = REGISTRY.counter(
+    "visual_single_pass_total", "Single-pass replacements by result (used or fallback reason)", ["result"])
+HEDGES = REGISTRY.counter(
+    "visual_hedges_total", "Hedged model calls by operation and outcome", ["operation", "outcome"])
+ADMISSIONS = REGISTRY.counter(
+    "visual_admissions_total", "Tool calls admitted or shed by admission control", ["tool", "priority", "outcome"])
+ADMISSION_WAIT = REGISTRY.histogram(
+    "visual_admission_wait_seconds", "Time admitted tool calls waited for a slot", ["priority"])
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "visual_admission_queue_depth", "Tool calls waiting for an admission slot")
+PROMPT_TOKENS = REGISTRY.counter(
+    "visual_prompt_tokens_total",
+    "Prompt tokens of templated calls by template and part (static/variable sent, cached = served from context cache)",
+    ["template", "part"])
+
+
+# === EXPORT ===
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+def _serve_http(port: int, host: str = "127.0.0.1"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 Metrics served on {host}:{port}/metrics")
+
+
+def _write_periodically(path: Path, interval_seconds: float):
+    def loop():
+        while True:
+            try:
+                REGISTRY.write_textfile(path)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write metrics file: {e}")
+            time.sleep(interval_seconds)
+
+    threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+    logger.info(f"📈 Metrics written to {path} every {interval_seconds:.0f}s")
+
+
+def start_metrics_exporter(port: Optional[int] = None, path: Optional[str] = None, host: Optional[str] = None):
+    """
+    Start the configured exporters once per process (later calls are no-ops).
+    Falls back to METRICS_PORT / METRICS_FILE / METRICS_HOST when arguments are not given.
+    """
+    global _exporter_started
+
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    port = port or int(os.getenv("METRICS_PORT", "0") or 0)
+    path = path or os.getenv("METRICS_FILE", "").strip()
+    host = host or os.getenv("METRICS_HOST", "").strip() or "127.0.0.1"
+
+    if port:
+        try:
+            _serve_http(port, host)
+        except OSError as e:
+            # Another replica on this host already owns the port
+            logger.warning(f"⚠️ Metrics port {port} unavailable: {e}")
+    if path:
+        _write_periodically(Path(path), float(os.getenv("METRICS_FILE_INTERVAL_SECONDS", "15")))
@@ -0,0 +1,487 @@
+# prompt_templates.py - Prompt template registry with Gemini context caching of the static parts
+#
+# The removal and placement prompts are a multi-kilobyte instruction block that never
+# changes plus a one-line request (the removal text / placement description). Templates
+# keep the two apart: the instruction block is built once at import, only the request
+# line is formatted per call, and the block is always sent as the first text part so
+# identical prefixes line up across requests.
+#
+# Enable explicit context caching with:
+#   PROMPT_CONTEXT_CACHE=true           store each instruction block once per API key as a
+#                                       Gemini cached content; requests then send only the
+#                                       request line and the images
+#   PROMPT_CACHE_TTL_SECONDS=3600       lifetime of a cached content (refreshed before expiry)
+#   PROMPT_CACHE_MIN_TOKENS=1024        templates with smaller instruction blocks are sent
+#                                       inline (below the API's minimum cacheable size)
+#
+# Keys whose cache creation fails (e.g. the model does not support caching) send prompts
+# inline and retry after PROMPT_CACHE_RETRY_SECONDS. Context caching is skipped while a
+# cassette mode is active, so recorded requests do not depend on per-key cache names.
+
+import os
+import time
+import logging
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from google.genai import types
+
+try:
+    from .cassette import get_cassette_store
+    from .metrics import PROMPT_TOKENS
+except ImportError:
+    from cassette import get_cassette_store
+    from metrics import PROMPT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Seconds before retrying cache creation on a key where it failed
+PROMPT_CACHE_RETRY_SECONDS = 600
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token) used until the API reports the real one.
+    """
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class PromptTemplate:
+    """
+    A prompt split into a static instruction block and a per-call request line.
+
+    instructions: identical for every call (cacheable)
+    request: str.format template for the variable part
+    """
+    name: str
+    instructions: str
+    request: str
+    static_tokens: int = 0
+    tokens_counted: bool = False  # static_tokens reported by the API instead of estimated
+
+    def __post_init__(self):
+        self.static_tokens = self.static_tokens or estimate_tokens(self.instructions)
+
+    def parts(self, **values) -> List[types.Part]:
+        """
+        Text parts for a request: the instruction block, then the formatted request line.
+        """
+        return [types.Part(text=self.instructions), types.Part(text=self.request.format(**values))]
+
+
+# === TEMPLATES ===
+REMOVAL_TEMPLATE = PromptTemplate(
+    name="removal",
+    instructions="""UNIVERSAL OBJECT REMOVAL PROCESS (Applies to ALL objects):
+
+STEP 1 - IDENTIFY THE ENTIRE OBJECT:
+• Detect the COMPLETE boundary of the object mentioned
+• Include ALL components:
+  - Main body/structure (thân chính)
+  - Supporting parts: legs, base, frame (chân đế, khung)
+  - Attached elements: cushions, panels, accessories (đệm, tấm, phụ kiện)
+  - Surface items: anything ON or ATTACHED to the object (đồ vật bên trên)
+  - Shadows cast BY the object (bóng đổ của vật)
+  - Reflections of the object (phản chiếu)
+
+• Determine object boundaries:
+  - Left edge → Right edge (từ cạnh trái → cạnh phải)
+  - Front → Back (từ phía trước → phía sau)
+  - Bottom (floor contact) → Top (highest point) (từ sàn → đỉnh cao nhất)
+
+STEP 2 - REMOVE EVERY PIXEL:
+• Delete 100% of the object - NOTHING must remain visible
+• Start from center, expand to all edges
+• Continue until:
+  ☐ NO main body visible (không còn thân chính)
+  ☐ NO supporting parts visible (không còn phần đỡ)
+  ☐ NO attached elements visible (không còn phần gắn kèm)
+  ☐ NO surface items visible (không còn đồ vật bên trên)
+  ☐ NO shadows of object visible (không còn bóng đổ)
+  ☐ NO partial edges, corners, or fragments (không còn góc cạnh hay mảnh vụn)
+
+STEP 3 - FILL THE EMPTY SPACE NATURALLY:
+• Reconstruct background as if object never existed:
+  - Floor/Ground: Continue texture pattern (wood, tile, carpet, grass, concrete, etc.)
+  - Walls: Extend texture/color where object was against wall
+  - Baseboards: Continue lines if object blocked them
+  - Background: Match pattern (curtains, artwork, furniture behind object)
+
+• Maintain environmental consistency:
+  - Lighting: Match direction and intensity from surroundings
+  - Shadows: Add natural shadows from OTHER objects/people (not from removed object)
+  - Color grading: Keep consistent with rest of image
+  - Perspective: Maintain vanishing points and depth
+  - Texture detail: Match sharpness/resolution of surrounding area
+
+STEP 4 - QUALITY VERIFICATION (ALL must pass):
+☐ Object is 100% GONE - not even 1 pixel visible
+☐ Floor/ground texture continuous and natural
+☐ Wall/background texture seamless (if applicable)
+☐ Lighting consistent across filled area
+☐ NO editing artifacts (seams, blurs, color shifts)
+☐ NO discontinuities in patterns/lines
+☐ Perspective maintained correctly
+☐ Result looks PHOTOREALISTIC - as if object was never there
+
+FINAL CHECK: 
+Output MUST show the scene WITHOUT the specified object.
+If you can see ANY trace of the object (even a tiny corner, shadow, or edge) → This task has COMPLETELY FAILED.
+
+EXAMPLES (This process works for):
+- Furniture: bed, sofa, table, chair, cabinet, desk
+- People: person, child, adult, group
+- Vehicles: car, bike, motorcycle, truck
+- Electronics: TV, computer, phone, speaker
+- Decorations: plant, vase, picture frame, lamp
+- Animals: dog, cat, bird, pet
+- ANY other object user specifies""",
+    request="CRITICAL INSTRUCTION: {removal_text} COMPLETELY from this image."
+)
+
+PLACEMENT_TEMPLATE = PromptTemplate(
+    name="placement",
+    instructions="""UNIVERSAL OBJECT PLACEMENT PROCESS (Works for ALL objects):
+
+STEP 1 - ANALYZE THE EMPTY SCENE:
+• Understand the space:
+  - Type of space: room, outdoor, office, street, etc.
+  - Floor/Ground type: wood, tile, carpet, grass, concrete, asphalt
+  - Walls/Background: color, texture, distance from placement area
+  - Existing objects: furniture, people, decorations for scale reference
+
+• Study lighting conditions:
+  - Light sources: window, ceiling light, sun, lamps (identify ALL)
+  - Light direction: from which side (left/right/top/behind)
+  - Light intensity: bright, moderate, dim
+  - Color temperature: warm (yellow), cool (blue), neutral (white)
+  - Time of day: morning, afternoon, evening (affects shadows)
+
+• Analyze perspective:
+  - Camera angle: eye level, high angle, low angle
+  - Vanishing points: where parallel lines converge
+  - Depth perception: near objects larger, far objects smaller
+  - Field of view: wide angle or telephoto
+
+STEP 2 - ANALYZE THE NEW OBJECT (from second image):
+• Physical characteristics:
+  - Dimensions: length, width, height (estimate in meters/cm)
+  - Shape: rectangular, round, irregular, etc.
+  - Weight appearance: heavy (needs solid base) or light (can sit delicately)
+  
+• Visual properties:
+  - Color: main colors, accents, patterns
+  - Texture: smooth, rough, fabric, metal, wood, glass
+  - Material: wood, metal, plastic, fabric, leather, glass, etc.
+  - Finish: matte, glossy, semi-gloss
+
+• Contact points:
+  - How object touches ground: legs, flat base, wheels, uneven bottom
+  - Number of contact points: 4 legs, continuous base, single pedestal
+  - Expected indent/shadow pattern based on contact type
+
+STEP 3 - POSITION THE OBJECT CORRECTLY:
+• Placement location (follow user's description):
+  - Exact position: as given in the CRITICAL INSTRUCTION
+  - Alignment: centered, against wall, in corner, parallel to edge
+  - Spacing: distance from walls, other objects (30-50cm typical for furniture)
+  - Orientation: facing direction (toward door, window, camera, etc.)
+
+• Scale and proportion:
+  - Match object size to space size (not too large/small)
+  - Reference existing objects for realistic scale
+  - Typical sizes:
+    * Sofa: 180-240cm wide, 80-100cm deep, 80-90cm high
+    * Bed: 140-200cm wide, 200-220cm long, 50-60cm high
+    * Table: 120-180cm wide, 70-90cm deep, 70-75cm high
+    * Chair: 40-60cm wide, 40-50cm deep, 80-100cm high
+    * TV: 100-150cm wide, 5-10cm thick, 60-90cm high
+    * Person: 160-180cm tall, 40-50cm wide at shoulders
+
+• Perspective adjustment:
+  - Apply correct perspective distortion (objects farther = smaller)
+  - Align edges with scene's vanishing points
+  - Ensure vertical lines are vertical (unless intentional perspective)
+  - Match camera angle and viewing position
+
+STEP 4 - PERFECT INTEGRATION (Make it look REAL):
+• Ground contact (CRITICAL):
+  - Object MUST touch floor/ground naturally
+  - NO floating above surface (common AI error)
+  - NO sinking into surface (also common error)
+  - Contact points clear and stable
+  - If object has legs: each leg touches ground individually
+  - If flat base: entire base edge touches ground
+
+• Shadows (ESSENTIAL for realism):
+  - Cast shadow FROM object in direction OPPOSITE to light source
+  - Shadow length based on light angle (low sun = long shadow, overhead = short)
+  - Shadow softness: sharp edges for hard light, soft edges for diffused light
+  - Shadow darkness: darker near object, lighter further away
+  - Shadow on multiple surfaces: floor AND wall if near wall
+  - Ambient occlusion: darker area where object meets ground
+
+• Lighting match (MUST be perfect):
+  - Illuminate object from SAME direction as scene lighting
+  - Match light intensity: bright scene = bright object, dim scene = dim object
+  - Match color temperature: warm scene = warm light on object
+  - Highlight areas facing light source
+  - Shadow areas on opposite side from light
+  - Rim lighting if backlit
+  - Reflected light from surroundings (subtle bounce light)
+
+• Color and material integration:
+  - Match color grading of scene (warm, cool, neutral tone)
+  - Adjust saturation to match scene (don't oversaturate)
+  - Match contrast level with rest of image
+  - Apply same film look/filter as original scene
+  - If scene has specific style (vintage, modern, minimal): match it
+
+• Reflections (if applicable):
+  - Shiny floor: add reflection of object (wood, tile, marble)
+  - Glass/mirror nearby: show object in reflection
+  - Reflection intensity matches surface shininess
+  - Reflection follows perspective and is vertically flipped
+
+• Environmental effects:
+  - Depth of field: If background is blurred, blur object appropriately at that distance
+  - Air perspective: Slight haze for objects far from camera
+  - Lens effects: Vignetting, chromatic aberration if present in original
+  - Film grain: Match grain/noise level of original image
+
+STEP 5 - QUALITY ASSURANCE:
+☐ Object positioned exactly as user described
+☐ Scale proportional and realistic
+☐ Perspective matches scene perfectly
+☐ Ground contact natural and stable (NO floating/sinking)
+☐ Shadows present, realistic direction and softness
+☐ Lighting direction matches scene
+☐ Lighting intensity matches scene
+☐ Color temperature matches scene
+☐ Color grading consistent with scene
+☐ Reflections present if floor is shiny
+☐ NO visible seams or compositing artifacts
+☐ Object looks like it BELONGS in this scene
+☐ 8K photorealistic quality maintained
+
+FINAL VERIFICATION:
+The output should show the NEW object placed in the scene so naturally that it looks like it was ALWAYS THERE.
+A person viewing the image should NOT be able to tell that the object was added digitally.
+If there are ANY visual clues of editing (floating, wrong shadows, color mismatch, etc.) → This task has FAILED.
+
+EXAMPLES (This process works for placing):
+- Furniture: sofa, bed, table, chair, cabinet into rooms
+- People: person, child, group into any scene
+- Vehicles: car, bike into street, parking lot, garage
+- Electronics: TV, computer into room, desk
+- Decorations: plant, vase, artwork into room, outdoor
+- Animals: dog, cat into home, garden
+- ANY other object into ANY scene""",
+    request="""CRITICAL INSTRUCTION: Place the object from the second image {placement_description}.
+
+CONTEXT: The first image shows {context_description}."""
+)
+
+TEMPLATES: Dict[str, PromptTemplate] = {t.name: t for t in (REMOVAL_TEMPLATE, PLACEMENT_TEMPLATE)}
+_BY_INSTRUCTIONS: Dict[str, PromptTemplate] = {t.instructions: t for t in TEMPLATES.values()}
+
+
+def match_template(contents: List[types.Content]) -> Optional[PromptTemplate]:
+    """
+    Template whose instruction block is the first part of the request, if any.
+    """
+    if len(contents) != 1 or not contents[0].parts:
+        return None
+    first = contents[0].parts[0].text
+    return _BY_INSTRUCTIONS.get(first) if first is not None else None
+
+
+class PromptContextCache:
+    """
+    Per-key Gemini cached contents holding the templates' instruction blocks.
+
+    Features:
+    - One cached content per (API key, template), created on first use and refreshed
+      before its TTL runs out; requests never wait for a creation in progress
+    - Falls back to inline prompts when caching is off, the block is too small or
+      creation failed
+    - Counts static / variable / cached prompt tokens per template
+    - Thread-safe bookkeeping
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl_seconds: int = 3600,
+        min_tokens: int = 1024,
+        refresh_margin_seconds: int = 300
+    ):
+        """
+        Initialize prompt context cache.
+
+        Args:
+            enabled: Create and use cached contents (False = only count tokens)
+            ttl_seconds: Lifetime of each cached content
+            min_tokens: Instruction blocks below this size are always sent inline
+            refresh_margin_seconds: Recreate a cached content this long before it expires
+        """
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds // 2)
+
+        # (api_key, template name) -> {"name", "expires_at"} / {"pending": True} / {"failed_until"}
+        self.entries: Dict[Tuple[str, str], Dict] = {}
+        self.stats = {'cached_sends': 0, 'inline_sends': 0, 'created': 0, 'create_errors': 0, 'tokens_saved': 0}
+        self.lock = Lock()
+
+        if enabled:
+            logger.info(f"🧩 Prompt context caching on (ttl {ttl_seconds}s, min {min_tokens} tokens)")
+
+    def cacheable(self, template: PromptTemplate) -> bool:
+        return self.enabled and template.static_tokens >= self.min_tokens
+
+    async def prepare(
+        self,
+        client,
+        api_key: str,
+        model: str,
+        contents: List[types.Content],
+        config: types.GenerateContentConfig
+    ) -> Tuple[List[types.Content], types.GenerateContentConfig, Optional[Tuple[str, str]]]:
+        """
+        Swap a template's instruction block for its cached content on this key, if available.
+        Returns (contents, config, entry) - entry identifies the cached content used
+        (pass it to invalidate() if the call is rejected), None when sent inline.
+        """
+        template = match_template(contents)
+        if template is None:
+            return contents, config, None
+
+        variable_tokens = sum(estimate_tokens(p.text) for p in contents[0].parts[1:] if p.text)
+        PROMPT_TOKENS.inc(variable_tokens, template=template.name, part="variable")
+
+        cache_name = await self._cached_name(client, api_key, model, template) if self.cacheable(template) else None
+        if cache_name is None:
+            PROMPT_TOKENS.inc(template.static_tokens, template=template.name, part="static")
+            with self.lock:
+                self.stats['inline_sends'] += 1
+            return contents, config, None
+
+        PROMPT_TOKENS.inc(template.static_tokens, template=template.name, part="cached")
+        with self.lock:
+            self.stats['cached_sends'] += 1
+            self.stats['tokens_saved'] += template.static_tokens
+
+        stripped = [types.Content(role=contents[0].role, parts=contents[0].parts[1:])]
+        return stripped, config.model_copy(update={"cached_content": cache_name}), (api_key, template.name)
+
+    async def _cached_name(self, client, api_key: str, model: str, template: PromptTemplate) -> Optional[str]:
+        """
+        Name of a live cached content for (key, template), creating it if needed.
+        While a creation is in flight, other requests use the previous one or go inline.
+        """
+        entry_key = (api_key, template.name)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(entry_key) or {}
+            if entry.get("name") and entry["expires_at"] - self.refresh_margin_seconds > now:
+                return entry["name"]
+            if entry.get("pending") or entry.get("failed_until", 0) > now:
+                return entry["name"] if entry.get("name") and entry["expires_at"] > now else None
+            self.entries[entry_key] = {**entry, "pending": True}
+
+        try:
+            cached = await client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[types.Part(text=template.instructions)])],
+                    ttl=f"{self.ttl_seconds}s",
+                    display_name=f"visual-{template.name}"
+                )
+            )
+        except Exception as e:
+            with self.lock:
+                self.entries[entry_key] = {"failed_until": time.monotonic() + PROMPT_CACHE_RETRY_SECONDS}
+                self.stats['create_errors'] += 1
+            logger.warning(f"⚠️ Could not cache '{template.name}' prompt, sending it inline: {str(e)}")
+            return None
+        except BaseException:
+            # Cancelled mid-creation - drop the pending marker so a later request creates it
+            with self.lock:
+                if entry:
+                    self.entries[entry_key] = entry
+                else:
+                    self.entries.pop(entry_key, None)
+            raise
+
+        usage = cached.usage_metadata
+        with self.lock:
+            self.entries[entry_key] = {"name": cached.name, "expires_at": now + self.ttl_seconds}
+            self.stats['created'] += 1
+            if usage is not None and usage.total_token_count:
+                template.static_tokens = usage.total_token_count
+                template.tokens_counted = True
+        logger.info(f"🧩 Cached '{template.name}' prompt ({template.static_tokens} tokens) as {cached.name}")
+        return cached.name
+
+    def invalidate(self, entry: Tuple[str, str]):
+        """
+        Forget a cached content the API rejected (expired or deleted); the next call recreates it.
+        """
+        with self.lock:
+            self.entries.pop(entry, None)
+
+    def get_statistics(self) -> Dict:
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'templates': {
+                    name: {
+                        'static_tokens': t.static_tokens,
+                        'tokens_counted': t.tokens_counted,
+                        'cacheable': self.cacheable(t),
+                    }
+                    for name, t in TEMPLATES.items()
+                },
+                'live_caches': sum(1 for e in self.entries.values() if e.get("name")),
+                **self.stats,
+            }
+
+
+# Global prompt context cache (singleton pattern)
+_global_context_cache: Optional[PromptContextCache] = None
+
+
+def get_prompt_context_cache() -> PromptContextCache:
+    """
+    Get or create the global prompt context cache.
+
+    Environment:
+        PROMPT_CONTEXT_CACHE: true/false (default: false)
+        PROMPT_CACHE_TTL_SECONDS: cached content lifetime (default: 3600)
+        PROMPT_CACHE_MIN_TOKENS: smallest instruction block worth caching (default: 1024)
+    """
+    global _global_context_cache
+
+    if _global_context_cache is None:
+        enabled = os.getenv('PROMPT_CONTEXT_CACHE', 'false').strip().lower() in ('true', '1', 'yes')
+        if enabled and get_cassette_store() is not None:
+            logger.info("🧩 Prompt context caching disabled while a cassette mode is active")
+            enabled = False
+        _global_context_cache = PromptContextCache(
+            enabled=enabled,
+            ttl_seconds=int(os.getenv('PROMPT_CACHE_TTL_SECONDS', '3600')),
+            min_tokens=int(os.getenv('PROMPT_CACHE_MIN_TOKENS', '1024'))
+        )
+    return _global_context_cache
+
+
+def reset_prompt_context_cache():
+    """
+    Reset global prompt context cache (useful for testing or re-initialization).
+    """
+    global _global_context_cache
+    _global_context_cache = None
@@ -0,0 +1,325 @@
+# result_cache.py - Content-addressed disk cache for generated images
+
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from google.genai import types
+
+try:
+    import fcntl  # Cross-process eviction lock (POSIX)
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+}
+MIME_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+
+
+def make_cache_key(
+    contents: List[types.Content],
+    config: types.GenerateContentConfig,
+    model: str,
+    namespace: str = "result"
+) -> str:
+    """
+    Build a content address for a generation request.
+    Hashes the prompt text, every input image (mime type + bytes), the model and its config.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{namespace}\0{model}\0".encode('utf-8'))
+    digest.update(config.model_dump_json(exclude_none=True).encode('utf-8'))
+
+    for content in contents:
+        for part in content.parts or []:
+            if part.text is not None:
+                digest.update(b"\0text\0")
+                digest.update(part.text.encode('utf-8'))
+            elif part.inline_data is not None:
+                digest.update(b"\0blob\0")
+                digest.update((part.inline_data.mime_type or '').encode('utf-8'))
+                digest.update(hashlib.sha256(part.inline_data.data or b'').digest())
+
+    return digest.hexdigest()
+
+
+def make_removal_cache_key(
+    room_image: types.Part,
+    mask_coordinates: Optional[Dict],
+    removal_text: str,
+    model: str
+) -> str:
+    """
+    Build the address of an "emptied room" image produced by the removal step.
+    Keyed by the room image, the mask coordinates and the removal text - the inputs the
+    removal prompt is built from - so later placements on the same room can reuse it.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"removal\0{model}\0".encode('utf-8'))
+    digest.update(hashlib.sha256(room_image.inline_data.data or b'').digest())
+    digest.update(json.dumps(mask_coordinates, sort_keys=True).encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(removal_text.strip().lower().encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed cache of generated images, keyed by content hash.
+
+    Features:
+    - LRU eviction when the total stored size exceeds max_bytes
+    - TTL expiry measured from when an entry was written
+    - Atomic writes (temp file + rename), safe to share between processes
+    - Entries written by other processes are found on disk, and the size cap holds for
+      the directory as a whole (eviction scans it under a file lock; write time is the
+      file's mtime, last use its atime)
+    - Thread-safe operations
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        """
+        Initialize result cache.
+
+        Args:
+            cache_dir: Directory holding cached images
+            max_bytes: Maximum total size of cached images
+            ttl_seconds: Maximum age of an entry before it is treated as a miss
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (path, size, written_at), least recently used first
+        self.entries: "OrderedDict[str, Tuple[Path, int, float]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        self.lock = Lock()
+        self._enforce_limits()
+        if self.entries:
+            logger.info(f"📦 Result cache loaded: {len(self.entries)} entries, {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    def _lookup_disk(self, key: str) -> Optional[Tuple[Path, int, float]]:
+        """
+        Find an entry that is not in this process's index (e.g. written by another process).
+        """
+        for extension in MIME_TYPES:
+            path = self.cache_dir / f"{key}{extension}"
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            return path, stat.st_size, stat.st_mtime
+        return None
+
+    def get(self, key: str) -> Optional[types.Part]:
+        """
+        Return the cached image as a Part, or None on miss/expiry.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None:
+            entry = self._lookup_disk(key)
+            if entry is None:
+                with self.lock:
+                    self.stats['misses'] += 1
+                return None
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = entry
+                    self.total_bytes += entry[1]
+
+        path, size, written_at = entry
+        if time.time() - written_at > self.ttl_seconds:
+            with self.lock:
+                if key in self.entries:
+                    self._remove(key)
+                self.stats['misses'] += 1
+            return None
+
+        try:
+            data = path.read_bytes()
+            os.utime(path, (time.time(), written_at))  # Last use (atime) orders eviction in every process
+        except OSError:
+            # Removed by another process - drop from index
+            with self.lock:
+                if key in self.entries:
+                    self._remove(key, delete_file=False)
+                self.stats['misses'] += 1
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+        return types.Part(inline_data=types.Blob(mime_type=MIME_TYPES[path.suffix], data=data))
+
+    def put(self, key: str, image: types.Part):
+        """
+        Store a generated image. Non-image parts are ignored.
+        """
+        if not image.inline_data or not image.inline_data.data:
+            return
+
+        extension = EXTENSIONS.get(image.inline_data.mime_type, '.png')
+        path = self.cache_dir / f"{key}{extension}"
+        tmp_path = self.cache_dir / f".{key}.{os.getpid()}.{get_ident()}.tmp"
+
+        data = image.inline_data.data
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key, delete_file=False)
+            self.entries[key] = (path, len(data), time.time())
+            self.total_bytes += len(data)
+
+        self._enforce_limits()
+
+    def _remove(self, key: str, delete_file: bool = True):
+        """
+        Remove an entry (caller must hold the lock).
+        """
+        path, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        if delete_file:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    @contextmanager
+    def _directory_lock(self) -> Iterator[None]:
+        """
+        Serialize eviction with every other process (and thread) using the directory.
+        Without fcntl (Windows) only this process's threads are serialized.
+        """
+        if fcntl is None:
+            with self.lock:
+                yield
+            return
+
+        with open(self.cache_dir / ".lock", "a+b") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _scan(self) -> List[Tuple[float, float, str, Path, int]]:
+        """
+        (last_used, written_at, key, path, size) of every cached image in the directory.
+        """
+        found = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix not in MIME_TYPES:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Evicted by another process meanwhile
+            found.append((stat.st_atime, stat.st_mtime, path.stem, path, stat.st_size))
+        return found
+
+    def _enforce_limits(self):
+        """
+        Drop expired entries, then evict the least recently used ones until the whole
+        directory - entries of every process - is under max_bytes. Refreshes the index.
+        """
+        now = time.time()
+        kept = []
+        evicted = 0
+        with self._directory_lock():
+            found = sorted(self._scan())  # Least recently used first
+            total = sum(size for *_, size in found)
+            for last_used, written_at, key, path, size in found:
+                expired = now - written_at > self.ttl_seconds
+                if expired or total > self.max_bytes:
+                    path.unlink(missing_ok=True)
+                    total -= size
+                    evicted += not expired
+                else:
+                    kept.append((key, (path, size, written_at)))
+
+        with self.lock:
+            self.entries = OrderedDict(kept)
+            self.total_bytes = total
+            self.stats['evictions'] += evicted
+
+    def get_statistics(self) -> Dict:
+        """
+        Get cache statistics.
+        """
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'entries': len(self.entries),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'evictions': self.stats['evictions'],
+                'hit_rate': f"{self.stats['hits'] / lookups * 100:.1f}%" if lookups else "N/A",
+            }
+
+
+# Global cache instance (singleton pattern)
+_global_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Get or create the global result cache.
+    Returns None when disabled with RESULT_CACHE_ENABLED=false.
+
+    Environment:
+        RESULT_CACHE_DIR: cache directory (default: generated_images/.cache)
+        RESULT_CACHE_MAX_MB: total size limit in MB (default: 512)
+        RESULT_CACHE_TTL_HOURS: entry lifetime in hours (default: 168)
+    """
+    global _global_cache
+
+    if os.getenv('RESULT_CACHE_ENABLED', 'true').strip().lower() in ('false', '0', 'no'):
+        return None
+
+    if _global_cache is None:
+        _global_cache = ResultCache(
+            cache_dir=Path(os.getenv('RESULT_CACHE_DIR', 'generated_images/.cache')),
+            max_bytes=int(float(os.getenv('RESULT_CACHE_MAX_MB', '512')) * 1024 * 1024),
+            ttl_seconds=float(os.getenv('RESULT_CACHE_TTL_HOURS', '168')) * 3600
+        )
+
+    return _global_cache
+
+
+def reset_result_cache():
+    """
+    Reset global cache (useful for testing or re-initialization).
+    """
+    global _global_cache
+    _global_cache = None
@@ -0,0 +1,89 @@
+# conftest.py - Shared fixtures: repo modules on sys.path, fresh singletons, fake Gemini backend
+
+import sys
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from admission import reset_admission_controller
+from api_key_manager import GoogleAPIKeyManager, init_api_key_manager, reset_api_key_manager
+from cassette import reset_cassette_store
+from fake_gemini import FakeBackendConfig, FakeGeminiClient, make_fake_client_factory
+from hedging import reset_hedge_policy
+from prompt_templates import reset_prompt_context_cache
+from result_cache import reset_result_cache
+
+
+def _reset_singletons():
+    for reset in (reset_api_key_manager, reset_result_cache, reset_admission_controller,
+                  reset_hedge_policy, reset_prompt_context_cache, reset_cassette_store):
+        reset()
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(monkeypatch, tmp_path):
+    """
+    Every test starts from default settings with its own working directory.
+    Admission control, the result cache and cassettes are off unless a test turns them on.
+    """
+    for name in ("RESULT_CACHE_ENABLED", "ADMISSION_ENABLED", "CASSETTE_MODE", "HEDGE_TOOLS",
+                 "PROMPT_CONTEXT_CACHE", "PLACEMENT_SINGLE_PASS", "KEY_STATE_DB", "ARTIFACT_DURABILITY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "false")
+    monkeypatch.setenv("ADMISSION_ENABLED", "false")
+    monkeypatch.chdir(tmp_path)
+    _reset_singletons()
+    yield
+    _reset_singletons()
+
+
+@pytest.fixture
+def fake_backend():
+    """
+    Install a key manager on the fake backend: fake_backend(latency_seconds=..., keys=..., **manager_kwargs).
+    Returns the manager; the fake clients it built are collected in manager.fake_clients.
+    """
+    def install(
+        latency_seconds: float = 0.0,
+        keys: int = 1,
+        config: Optional[FakeBackendConfig] = None,
+        **manager_kwargs
+    ) -> GoogleAPIKeyManager:
+        clients: List[FakeGeminiClient] = []
+        config = config or FakeBackendConfig(latency_seconds=latency_seconds, distribution="fixed", seed=0)
+        manager_kwargs.setdefault("requests_per_minute", 0)
+        manager_kwargs.setdefault("images_per_day", 0)
+        manager = init_api_key_manager(
+            api_keys=[f"test-key-{i + 1}" for i in range(keys)],
+            client_factory=make_fake_client_factory(config=config, clients=clients),
+            **manager_kwargs
+        )
+        manager.fake_clients = clients
+        return manager
+
+    return install
+
+
+def make_image(size=(64, 48), color=(200, 120, 40), fmt="PNG") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def input_images(tmp_path) -> Dict[str, str]:
+    """
+    Two small input images on disk: a photo and a product shot.
+    """
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(make_image((96, 64), fmt="JPEG"))
+    product = tmp_path / "product.png"
+    product.write_bytes(make_image((48, 48), (20, 90, 200)))
+    return {"photo": str(photo), "product": str(product)}
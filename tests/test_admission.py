@@ -0,0 +1,36 @@
+# test_admission.py - Calls shed by admission control
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionRejected
+from tool_context import LocalToolContext
+from tools import VirtualTryOnInput, shed_as_error, virtual_tryon
+
+
+def tryon_input(input_images) -> VirtualTryOnInput:
+    return VirtualTryOnInput(
+        person_image_filename=input_images["photo"],
+        clothing_image_filename=input_images["product"],
+        clothing_type="shirt"
+    )
+
+
+@pytest.fixture
+def pool_in_cooldown(fake_backend, monkeypatch):
+    monkeypatch.setenv("ADMISSION_ENABLED", "true")
+    manager = fake_backend()
+    manager.mark_key_failed("test-key-1", RuntimeError("429 quota"))
+    return manager
+
+
+def test_tool_raises_when_shed(pool_in_cooldown, input_images, tmp_path):
+    with pytest.raises(AdmissionRejected):
+        asyncio.run(virtual_tryon(LocalToolContext(tmp_path / "out"), tryon_input(input_images)))
+
+
+def test_agent_tool_returns_the_rejection_as_an_error(pool_in_cooldown, input_images, tmp_path):
+    result = asyncio.run(shed_as_error(virtual_tryon)(LocalToolContext(tmp_path / "out"), tryon_input(input_images)))
+
+    assert result.startswith("❌ Server busy")
@@ -0,0 +1,65 @@
+# test_api_key_manager.py - Coroutines never block the event loop on the manager lock
+
+import time
+import asyncio
+import threading
+
+from api_key_manager import GoogleAPIKeyManager
+
+
+def hold_lock(manager: GoogleAPIKeyManager, seconds: float) -> threading.Thread:
+    """Hold the manager lock from another thread, like a sync caller would."""
+    held = threading.Event()
+
+    def run():
+        with manager.lock:
+            held.set()
+            time.sleep(seconds)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    held.wait()
+    return thread
+
+
+def test_pooled_client_lookup_skips_a_held_lock():
+    manager = GoogleAPIKeyManager(api_keys=["key-a"], client_factory=lambda key: object())
+    _, client = manager.get_client("key-a")
+
+    thread = hold_lock(manager, 0.5)
+    start = time.perf_counter()
+    _, pooled = asyncio.run(manager.get_client_async("key-a"))
+    elapsed = time.perf_counter() - start
+    thread.join()
+
+    assert pooled is client
+    assert elapsed < 0.1
+
+
+def test_capacity_waits_without_blocking_the_loop():
+    manager = GoogleAPIKeyManager(api_keys=["key-a"], client_factory=lambda key: object())
+
+    async def run():
+        gaps = []
+
+        async def ticker(stop: asyncio.Event):
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        stop = asyncio.Event()
+        ticking = asyncio.create_task(ticker(stop))
+        await asyncio.sleep(0.02)
+        thread = hold_lock(manager, 0.3)
+        capacity = await manager.get_capacity_async()
+        stop.set()
+        await ticking
+        thread.join()
+        return capacity, max(gaps)
+
+    capacity, longest_gap = asyncio.run(run())
+    assert capacity['available_keys'] == 1
+    assert longest_gap < 0.1
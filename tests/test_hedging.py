@@ -0,0 +1,45 @@
+# test_hedging.py - Hedges only spend budget when another key can take them
+
+import asyncio
+
+import pytest
+
+from hedging import HedgePolicy
+
+
+def run_slow_call(policy: HedgePolicy, manager) -> str:
+    async def slow_call(api_key: str) -> str:
+        await asyncio.sleep(0.2)
+        return api_key
+
+    return asyncio.run(policy.execute(manager, "op", slow_call))
+
+
+def make_policy() -> HedgePolicy:
+    policy = HedgePolicy(tools={"op"}, max_per_minute=5, min_samples=1)
+    policy.record_latency("op", 0.01)  # Hedge after 10 ms
+    return policy
+
+
+def test_no_hedge_without_a_free_key(fake_backend):
+    manager = fake_backend(keys=1)
+    policy = make_policy()
+
+    run_slow_call(policy, manager)
+
+    stats = policy.get_statistics()
+    assert stats['hedged'] == 0
+    assert stats['skipped_no_key'] == 1
+    assert policy.budget.available() == pytest.approx(5, abs=0.1)
+
+
+def test_hedge_runs_on_another_key(fake_backend):
+    manager = fake_backend(keys=2)
+    policy = make_policy()
+
+    run_slow_call(policy, manager)
+
+    stats = policy.get_statistics()
+    assert stats['hedged'] == 1
+    assert stats['skipped_no_key'] == 0
+    assert policy.budget.available() == pytest.approx(4, abs=0.1)
@@ -0,0 +1,51 @@
+# test_http_api.py - Responses of the HTTP API (binary and streamed)
+
+import json
+
+from fastapi.testclient import TestClient
+from google.genai import types
+
+import fake_gemini
+from conftest import make_image
+
+
+def test_stream_inlines_the_removal_image_before_it_is_written(fake_backend, monkeypatch):
+    monkeypatch.setenv("ARTIFACT_DURABILITY", "memory")
+    fake_backend()
+    import http_api
+
+    image = make_image(fmt="JPEG")
+    with TestClient(http_api.app) as client:
+        response = client.post(
+            "/v1/furniture-placement?stream=true",
+            files={"room_image": ("room.jpg", image), "furniture_image": ("sofa.jpg", image)},
+            data={"placement_description": "in the corner", "removal_prompt": "Remove the old sofa"}
+        )
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+    removal = next(event for event in events if event["event"] == "removal_ready")
+    assert removal["image_base64"]
+    assert removal["mime_type"] == "image/png"  # What the fake backend generated
+    assert "path" not in removal and "data" not in removal
+    assert events[-1]["event"] == "completed"
+
+
+def test_image_keeps_the_models_media_type(fake_backend, monkeypatch):
+    jpeg = make_image(fmt="JPEG")
+    monkeypatch.setattr(fake_gemini, "_image_chunk", lambda: types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=jpeg))])
+    )]))
+    fake_backend()
+    import http_api
+
+    image = make_image(fmt="JPEG")
+    with TestClient(http_api.app) as client:
+        response = client.post(
+            "/v1/virtual-tryon",
+            files={"person_image": ("person.jpg", image), "clothing_image": ("shirt.jpg", image)},
+            data={"clothing_type": "shirt"}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content == jpeg
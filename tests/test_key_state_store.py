@@ -0,0 +1,69 @@
+# test_key_state_store.py - Budgets and stats shared between processes through SQLite
+
+import asyncio
+
+import pytest
+
+from api_key_manager import GoogleAPIKeyManager, NoKeyCapacityError
+from key_state_store import SharedKeyStateStore, key_fingerprint
+
+
+def make_manager(db, keys, **kwargs) -> GoogleAPIKeyManager:
+    return GoogleAPIKeyManager(api_keys=keys, client_factory=lambda key: None, shared_state_path=str(db),
+                               selection_strategy="sticky", **kwargs)
+
+
+def test_take_tokens_is_all_or_nothing(tmp_path):
+    store = SharedKeyStateStore(tmp_path / "state.db")
+    limits = {"rpm": (5, 1e-9), "images": (1, 1e-9)}
+
+    assert store.take_tokens("fp", limits)
+    assert not store.take_tokens("fp", limits)  # images exhausted
+
+    store.sync(force=True)
+    assert store.bucket_level("fp", "rpm", 5, 1e-9) == pytest.approx(4)
+    store.close()
+
+
+def test_budget_holds_across_managers(tmp_path):
+    db = tmp_path / "state.db"
+    first = make_manager(db, ["key-a"], requests_per_minute=3)
+    second = make_manager(db, ["key-a"], requests_per_minute=3)
+
+    async def take_all(manager) -> int:
+        granted = 0
+        for _ in range(3):
+            try:
+                await manager.acquire_key(max_wait_seconds=0)
+                granted += 1
+            except NoKeyCapacityError:
+                pass
+        return granted
+
+    assert asyncio.run(take_all(first)) + asyncio.run(take_all(second)) == 3
+
+
+def test_acquire_moves_on_when_another_process_took_the_budget(tmp_path):
+    db = tmp_path / "state.db"
+    manager = make_manager(db, ["key-a", "key-b"], requests_per_minute=1)
+    other = make_manager(db, ["key-a"], requests_per_minute=1)
+
+    manager.shared_state.sync(force=True)
+    manager.shared_state.sync_interval_seconds = 3600  # Cached view goes stale
+    assert asyncio.run(other.acquire_key(max_wait_seconds=0)) == "key-a"
+
+    assert asyncio.run(manager.acquire_key(max_wait_seconds=0)) == "key-b"
+
+
+def test_call_outcomes_reach_the_shared_counters(tmp_path):
+    manager = make_manager(tmp_path / "state.db", ["key-a"])
+
+    async def call():
+        async with manager.lease():
+            pass
+
+    asyncio.run(call())
+
+    details = manager.get_statistics()["key_details"]
+    assert details[manager._get_key_id("key-a")]["total_requests"] == 1
+    assert key_fingerprint("key-a") in manager.shared_state.get_stats()
@@ -0,0 +1,36 @@
+# test_memory.py - Per-request memory of in-memory uploads vs a read-into-bytes copy
+
+import asyncio
+import tracemalloc
+from io import BytesIO
+
+from PIL import Image
+
+from benchmark import measure_request_memory
+
+
+def noisy_jpeg(size) -> bytes:
+    buffer = BytesIO()
+    Image.effect_noise(size, 30).convert("RGB").save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_in_memory_uploads_peak_below_copy(fake_backend, tmp_path):
+    fake_backend()
+    uploads = [("person.jpg", noisy_jpeg((1600, 1200))), ("shirt.jpg", noisy_jpeg((1200, 1200)))]
+
+    async def measure():
+        await measure_request_memory("in_memory", uploads, tmp_path, -1)  # Warm-up (imports, caches)
+        copy = await measure_request_memory("copy", uploads, tmp_path, 0)
+        in_memory = await measure_request_memory("in_memory", uploads, tmp_path, 1)
+        return copy, in_memory
+
+    tracemalloc.start()
+    try:
+        copy, in_memory = asyncio.run(measure())
+    finally:
+        tracemalloc.stop()
+
+    assert copy["ok"] and in_memory["ok"]
+    smallest_input = min(len(data) for _, data in uploads)
+    assert in_memory["peak_bytes"] + smallest_input <= copy["peak_bytes"]
@@ -0,0 +1,40 @@
+# test_progress.py - Progress events reported by the tools
+
+import asyncio
+import logging
+
+from tool_context import LocalToolContext
+from tools import RemoveAndPlaceObjectInput, remove_and_place_object
+
+
+def place(context: LocalToolContext, input_images) -> str:
+    return asyncio.run(remove_and_place_object(context, RemoveAndPlaceObjectInput(
+        room_image_filename=input_images["photo"],
+        furniture_image_filename=input_images["product"],
+        removal_prompt="Remove the old sofa",
+        placement_description="in the corner"
+    )))
+
+
+def test_removal_preview_carries_its_image(fake_backend, input_images, tmp_path):
+    fake_backend()
+    events = []
+
+    assert place(LocalToolContext(tmp_path / "out", progress_callback=events.append), input_images).startswith("✅")
+
+    removal = next(event for event in events if event["event"] == "removal_ready")
+    assert removal["data"] and removal["mime_type"] == "image/png"
+
+
+def test_failed_removal_preview_is_logged_and_skipped(fake_backend, input_images, tmp_path, monkeypatch, caplog):
+    fake_backend()
+
+    async def failing_save(self, filename, artifact):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(LocalToolContext, "save_artifact", failing_save)
+    with caplog.at_level(logging.WARNING, logger="tools"):
+        result = place(LocalToolContext(tmp_path / "out"), input_images)
+
+    assert result.startswith("✅")
+    assert "Could not save/emit removal preview: disk full" in caplog.text
@@ -0,0 +1,55 @@
+# test_prompt_context_cache.py - Cached prompt blocks: stale cache fallback and cancelled creations
+
+import asyncio
+
+from prompt_templates import TEMPLATES, PromptContextCache, get_prompt_context_cache
+from tool_context import LocalToolContext
+from tools import RemoveAndPlaceObjectInput, remove_and_place_object
+
+
+def test_rejected_cached_prompt_is_resent_inline(fake_backend, input_images, tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPT_CONTEXT_CACHE", "true")
+    manager = fake_backend()
+
+    def place() -> str:
+        return asyncio.run(remove_and_place_object(LocalToolContext(tmp_path / "out"), RemoveAndPlaceObjectInput(
+            room_image_filename=input_images["photo"],
+            furniture_image_filename=input_images["product"],
+            placement_description="in the corner"
+        )))
+
+    assert place().startswith("✅")
+    models = manager.fake_clients[0].aio.models
+    assert models.cached_calls > 0
+
+    # Cached contents expired server-side: the 404 arrives on the first stream iteration
+    manager.fake_clients[0].aio.caches.names.clear()
+    calls, cached_calls = models.calls, models.cached_calls
+    assert place().startswith("✅")
+    assert models.cached_calls == cached_calls
+    # Rejected cached placement, then the same placement resent inline
+    assert models.calls - calls == 2
+    assert ("test-key-1", "placement") not in get_prompt_context_cache().entries
+
+
+def test_cancelled_creation_does_not_stay_pending():
+    cache = PromptContextCache(enabled=True, min_tokens=1)
+    started = asyncio.Event()
+
+    class HangingCaches:
+        async def create(self, model, config=None):
+            started.set()
+            await asyncio.sleep(3600)
+
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {})()
+    client.aio.caches = HangingCaches()
+
+    async def run():
+        task = asyncio.create_task(cache._cached_name(client, "key-a", "model", TEMPLATES["placement"]))
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert ("key-a", "placement") not in cache.entries
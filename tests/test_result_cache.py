@@ -0,0 +1,66 @@
+# test_result_cache.py - Result cache shared by several processes on one directory
+
+import os
+import time
+
+from google.genai import types
+
+from result_cache import ResultCache
+
+
+def image_part(size: int) -> types.Part:
+    return types.Part(inline_data=types.Blob(mime_type="image/png", data=b"\x89PNG" + b"\0" * (size - 4)))
+
+
+def test_entry_written_elsewhere_is_a_hit(tmp_path):
+    writer = ResultCache(tmp_path, max_bytes=10_000, ttl_seconds=3600)
+    reader = ResultCache(tmp_path, max_bytes=10_000, ttl_seconds=3600)
+
+    writer.put("key", image_part(100))
+
+    part = reader.get("key")
+    assert part is not None and len(part.inline_data.data) == 100
+    assert reader.get_statistics()["hits"] == 1
+
+
+def test_size_cap_holds_across_processes(tmp_path):
+    first = ResultCache(tmp_path, max_bytes=1000, ttl_seconds=3600)
+    second = ResultCache(tmp_path, max_bytes=1000, ttl_seconds=3600)
+
+    for index in range(3):
+        first.put(f"first-{index}", image_part(300))
+        second.put(f"second-{index}", image_part(300))
+
+    stored = sum(path.stat().st_size for path in tmp_path.glob("*.png"))
+    assert stored <= 1000
+
+
+def test_eviction_follows_use_in_other_processes(tmp_path):
+    writer = ResultCache(tmp_path, max_bytes=700, ttl_seconds=3600)
+    reader = ResultCache(tmp_path, max_bytes=700, ttl_seconds=3600)
+
+    writer.put("old", image_part(300))
+    time.sleep(0.01)
+    writer.put("newer", image_part(300))
+    time.sleep(0.01)
+    assert reader.get("old") is not None  # Used more recently than "newer"
+    time.sleep(0.01)
+    writer.put("newest", image_part(300))
+
+    assert writer.get("old") is not None
+    assert writer.get("newer") is None
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path, max_bytes=10_000, ttl_seconds=3600)
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    try:
+        cache.put("key", image_part(100))
+    except OSError:
+        pass
+
+    assert list(tmp_path.iterdir()) in ([], [tmp_path / ".lock"])
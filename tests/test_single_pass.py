@@ -0,0 +1,78 @@
+# test_single_pass.py - Single-pass replacement results are cached only after they pass the check
+
+import asyncio
+
+from google.genai import types
+
+from fake_gemini import FakeBackendConfig, FakeGeminiClient
+from tool_context import LocalToolContext
+from tools import RemoveAndPlaceObjectInput, _parse_mask, build_replace_prompt, remove_and_place_object
+
+
+def install_backend(fake_backend, corrupt_single_pass: bool):
+    """Fake backend counting single-pass calls; optionally answering them with an undecodable image."""
+    single_pass_calls = []
+    manager = fake_backend()
+
+    def client_factory(key: str) -> FakeGeminiClient:
+        client = FakeGeminiClient(key, FakeBackendConfig(latency_seconds=0.0, distribution="fixed", seed=0))
+        generate = client.aio.models.generate_content_stream
+
+        async def generate_content_stream(model, contents, config=None):
+            if "in one step" in (contents[0].parts[0].text or ""):
+                single_pass_calls.append(model)
+                if corrupt_single_pass:
+                    async def corrupt():
+                        yield types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(
+                            role="model",
+                            parts=[types.Part(inline_data=types.Blob(mime_type="image/png", data=b"\x89PNG broken"))]
+                        ))])
+                    return corrupt()
+            return await generate(model=model, contents=contents, config=config)
+
+        client.aio.models.generate_content_stream = generate_content_stream
+        return client
+
+    manager.client_factory = client_factory
+    return single_pass_calls
+
+
+def replace(input_images, tmp_path) -> str:
+    return asyncio.run(remove_and_place_object(LocalToolContext(tmp_path / "out"), RemoveAndPlaceObjectInput(
+        room_image_filename=input_images["photo"],
+        furniture_image_filename=input_images["product"],
+        removal_prompt="Remove the old sofa",
+        placement_description="against the wall"
+    )))
+
+
+def test_rejected_single_pass_result_is_not_cached(fake_backend, input_images, tmp_path, monkeypatch):
+    monkeypatch.setenv("PLACEMENT_SINGLE_PASS", "true")
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "true")
+    single_pass_calls = install_backend(fake_backend, corrupt_single_pass=True)
+
+    assert replace(input_images, tmp_path).startswith("✅")  # Fell back to two passes
+    assert replace(input_images, tmp_path).startswith("✅")
+
+    # The broken result was not served from the cache - the single pass ran again
+    assert len(single_pass_calls) == 2
+
+
+def test_accepted_single_pass_result_is_cached(fake_backend, input_images, tmp_path, monkeypatch):
+    monkeypatch.setenv("PLACEMENT_SINGLE_PASS", "true")
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "true")
+    single_pass_calls = install_backend(fake_backend, corrupt_single_pass=False)
+
+    assert replace(input_images, tmp_path).startswith("✅")
+    assert replace(input_images, tmp_path).startswith("✅")
+
+    assert len(single_pass_calls) == 1
+
+
+def test_mask_parsing_is_shared_by_both_paths():
+    box = {"x": 10, "y": 20, "width": 30, "height": 40}
+
+    assert _parse_mask('{"x": 10, "y": 20, "width": 30, "height": 40}') == box
+    assert _parse_mask('{"x": 10, "y": 20}') is None
+    assert _parse_mask("{}") is None and _parse_mask("") is None
+    assert "x=10, y=20, width=30, height=40" in build_replace_prompt("sofa", box, "in the corner")
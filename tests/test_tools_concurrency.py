@@ -0,0 +1,33 @@
+# test_tools_concurrency.py - Image tools must not block the event loop while the model works
+
+import time
+import asyncio
+
+from tool_context import LocalToolContext
+from tools import VirtualTryOnInput, virtual_tryon
+
+LATENCY_SECONDS = 0.5
+CALLS = 20
+
+
+def test_concurrent_tryons_overlap(fake_backend, input_images, tmp_path):
+    fake_backend(latency_seconds=LATENCY_SECONDS, max_concurrent_per_key=0)
+
+    async def one_call(index: int) -> str:
+        return await virtual_tryon(LocalToolContext(tmp_path / "out"), VirtualTryOnInput(
+            person_image_filename=input_images["photo"],
+            clothing_image_filename=input_images["product"],
+            clothing_type="shirt",
+            asset_name=f"tryon_{index}"
+        ))
+
+    async def run_all():
+        return await asyncio.gather(*(one_call(i) for i in range(CALLS)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    wall = time.perf_counter() - start
+
+    assert all(result.startswith("✅") for result in results), results
+    # Serialized calls would take CALLS x LATENCY_SECONDS (10s); overlapping ones about one latency
+    assert wall < LATENCY_SECONDS * 3, f"{CALLS} calls took {wall:.2f}s"
@@ -0,0 +1,168 @@
+# tool_context.py - File-based ToolContext shared by the Streamlit app and batch runner
+#
+# Input images are never copied on their way to the tools: uploads can be handed over in
+# memory (no temp file), and files on disk are memory-mapped.
+#
+# File reads and writes run in worker threads, so a slow disk does not stall the event loop.
+# ARTIFACT_DURABILITY (fsync / flush / memory, see artifact_store.py) sets how long a save
+# waits for the disk.
+
+import mmap
+import asyncio
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from google.adk.tools import ToolContext
+from google.genai import types
+
+# Support both relative and absolute imports
+try:
+    from .artifact_store import Artifact, get_artifact_durability, get_artifact_store, write_atomic
+    from .image_preprocessing import ImageBuffer, as_bytes
+    from .tracing import span
+except ImportError:
+    from artifact_store import Artifact, get_artifact_durability, get_artifact_store, write_atomic
+    from image_preprocessing import ImageBuffer, as_bytes
+    from tracing import span
+
+logger = logging.getLogger(__name__)
+
+INPUT_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp'
+}
+
+
+class LocalToolContext(ToolContext):
+    """ToolContext implementation backed by the local filesystem"""
+    
+    def __init__(
+        self,
+        output_dir: Path,
+        request_id: Optional[str] = None,
+        progress_callback: Optional[Callable[[Dict], None]] = None,
+        priority: str = "interactive",
+        namespace: Optional[str] = None,
+        uploads: Optional[Dict[str, ImageBuffer]] = None,
+        durability: Optional[str] = None
+    ):
+        self.output_dir = output_dir
+        self.durability = durability or get_artifact_durability()  # fsync, flush or memory
+        self.uploads = dict(uploads or {})  # In-memory input images by filename (checked before the disk)
+        self.namespace = namespace  # Per-session sub-directory of output_dir (None = output_dir itself)
+        self.request_id = request_id or uuid.uuid4().hex[:16]  # Labels this request's trace
+        self.priority = priority  # Admission priority: "interactive" or "batch"
+        self.progress_callback = progress_callback  # Receives the tools' progress events
+        self.started_at = time.perf_counter()
+        self.store = get_artifact_store(output_dir)
+        self.artifact_dir = self.store.namespace_dir(namespace)
+        self.saved_artifacts: List[Path] = []  # Paths written by save_artifact / save_version, in order
+        self.spills: List[Future] = []  # Background writes pending in "memory" durability
+    
+    @contextmanager
+    def open_artifact(self, filename: str) -> Iterator[Tuple[ImageBuffer, str]]:
+        """
+        Yield (buffer, mime_type) of an input image without copying it: the caller's buffer
+        for in-memory uploads, a read-only memory map for files on disk (unmapped on exit).
+        """
+        mime_type = INPUT_MIME_TYPES.get(Path(filename).suffix.lower(), 'image/jpeg')
+        if filename in self.uploads:
+            yield self.uploads[filename], mime_type
+            return
+        
+        file_path = Path(filename)
+        if not file_path.is_absolute():
+            file_path = self.output_dir.parent / filename
+        
+        if not file_path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        with open(file_path, 'rb') as f:
+            if file_path.stat().st_size == 0:
+                yield b"", mime_type  # Empty files cannot be mapped
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped, mime_type
+    
+    def read_artifact(self, filename: str) -> Tuple[bytes, str]:
+        """Blocking read of an input image as (bytes, mime_type) - uploads are not copied"""
+        with self.open_artifact(filename) as (buffer, mime_type):
+            return as_bytes(buffer), mime_type
+    
+    async def load_artifact(self, filename: str):
+        """Load image as a Part (in-memory uploads are passed through without a copy)"""
+        with span("load_artifact", filename=Path(filename).name) as load_span:
+            if filename in self.uploads:
+                image_data, mime_type = self.read_artifact(filename)
+            else:
+                image_data, mime_type = await asyncio.to_thread(self.read_artifact, filename)
+            load_span.set(bytes=len(image_data))
+        
+        return types.Part(
+            inline_data=types.Blob(
+                mime_type=mime_type,
+                data=image_data
+            )
+        )
+    
+    def emit_progress(self, event: str, **data):
+        """
+        Report a progress event (stage_started / stage_finished / removal_ready / final_ready)
+        to progress_callback. Callback errors are logged, never raised into the tool.
+        """
+        if self.progress_callback is None:
+            return
+        
+        payload = {"event": event, "elapsed_ms": round((time.perf_counter() - self.started_at) * 1000, 1), **data}
+        try:
+            self.progress_callback(payload)
+        except Exception as e:
+            logger.warning(f"⚠️ Progress callback failed: {e}")
+    
+    async def save_artifact(self, filename: str, artifact):
+        """Save image under a fixed filename in this context's namespace (replaced atomically)"""
+        if not (hasattr(artifact, 'inline_data') and artifact.inline_data and artifact.inline_data.data):
+            raise ValueError("Artifact does not contain inline_data")
+        
+        data = artifact.inline_data.data
+        output_path = self.artifact_dir / filename
+        with span("save_artifact", filename=filename, bytes=len(data), durability=self.durability):
+            if self.durability == "memory":
+                self.spills.append(self.store.spill(output_path, data))
+            else:
+                await asyncio.to_thread(write_atomic, output_path, data, self.durability == "fsync")
+        self.saved_artifacts.append(output_path)
+        return output_path
+    
+    async def save_version(self, name: str, artifact) -> Artifact:
+        """Save generated image as the next version of `name` and return its handle"""
+        if not (hasattr(artifact, 'inline_data') and artifact.inline_data and artifact.inline_data.data):
+            raise ValueError("Artifact does not contain inline_data")
+        
+        data = artifact.inline_data.data
+        with span("save_version", asset=name, bytes=len(data), durability=self.durability) as save_span:
+            saved = await asyncio.to_thread(
+                self.store.save_version, self.namespace, name, data,
+                artifact.inline_data.mime_type or "image/png", self.durability
+            )
+            save_span.set(version=saved.version)
+        if saved.spill is not None:
+            self.spills.append(saved.spill)
+        self.saved_artifacts.append(saved.path)
+        return saved
+    
+    async def wait_for_spills(self) -> int:
+        """
+        Wait until this context's background writes ("memory" durability) are on disk.
+        Returns the number that failed (each is logged by the store).
+        """
+        spills, self.spills = self.spills, []
+        results = await asyncio.gather(*(asyncio.wrap_future(s) for s in spills), return_exceptions=True)
+        return sum(1 for r in results if isinstance(r, BaseException))
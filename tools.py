@@ -1,27 +1,419 @@
 # tools.py - VisualAgent tools only (Furniture Placement + Virtual Try-On)
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from google.adk.tools import ToolContext
 from pydantic import BaseModel, Field
+import asyncio
+import functools
 import json
-from typing import Optional
+import logging
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from io import BytesIO
+from typing import Optional, List, Tuple
+
+from PIL import Image
 
 # Support both relative and absolute imports
 try:
     from .api_key_manager import get_api_key_manager
+    from .image_preprocessing import ImagePreprocessConfig, get_preprocess_config, normalize_image_data
+    from .result_cache import get_result_cache, make_cache_key, make_removal_cache_key
+    from .metrics import CACHE_LOOKUPS, SINGLE_PASS_RESULTS, STAGE_LATENCY, TOOL_LATENCY
+    from .tracing import span, trace
+    from .cassette import open_model_stream
+    from .hedging import get_hedge_policy
+    from .prompt_templates import PLACEMENT_TEMPLATE, REMOVAL_TEMPLATE, get_prompt_context_cache
+    from .admission import AdmissionRejected, get_admission_controller
+    from .artifact_store import ArtifactResult
 except ImportError:
     from api_key_manager import get_api_key_manager
+    from image_preprocessing import ImagePreprocessConfig, get_preprocess_config, normalize_image_data
+    from result_cache import get_result_cache, make_cache_key, make_removal_cache_key
+    from metrics import CACHE_LOOKUPS, SINGLE_PASS_RESULTS, STAGE_LATENCY, TOOL_LATENCY
+    from tracing import span, trace
+    from cassette import open_model_stream
+    from hedging import get_hedge_policy
+    from prompt_templates import PLACEMENT_TEMPLATE, REMOVAL_TEMPLATE, get_prompt_context_cache
+    from admission import AdmissionRejected, get_admission_controller
+    from artifact_store import ArtifactResult
+
+logger = logging.getLogger(__name__)
 
 # === API KEY HELPER ===
 def get_genai_client() -> genai.Client:
     """
     Get Google Genai Client with current API key from manager.
     Automatically uses rotation/failover system.
+    Clients are pooled per key by the manager and reused across calls.
+    """
+    manager = get_api_key_manager()
+    _, client = manager.get_client()
+    return client
+
+# === ADMISSION CONTROL ===
+def admission_controlled(tool_name: str):
+    """
+    Run a tool only once admission control grants a slot (priority from the context's
+    `priority`, default interactive). Raises admission.AdmissionRejected when shed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            controller = get_admission_controller()
+            if controller is None:
+                return await func(*args, **kwargs)
+            
+            tool_context = args[0] if args else kwargs.get("tool_context")
+            async with controller.admit(tool_name, getattr(tool_context, "priority", "interactive")) as waited:
+                if waited > 0:
+                    emit_progress(tool_context, "admitted", tool=tool_name, queue_wait_ms=round(waited * 1000, 1))
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def shed_as_error(func):
+    """
+    Tool boundary for callers that only understand result strings (the ADK agent):
+    a call shed by admission control returns a "❌ Server busy ..." message instead of
+    raising AdmissionRejected. Callers that turn the rejection into a retry-after
+    (HTTP API, Streamlit app, batch runner) call the tools directly.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except AdmissionRejected as e:
+            return f"❌ {e}"
+    return wrapper
+
+# === INSTRUMENTATION HELPERS ===
+def instrument_tool(tool_name: str):
+    """
+    Trace a tool call (root span, labelled with the context's request_id) and record
+    its end-to-end latency, labelled ok/error from its result message.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            tool_context = args[0] if args else kwargs.get("tool_context")
+            start = time.perf_counter()
+            status = "error"
+            with trace(tool_name, request_id=getattr(tool_context, "request_id", None)) as tool_span:
+                try:
+                    result = await func(*args, **kwargs)
+                    if isinstance(result, str) and result.startswith("✅"):
+                        status = "ok"
+                    return result
+                finally:
+                    tool_span.set(status=status)
+                    TOOL_LATENCY.observe(time.perf_counter() - start, tool=tool_name, status=status)
+        return wrapper
+    return decorator
+
+@contextmanager
+def tool_stage(tool_name: str, stage_name: str, tool_context: Optional[ToolContext] = None, **attrs):
+    """
+    Time one stage of a tool: stage latency histogram + trace span (yielded for attributes),
+    plus stage_started / stage_finished progress events on the tool context.
+    """
+    emit_progress(tool_context, "stage_started", tool=tool_name, stage=stage_name)
+    start = time.perf_counter()
+    with STAGE_LATENCY.time(tool=tool_name, stage=stage_name), span(stage_name, **attrs) as stage_span:
+        yield stage_span
+    emit_progress(tool_context, "stage_finished", tool=tool_name, stage=stage_name,
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+def emit_progress(tool_context: Optional[ToolContext], event: str, **data):
+    """
+    Send a progress event if the context supports them (LocalToolContext.emit_progress).
+    """
+    emit = getattr(tool_context, "emit_progress", None)
+    if emit is not None:
+        emit(event, **data)
+
+def _image_bytes(*parts: Optional[types.Part]) -> int:
+    return sum(len(p.inline_data.data or b"") for p in parts if p is not None and p.inline_data)
+
+# === INPUT IMAGES ===
+@asynccontextmanager
+async def _open_input_image(tool_context: ToolContext, filename: str):
+    """
+    (buffer, mime_type) of an input image. LocalToolContext hands over the upload buffer or a
+    memory map of the file (no copy); other contexts (ADK) load a Part.
+    """
+    if hasattr(tool_context, "open_artifact"):
+        opened = tool_context.open_artifact(filename)
+        source = await asyncio.to_thread(opened.__enter__)  # Open + map off the event loop
+        try:
+            yield source
+        finally:
+            opened.__exit__(None, None, None)
+    else:
+        part = await tool_context.load_artifact(filename)
+        yield part.inline_data.data, part.inline_data.mime_type
+
+async def load_input_images(
+    tool_context: ToolContext,
+    tool_name: str,
+    filenames: List[str],
+    preprocess: ImagePreprocessConfig
+) -> List[types.Part]:
+    """
+    Load and normalize a tool's input images ("load" and "preprocess" stages).
+    Preprocessing decodes straight from the upload buffers / memory-mapped files, so the raw
+    images are not copied into new bytes objects on their way to the model.
+    """
+    async with AsyncExitStack() as sources:
+        with tool_stage(tool_name, "load", tool_context) as stage_span:
+            buffers = [await sources.enter_async_context(_open_input_image(tool_context, f)) for f in filenames]
+            bytes_in = sum(len(buffer) for buffer, _ in buffers)
+            stage_span.set(bytes=bytes_in)
+        
+        with tool_stage(tool_name, "preprocess", tool_context, bytes_in=bytes_in) as stage_span:
+            parts = await asyncio.gather(*(
+                normalize_image_data(buffer, mime_type, preprocess) for buffer, mime_type in buffers
+            ))
+            stage_span.set(bytes_out=_image_bytes(*parts))
+    return list(parts)
+
+# === IMAGE GENERATION HELPER ===
+IMAGE_MODEL = "gemini-2.5-flash-image"
+
+async def _cache_put(cache, key: str, image_part: types.Part, label: str):
+    """
+    Store an image in the result cache off the event loop. Write failures are logged, never raised.
+    """
+    try:
+        await asyncio.to_thread(cache.put, key, image_part)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not cache {label}: {e}")
+
+async def generate_image(
+    contents: List[types.Content],
+    config: types.GenerateContentConfig,
+    use_cache: bool = False,
+    operation: Optional[str] = None
+) -> Tuple[Optional[types.Part], int]:
+    """
+    Run one image generation through the key manager's failover path.
+    Quota/auth/server errors are retried on other keys with jittered backoff;
+    other errors propagate to the caller.
+    With use_cache, identical requests (same images, prompt, model and config)
+    are served from the result cache without calling the model.
+    operation ("tool" or "tool.stage") groups latencies for request hedging -
+    calls of tools listed in HEDGE_TOOLS are hedged (see hedging.py).
+    Returns (image_part, chunk_count) - image_part is None if no image was produced,
+    chunk_count is 0 for cache hits.
     """
+    cache = get_result_cache() if use_cache else None
+    if cache is not None:
+        with span("result_cache_lookup") as lookup_span:
+            cache_key = make_cache_key(contents, config, IMAGE_MODEL)
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            lookup_span.set(hit=cached is not None)
+        CACHE_LOOKUPS.inc(cache="result", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached, 0
+    
     manager = get_api_key_manager()
-    current_key = manager.get_current_key()
-    return genai.Client(api_key=current_key)
+    image_part, chunk_count = await get_hedge_policy().execute(manager, operation, _stream_image, contents, config)
+    
+    if cache is not None and image_part is not None:
+        await _cache_put(cache, cache_key, image_part, "result")
+    
+    return image_part, chunk_count
+
+async def _close_stream(stream):
+    """
+    Stop reading a model stream and release its connection.
+    """
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+async def _open_stream(client, contents: List[types.Content], config: types.GenerateContentConfig):
+    """
+    Open a model stream and pull its first chunk. Returns (stream, first_chunk or None if empty).
+    The SDK only sends the request on the first iteration, so request errors (429, a rejected
+    cached content) are raised here; the stream is closed first.
+    """
+    stream = await open_model_stream(client, IMAGE_MODEL, contents, config)
+    try:
+        return stream, await anext(stream, None)
+    except BaseException:
+        await _close_stream(stream)
+        raise
+
+async def _stream_image(
+    contents: List[types.Content],
+    config: types.GenerateContentConfig,
+    api_key: str
+) -> Tuple[Optional[types.Part], int]:
+    """
+    Stream an image generation through the async genai surface (client.aio).
+    Returns (image_part, chunk_count) as soon as the first inline_data part arrives,
+    or (None, chunk_count) if the stream ends without an image.
+    The event loop stays free while waiting for the model.
+    """
+    manager = get_api_key_manager()
+    _, client = await manager.get_client_async(api_key)
+    
+    input_bytes = sum(_image_bytes(*(content.parts or [])) for content in contents)
+    with span("model_call", key=manager._get_key_id(api_key), model=IMAGE_MODEL, input_bytes=input_bytes) as call_span:
+        start = time.perf_counter()
+        chunk_count = 0
+        # Template instruction blocks come from this key's cached content when PROMPT_CONTEXT_CACHE is on
+        context_cache = get_prompt_context_cache()
+        sent_contents, sent_config, cache_entry = await context_cache.prepare(client, api_key, IMAGE_MODEL, contents, config)
+        call_span.set(prompt_cached=cache_entry is not None)
+        # Live call, or recorded / replayed when CASSETTE_MODE is set
+        try:
+            stream, chunk = await _open_stream(client, sent_contents, sent_config)
+        except errors.ClientError as e:
+            if cache_entry is None or e.code == 429:
+                raise
+            # Cached content expired or was deleted - forget it and send the full prompt
+            context_cache.invalidate(cache_entry)
+            call_span.event("prompt_cache_rejected", code=e.code)
+            logger.warning(f"⚠️ Cached prompt rejected ({e.code}), sending it inline")
+            stream, chunk = await _open_stream(client, contents, config)
+        try:
+            while chunk is not None:
+                chunk_count += 1
+                if chunk_count == 1:
+                    call_span.set(first_chunk_ms=round((time.perf_counter() - start) * 1000, 1))
+                try:
+                    # Safe check for chunk structure
+                    if chunk.candidates and len(chunk.candidates) > 0:
+                        candidate = chunk.candidates[0]
+                        if candidate.content and candidate.content.parts:
+                            for part in candidate.content.parts:
+                                if part.inline_data:
+                                    image = types.Part(inline_data=part.inline_data)
+                                    call_span.set(chunks=chunk_count, output_bytes=_image_bytes(image))
+                                    return image, chunk_count
+                except AttributeError as e:
+                    # Continue - some chunks may not have expected structure
+                    call_span.event("chunk_structure_issue", chunk=chunk_count, error=str(e))
+                    logger.warning(f"⚠️ Chunk {chunk_count} structure issue: {str(e)}")
+                chunk = await anext(stream, None)
+        finally:
+            # Stop reading the rest of the stream and release the connection
+            await _close_stream(stream)
+        
+        call_span.set(chunks=chunk_count, output_bytes=0)
+        return None, chunk_count
+
+# === SINGLE-PASS REPLACEMENT ===
+def single_pass_enabled() -> bool:
+    """
+    Opt-in (PLACEMENT_SINGLE_PASS=true): replacements remove and place in one generation.
+    """
+    return os.getenv("PLACEMENT_SINGLE_PASS", "false").strip().lower() in ("true", "1", "yes")
+
+def _parse_mask(mask_coordinates: str) -> Optional[dict]:
+    """
+    Removal box {"x", "y", "width", "height"} from the mask_coordinates JSON,
+    or None when it is empty or incomplete (the removal is then described in text).
+    """
+    coords = json.loads(mask_coordinates) if mask_coordinates and mask_coordinates != "{}" else None
+    if coords and all(k in coords for k in ['x', 'y', 'width', 'height']):
+        return coords
+    return None
+
+def _describe_box(coords: dict) -> str:
+    """
+    Prompt text locating a removal box.
+    """
+    return f"the object at coordinates x={coords['x']}, y={coords['y']}, width={coords['width']}, height={coords['height']}"
+
+def build_replace_prompt(removal_text: str, coords: Optional[dict], placement_description: str) -> str:
+    """
+    Combined remove + place instruction for the single-pass replacement.
+    """
+    if coords:
+        target = _describe_box(coords)
+    else:
+        target = f"the object described as: {removal_text}"
+    
+    return f"""Edit the first image (a room/scene) in one step:
+1. REMOVE {target} completely - main body, legs/base, items on it, and its shadow. No fragments may remain.
+2. PLACE the object from the second image {placement_description}, where the removed object stood unless told otherwise.
+
+Requirements:
+- Realistic scale for the space, perspective aligned with the scene's vanishing points
+- Solid ground contact (no floating or sinking), with a shadow matching the scene's light direction
+- Lighting, color temperature and grain matched to the first image
+- Everything else in the scene (walls, floor texture, other objects, framing) unchanged
+- Photorealistic: the new object must look like it was always there"""
+
+def check_generated_image(image_part: Optional[types.Part], inputs: List[types.Part]) -> Optional[str]:
+    """
+    Cheap local check of a generated image. Returns the problem, or None if it looks usable:
+    no image, byte-identical to an input (the model echoed it back), or not decodable.
+    """
+    if image_part is None or not image_part.inline_data or not image_part.inline_data.data:
+        return "no_image"
+    data = image_part.inline_data.data
+    if any(part.inline_data and part.inline_data.data == data for part in inputs):
+        return "identical_to_input"
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.load()
+    except Exception:
+        return "undecodable"
+    return None
+
+async def _single_pass_replace(
+    tool_context: ToolContext,
+    inputs: "RemoveAndPlaceObjectInput",
+    room_img: types.Part,
+    furniture_img: types.Part
+) -> Tuple[Optional[types.Part], Optional[str]]:
+    """
+    Replace in one generation call. Returns (image_part, None) if the result passed
+    check_generated_image, otherwise (None, problem) so the caller can fall back.
+    """
+    coords = _parse_mask(inputs.mask_coordinates)
+    removal_text = inputs.removal_prompt if inputs.removal_prompt else "the main object"
+    
+    contents = [types.Content(role="user", parts=[
+        types.Part(text=build_replace_prompt(removal_text, coords, inputs.placement_description)),
+        room_img,
+        furniture_img
+    ])]
+    
+    config = types.GenerateContentConfig(response_modalities=["IMAGE"])
+    
+    with tool_stage("remove_and_place_object", "single_pass", tool_context) as stage_span:
+        # Only results that pass the check are cached - a rejected one must not be served again
+        cache = get_result_cache()
+        cache_key = make_cache_key(contents, config, IMAGE_MODEL)
+        image_part = await asyncio.to_thread(cache.get, cache_key) if cache is not None else None
+        if cache is not None:
+            CACHE_LOOKUPS.inc(cache="result", result="hit" if image_part is not None else "miss")
+        stage_span.set(cache_hit=image_part is not None)
+        chunk_count = 0
+        
+        if image_part is None:
+            image_part, chunk_count = await generate_image(
+                contents,
+                config,
+                operation="remove_and_place_object.single_pass"
+            )
+        problem = await asyncio.to_thread(check_generated_image, image_part, [room_img, furniture_img])
+        stage_span.set(chunks=chunk_count, output_bytes=_image_bytes(image_part), problem=problem)
+        
+        if problem is None and chunk_count and cache is not None:
+            await _cache_put(cache, cache_key, image_part, "result")
+    
+    SINGLE_PASS_RESULTS.inc(result=problem or "used")
+    if problem is not None:
+        return None, problem
+    return image_part, None
 
 # === FURNITURE PLACEMENT ===
 class RemoveAndPlaceObjectInput(BaseModel):
@@ -32,16 +424,20 @@ class RemoveAndPlaceObjectInput(BaseModel):
     placement_description: str = Field(description="Where to place the object (e.g., 'center of room', 'next to wall')")
     asset_name: str = Field(default="furniture_placement", description="Name for output file")
 
+@admission_controlled("remove_and_place_object")
+@instrument_tool("remove_and_place_object")
 async def remove_and_place_object(
     tool_context: ToolContext,
     inputs: RemoveAndPlaceObjectInput
 ) -> str:
     """Smart placement: Auto-detect if removal needed, then place furniture using Gemini image generation"""
-    client = get_genai_client()
-    
     try:
-        room_img = await tool_context.load_artifact(inputs.room_image_filename)
-        furniture_img = await tool_context.load_artifact(inputs.furniture_image_filename)
+        # Load and normalize uploads (orientation, size, metadata) - room image is sent twice on replacement
+        room_img, furniture_img = await load_input_images(
+            tool_context, "remove_and_place_object",
+            [inputs.room_image_filename, inputs.furniture_image_filename],
+            get_preprocess_config("remove_and_place_object")
+        )
         
         # SMART DETECTION: Check if user wants to REMOVE first or just ADD directly
         user_request = (inputs.removal_prompt + " " + inputs.placement_description).lower()
@@ -54,292 +450,93 @@ async def remove_and_place_object(
         needs_removal = any(kw in user_request for kw in replace_keywords)
         direct_add = any(kw in user_request for kw in add_keywords) and not needs_removal
         
+        # Opt-in single pass: one generation instead of removal + placement.
+        # Falls back to the two-step pipeline below if the result fails the local check.
+        if needs_removal and single_pass_enabled():
+            image_part, problem = await _single_pass_replace(tool_context, inputs, room_img, furniture_img)
+            if image_part is not None:
+                return await save_generated_image(tool_context, "remove_and_place_object", inputs.asset_name, image_part)
+            logger.warning(f"⚠️ Single-pass replacement unusable ({problem}) - falling back to remove + place")
+        
         # Step 1: Removal (ONLY if needed)
         removed_img = None
         
         if needs_removal:
-            coords = json.loads(inputs.mask_coordinates) if inputs.mask_coordinates and inputs.mask_coordinates != "{}" else None
+            coords = _parse_mask(inputs.mask_coordinates)
             
-            if coords and all(k in coords for k in ['x', 'y', 'width', 'height']):
-                # Coordinate-based removal (old method)
-                removal_prompt = f"""Remove the object at coordinates x={coords['x']}, y={coords['y']}, 
-                width={coords['width']}, height={coords['height']}. Fill the area naturally to match 
-                the surrounding environment. Maintain original lighting and perspective."""
+            if coords:
+                # Coordinate-based removal (old method) - the text plays no part in the prompt
+                removal_text = ""
+                removal_parts = [types.Part(text=f"""Remove {_describe_box(coords)}. Fill the area naturally to match 
+                the surrounding environment. Maintain original lighting and perspective.""")]
             else:
                 # Prompt-based removal - UNIVERSAL DETAILED TEMPLATE for ALL objects
                 removal_text = inputs.removal_prompt if inputs.removal_prompt else "Remove the main object"
                 
-                # UNIVERSAL DETAILED REMOVAL - Works for ANY object type
-                removal_prompt = f"""CRITICAL INSTRUCTION: {removal_text} COMPLETELY from this image.UNIVERSAL OBJECT REMOVAL PROCESS (Applies to ALL objects):
-
-STEP 1 - IDENTIFY THE ENTIRE OBJECT:
-• Detect the COMPLETE boundary of the object mentioned
-• Include ALL components:
-  - Main body/structure (thân chính)
-  - Supporting parts: legs, base, frame (chân đế, khung)
-  - Attached elements: cushions, panels, accessories (đệm, tấm, phụ kiện)
-  - Surface items: anything ON or ATTACHED to the object (đồ vật bên trên)
-  - Shadows cast BY the object (bóng đổ của vật)
-  - Reflections of the object (phản chiếu)
-
-• Determine object boundaries:
-  - Left edge → Right edge (từ cạnh trái → cạnh phải)
-  - Front → Back (từ phía trước → phía sau)
-  - Bottom (floor contact) → Top (highest point) (từ sàn → đỉnh cao nhất)
-
-STEP 2 - REMOVE EVERY PIXEL:
-• Delete 100% of the object - NOTHING must remain visible
-• Start from center, expand to all edges
-• Continue until:
-  ☐ NO main body visible (không còn thân chính)
-  ☐ NO supporting parts visible (không còn phần đỡ)
-  ☐ NO attached elements visible (không còn phần gắn kèm)
-  ☐ NO surface items visible (không còn đồ vật bên trên)
-  ☐ NO shadows of object visible (không còn bóng đổ)
-  ☐ NO partial edges, corners, or fragments (không còn góc cạnh hay mảnh vụn)
-
-STEP 3 - FILL THE EMPTY SPACE NATURALLY:
-• Reconstruct background as if object never existed:
-  - Floor/Ground: Continue texture pattern (wood, tile, carpet, grass, concrete, etc.)
-  - Walls: Extend texture/color where object was against wall
-  - Baseboards: Continue lines if object blocked them
-  - Background: Match pattern (curtains, artwork, furniture behind object)
-
-• Maintain environmental consistency:
-  - Lighting: Match direction and intensity from surroundings
-  - Shadows: Add natural shadows from OTHER objects/people (not from removed object)
-  - Color grading: Keep consistent with rest of image
-  - Perspective: Maintain vanishing points and depth
-  - Texture detail: Match sharpness/resolution of surrounding area
-
-STEP 4 - QUALITY VERIFICATION (ALL must pass):
-☐ Object is 100% GONE - not even 1 pixel visible
-☐ Floor/ground texture continuous and natural
-☐ Wall/background texture seamless (if applicable)
-☐ Lighting consistent across filled area
-☐ NO editing artifacts (seams, blurs, color shifts)
-☐ NO discontinuities in patterns/lines
-☐ Perspective maintained correctly
-☐ Result looks PHOTOREALISTIC - as if object was never there
-
-FINAL CHECK: 
-Output MUST show the scene WITHOUT the specified object.
-If you can see ANY trace of the object (even a tiny corner, shadow, or edge) → This task has COMPLETELY FAILED.
-
-EXAMPLES (This process works for):
-- Furniture: bed, sofa, table, chair, cabinet, desk
-- People: person, child, adult, group
-- Vehicles: car, bike, motorcycle, truck
-- Electronics: TV, computer, phone, speaker
-- Decorations: plant, vase, picture frame, lamp
-- Animals: dog, cat, bird, pet
-- ANY other object user specifies"""
-            
-            contents = [types.Content(role="user", parts=[
-                types.Part(text=removal_prompt), room_img
-            ])]
+                # UNIVERSAL DETAILED REMOVAL - Works for ANY object type (see prompt_templates.py)
+                removal_parts = REMOVAL_TEMPLATE.parts(removal_text=removal_text)
             
-            chunk_count = 0
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.5-flash-image",
-                contents=contents,
-                config=types.GenerateContentConfig(response_modalities=["IMAGE"])
-            ):
-                chunk_count += 1
-                try:
-                    # Safe check for chunk structure
-                    if chunk.candidates and len(chunk.candidates) > 0:
-                        candidate = chunk.candidates[0]
-                        if candidate.content and candidate.content.parts:
-                            part = candidate.content.parts[0]
-                            if part.inline_data:
-                                removed_img = types.Part(inline_data=part.inline_data)
-                except AttributeError as e:
-                    # Log but continue - some chunks may not have expected structure
-                    print(f"Warning: Chunk {chunk_count} structure issue: {str(e)}")
-                    continue
+            # Reuse the emptied room from an earlier placement on the same room + removal
+            with tool_stage("remove_and_place_object", "removal", tool_context) as stage_span:
+                cache = get_result_cache()
+                removal_key = make_removal_cache_key(room_img, coords, removal_text, IMAGE_MODEL)
+                removed_img = await asyncio.to_thread(cache.get, removal_key) if cache is not None else None
+                if cache is not None:
+                    CACHE_LOOKUPS.inc(cache="removal", result="hit" if removed_img is not None else "miss")
+                stage_span.set(cache_hit=removed_img is not None)
+                chunk_count = 0
+                
+                if removed_img is None:
+                    contents = [types.Content(role="user", parts=[*removal_parts, room_img])]
+                    
+                    removed_img, chunk_count = await generate_image(
+                        contents,
+                        types.GenerateContentConfig(response_modalities=["IMAGE"]),
+                        operation="remove_and_place_object.removal"
+                    )
+                    
+                    if removed_img and cache is not None:
+                        await _cache_put(cache, removal_key, removed_img, "removal result")
+                stage_span.set(chunks=chunk_count, output_bytes=_image_bytes(removed_img))
             
             if not removed_img:
                 return f"❌ Step 1 FAILED: Could not remove object. Processed {chunk_count} chunks but no image generated."
             
-            # Optional: Save intermediate removal image for debugging
+            # Save the intermediate emptied room - shown to the user while placement runs
             if hasattr(tool_context, 'output_dir'):
                 debug_filename = f"{inputs.asset_name}_step1_removal_debug.png"
                 try:
-                    await tool_context.save_artifact(debug_filename, removed_img)
-                except:
-                    pass  # Non-critical, continue even if debug save fails
+                    debug_path = await tool_context.save_artifact(debug_filename, removed_img)
+                    # The bytes travel with the event - in ARTIFACT_DURABILITY=memory the file may not be written yet
+                    emit_progress(tool_context, "removal_ready", tool="remove_and_place_object",
+                                  filename=debug_filename, path=debug_path, data=removed_img.inline_data.data,
+                                  mime_type=removed_img.inline_data.mime_type)
+                except Exception as e:
+                    # Non-critical, continue even if the preview can't be saved or reported
+                    logger.warning(f"⚠️ Could not save/emit removal preview: {e}")
         else:
             # Direct addition - no removal needed, use original room image
             removed_img = room_img
         
-        # Step 2: Placement - UNIVERSAL DETAILED TEMPLATE for ANY object
+        # Step 2: Placement - UNIVERSAL DETAILED TEMPLATE for ANY object (see prompt_templates.py)
         context_description = "a scene where an object has been removed, leaving empty space" if needs_removal else "an existing scene/room"
+        placement_parts = PLACEMENT_TEMPLATE.parts(
+            placement_description=inputs.placement_description,
+            context_description=context_description
+        )
         
-        placement_prompt = f"""CRITICAL INSTRUCTION: Place the object from the second image {inputs.placement_description}.
-
-CONTEXT: The first image shows {context_description}.
-
-UNIVERSAL OBJECT PLACEMENT PROCESS (Works for ALL objects):
-
-STEP 1 - ANALYZE THE EMPTY SCENE:
-• Understand the space:
-  - Type of space: room, outdoor, office, street, etc.
-  - Floor/Ground type: wood, tile, carpet, grass, concrete, asphalt
-  - Walls/Background: color, texture, distance from placement area
-  - Existing objects: furniture, people, decorations for scale reference
-
-• Study lighting conditions:
-  - Light sources: window, ceiling light, sun, lamps (identify ALL)
-  - Light direction: from which side (left/right/top/behind)
-  - Light intensity: bright, moderate, dim
-  - Color temperature: warm (yellow), cool (blue), neutral (white)
-  - Time of day: morning, afternoon, evening (affects shadows)
-
-• Analyze perspective:
-  - Camera angle: eye level, high angle, low angle
-  - Vanishing points: where parallel lines converge
-  - Depth perception: near objects larger, far objects smaller
-  - Field of view: wide angle or telephoto
-
-STEP 2 - ANALYZE THE NEW OBJECT (from second image):
-• Physical characteristics:
-  - Dimensions: length, width, height (estimate in meters/cm)
-  - Shape: rectangular, round, irregular, etc.
-  - Weight appearance: heavy (needs solid base) or light (can sit delicately)
-  
-• Visual properties:
-  - Color: main colors, accents, patterns
-  - Texture: smooth, rough, fabric, metal, wood, glass
-  - Material: wood, metal, plastic, fabric, leather, glass, etc.
-  - Finish: matte, glossy, semi-gloss
-
-• Contact points:
-  - How object touches ground: legs, flat base, wheels, uneven bottom
-  - Number of contact points: 4 legs, continuous base, single pedestal
-  - Expected indent/shadow pattern based on contact type
-
-STEP 3 - POSITION THE OBJECT CORRECTLY:
-• Placement location (follow user's description):
-  - Exact position: {inputs.placement_description}
-  - Alignment: centered, against wall, in corner, parallel to edge
-  - Spacing: distance from walls, other objects (30-50cm typical for furniture)
-  - Orientation: facing direction (toward door, window, camera, etc.)
-
-• Scale and proportion:
-  - Match object size to space size (not too large/small)
-  - Reference existing objects for realistic scale
-  - Typical sizes:
-    * Sofa: 180-240cm wide, 80-100cm deep, 80-90cm high
-    * Bed: 140-200cm wide, 200-220cm long, 50-60cm high
-    * Table: 120-180cm wide, 70-90cm deep, 70-75cm high
-    * Chair: 40-60cm wide, 40-50cm deep, 80-100cm high
-    * TV: 100-150cm wide, 5-10cm thick, 60-90cm high
-    * Person: 160-180cm tall, 40-50cm wide at shoulders
-
-• Perspective adjustment:
-  - Apply correct perspective distortion (objects farther = smaller)
-  - Align edges with scene's vanishing points
-  - Ensure vertical lines are vertical (unless intentional perspective)
-  - Match camera angle and viewing position
-
-STEP 4 - PERFECT INTEGRATION (Make it look REAL):
-• Ground contact (CRITICAL):
-  - Object MUST touch floor/ground naturally
-  - NO floating above surface (common AI error)
-  - NO sinking into surface (also common error)
-  - Contact points clear and stable
-  - If object has legs: each leg touches ground individually
-  - If flat base: entire base edge touches ground
-
-• Shadows (ESSENTIAL for realism):
-  - Cast shadow FROM object in direction OPPOSITE to light source
-  - Shadow length based on light angle (low sun = long shadow, overhead = short)
-  - Shadow softness: sharp edges for hard light, soft edges for diffused light
-  - Shadow darkness: darker near object, lighter further away
-  - Shadow on multiple surfaces: floor AND wall if near wall
-  - Ambient occlusion: darker area where object meets ground
-
-• Lighting match (MUST be perfect):
-  - Illuminate object from SAME direction as scene lighting
-  - Match light intensity: bright scene = bright object, dim scene = dim object
-  - Match color temperature: warm scene = warm light on object
-  - Highlight areas facing light source
-  - Shadow areas on opposite side from light
-  - Rim lighting if backlit
-  - Reflected light from surroundings (subtle bounce light)
-
-• Color and material integration:
-  - Match color grading of scene (warm, cool, neutral tone)
-  - Adjust saturation to match scene (don't oversaturate)
-  - Match contrast level with rest of image
-  - Apply same film look/filter as original scene
-  - If scene has specific style (vintage, modern, minimal): match it
-
-• Reflections (if applicable):
-  - Shiny floor: add reflection of object (wood, tile, marble)
-  - Glass/mirror nearby: show object in reflection
-  - Reflection intensity matches surface shininess
-  - Reflection follows perspective and is vertically flipped
-
-• Environmental effects:
-  - Depth of field: If background is blurred, blur object appropriately at that distance
-  - Air perspective: Slight haze for objects far from camera
-  - Lens effects: Vignetting, chromatic aberration if present in original
-  - Film grain: Match grain/noise level of original image
-
-STEP 5 - QUALITY ASSURANCE:
-☐ Object positioned exactly as user described
-☐ Scale proportional and realistic
-☐ Perspective matches scene perfectly
-☐ Ground contact natural and stable (NO floating/sinking)
-☐ Shadows present, realistic direction and softness
-☐ Lighting direction matches scene
-☐ Lighting intensity matches scene
-☐ Color temperature matches scene
-☐ Color grading consistent with scene
-☐ Reflections present if floor is shiny
-☐ NO visible seams or compositing artifacts
-☐ Object looks like it BELONGS in this scene
-☐ 8K photorealistic quality maintained
-
-FINAL VERIFICATION:
-The output should show the NEW object placed in the scene so naturally that it looks like it was ALWAYS THERE.
-A person viewing the image should NOT be able to tell that the object was added digitally.
-If there are ANY visual clues of editing (floating, wrong shadows, color mismatch, etc.) → This task has FAILED.
-
-EXAMPLES (This process works for placing):
-- Furniture: sofa, bed, table, chair, cabinet into rooms
-- People: person, child, group into any scene
-- Vehicles: car, bike into street, parking lot, garage
-- Electronics: TV, computer into room, desk
-- Decorations: plant, vase, artwork into room, outdoor
-- Animals: dog, cat into home, garden
-- ANY other object into ANY scene"""
-        
-        final_contents = [types.Content(role="user", parts=[
-            types.Part(text=placement_prompt), removed_img, furniture_img
-        ])]
-        
-        version = get_next_version_number(tool_context, inputs.asset_name)
-        filename = f"{inputs.asset_name}_v{version}.png"
+        final_contents = [types.Content(role="user", parts=[*placement_parts, removed_img, furniture_img])]
         
-        for chunk in client.models.generate_content_stream(
-            model="gemini-2.5-flash-image",
-            contents=final_contents,
-            config=types.GenerateContentConfig(response_modalities=["IMAGE"])
-        ):
-            # Safe check for chunk structure
-            if chunk.candidates and len(chunk.candidates) > 0:
-                candidate = chunk.candidates[0]
-                if candidate.content and candidate.content.parts:
-                    part = candidate.content.parts[0]
-                    if part.inline_data:
-                        await tool_context.save_artifact(
-                            filename=filename,
-                            artifact=types.Part(inline_data=part.inline_data)
-                        )
-                        return f"✅ Successfully saved: {filename}"
+        with tool_stage("remove_and_place_object", "placement", tool_context) as stage_span:
+            image_part, chunk_count = await generate_image(
+                final_contents,
+                types.GenerateContentConfig(response_modalities=["IMAGE"]),
+                use_cache=True,
+                operation="remove_and_place_object.placement"
+            )
+            stage_span.set(chunks=chunk_count, output_bytes=_image_bytes(image_part))
+        if image_part:
+            return await save_generated_image(tool_context, "remove_and_place_object", inputs.asset_name, image_part)
         
         return "❌ Failed to place furniture. Please try again."
     
@@ -353,16 +550,20 @@ class VirtualTryOnInput(BaseModel):
     clothing_type: str = Field(description="Type: shirt, pants, dress, or jacket")
     asset_name: str = Field(default="tryon", description="Output filename base")
 
+@admission_controlled("virtual_tryon")
+@instrument_tool("virtual_tryon")
 async def virtual_tryon(
     tool_context: ToolContext,
     inputs: VirtualTryOnInput
 ) -> str:
     """Apply clothing to person photo using Gemini image generation"""
-    client = get_genai_client()
-    
     try:
-        person_img = await tool_context.load_artifact(inputs.person_image_filename)
-        clothing_img = await tool_context.load_artifact(inputs.clothing_image_filename)
+        # Load and normalize uploads (orientation, size, metadata) before sending to Gemini
+        person_img, clothing_img = await load_input_images(
+            tool_context, "virtual_tryon",
+            [inputs.person_image_filename, inputs.clothing_image_filename],
+            get_preprocess_config("virtual_tryon")
+        )
         
         prompts = {
             "shirt": "Replace the person's shirt with this exact clothing item",
@@ -384,25 +585,16 @@ async def virtual_tryon(
             types.Part(text=prompt), person_img, clothing_img
         ])]
         
-        version = get_next_version_number(tool_context, inputs.asset_name)
-        filename = f"{inputs.asset_name}_v{version}.png"
-        
-        for chunk in client.models.generate_content_stream(
-            model="gemini-2.5-flash-image",
-            contents=contents,
-            config=types.GenerateContentConfig(response_modalities=["IMAGE"], temperature=0.3)
-        ):
-            # Safe check for chunk structure
-            if chunk.candidates and len(chunk.candidates) > 0:
-                candidate = chunk.candidates[0]
-                if candidate.content and candidate.content.parts:
-                    part = candidate.content.parts[0]
-                    if part.inline_data:
-                        await tool_context.save_artifact(
-                            filename=filename,
-                            artifact=types.Part(inline_data=part.inline_data)
-                        )
-                        return f"✅ Successfully saved: {filename}"
+        with tool_stage("virtual_tryon", "generation", tool_context) as stage_span:
+            image_part, chunk_count = await generate_image(
+                contents,
+                types.GenerateContentConfig(response_modalities=["IMAGE"], temperature=0.3),
+                use_cache=True,
+                operation="virtual_tryon"
+            )
+            stage_span.set(chunks=chunk_count, output_bytes=_image_bytes(image_part))
+        if image_part:
+            return await save_generated_image(tool_context, "virtual_tryon", inputs.asset_name, image_part)
         
         return "❌ Failed to apply clothing. Please try again."
     
@@ -410,8 +602,25 @@ async def virtual_tryon(
         return f"❌ Error: {str(e)}"
 
 # === HELPER FUNCTIONS ===
-def get_next_version_number(tool_context: ToolContext, asset_name: str) -> int:
-    """Get next version number for artifact filename - simplified to always use v1"""
-    # Simplified: Always use v1, file will be overwritten
-    # This avoids async issues with list_artifacts()
-    return 1
+async def save_generated_image(
+    tool_context: ToolContext,
+    tool_name: str,
+    asset_name: str,
+    image_part: types.Part
+) -> ArtifactResult:
+    """
+    Save a tool's final image as the next version of asset_name (see artifact_store.py)
+    and build its success message, carrying the saved artifact's handle.
+    Contexts without save_version (e.g. ADK's) store it through their own versioned save_artifact.
+    """
+    with tool_stage(tool_name, "save", tool_context):
+        save_version = getattr(tool_context, "save_version", None)
+        if save_version is not None:
+            artifact = await save_version(asset_name, image_part)
+            filename, path = artifact.filename, artifact.path
+        else:
+            artifact, filename, path = None, f"{asset_name}.png", None
+            await tool_context.save_artifact(filename=filename, artifact=image_part)
+    
+    emit_progress(tool_context, "final_ready", tool=tool_name, filename=filename, path=path)
+    return ArtifactResult(f"✅ Successfully saved: {filename}", artifact)
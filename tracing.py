@@ -0,0 +1,218 @@
+# tracing.py - Lightweight request tracing for the image tools
+#
+# Enable with:
+#   TRACE_FILE=traces.json      append finished traces to this file
+#   TRACE_SAMPLE_RATE=0.1       fraction of requests traced (default: 1.0)
+#
+# The file uses the Chrome trace event format (JSON array, trailing "]" omitted so
+# traces can be appended), loadable in https://ui.perfetto.dev or chrome://tracing.
+# Each request gets its own row, labelled with its request id.
+
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+class _Trace:
+    """
+    Events of one sampled request, written out together when the request finishes.
+    """
+
+    def __init__(self, request_id: str, lane: int):
+        self.request_id = request_id
+        self.lane = lane
+        self.events: List[Dict[str, Any]] = []
+
+
+class Span:
+    """
+    A timed section of a traced request. Attach attributes with set() and
+    point-in-time events with event(); both show up in the trace viewer.
+    """
+
+    def __init__(self, name: str, trace: _Trace, attrs: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.start_us = _now_us()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs):
+        self.trace.events.append({
+            "name": name, "ph": "i", "s": "t", "ts": _now_us(),
+            "pid": os.getpid(), "tid": self.trace.lane, "args": attrs,
+        })
+
+    def _finish(self):
+        self.trace.events.append({
+            "name": self.name, "ph": "X", "ts": self.start_us, "dur": _now_us() - self.start_us,
+            "pid": os.getpid(), "tid": self.trace.lane, "args": self.attrs,
+        })
+
+
+class _NullSpan:
+    """
+    Stand-in for spans of requests that are not sampled (every method is a no-op).
+    """
+
+    def set(self, **attrs):
+        pass
+
+    def event(self, name: str, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """
+    Records spans for a sampled fraction of requests and appends them to a trace file.
+
+    Features:
+    - Context-local (works across awaits and asyncio.gather children)
+    - Sampling decided once per request; unsampled requests cost a ContextVar lookup
+    - Thread-safe file writes, one write per finished request
+    """
+
+    def __init__(self, path: Optional[Path] = None, sample_rate: float = 1.0):
+        """
+        Initialize tracer.
+
+        Args:
+            path: Trace file to append to (None disables tracing)
+            sample_rate: Fraction of requests to trace, 0.0 - 1.0
+        """
+        self.path = Path(path) if path else None
+        self.sample_rate = sample_rate
+        self._lanes = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None and self.sample_rate > 0
+
+    @contextmanager
+    def trace(self, name: str, request_id: Optional[str] = None, **attrs) -> Iterator[Any]:
+        """
+        Root span of a request. Nested inside an active trace it is an ordinary span.
+        """
+        if _current_trace.get() is not None:
+            with self.span(name, **attrs) as span:
+                yield span
+            return
+
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield NULL_SPAN
+            return
+
+        trace = _Trace(request_id or uuid.uuid4().hex[:16], next(self._lanes))
+        token = _current_trace.set(trace)
+        try:
+            with self.span(name, request_id=trace.request_id, **attrs) as span:
+                yield span
+        finally:
+            _current_trace.reset(token)
+            self._write(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Any]:
+        """
+        Timed child span of the current request (no-op outside a sampled trace).
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            yield NULL_SPAN
+            return
+
+        span = Span(name, trace, attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span._finish()
+
+    def _write(self, trace: _Trace):
+        """
+        Append a finished request's events (plus a row label) to the trace file.
+        """
+        label = {
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": trace.lane,
+            "args": {"name": f"request {trace.request_id}"},
+        }
+        lines = "".join(json.dumps(event, default=str) + ",\n" for event in [label] + trace.events)
+
+        with self.lock:
+            try:
+                self.path.parent.mkdir(exist_ok=True, parents=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    if f.tell() == 0:
+                        f.write("[\n")
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write trace: {e}")
+
+
+# Global tracer instance (singleton pattern)
+_global_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """
+    Get or create the global tracer.
+
+    Environment:
+        TRACE_FILE: trace file path (unset = tracing disabled)
+        TRACE_SAMPLE_RATE: fraction of requests traced (default: 1.0)
+    """
+    global _global_tracer
+
+    if _global_tracer is None:
+        _global_tracer = Tracer(
+            path=os.getenv("TRACE_FILE", "").strip() or None,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+        )
+    return _global_tracer
+
+
+def reset_tracer():
+    """
+    Reset global tracer (useful for testing or re-initialization).
+    """
+    global _global_tracer
+    _global_tracer = None
+
+
+def trace(name: str, request_id: Optional[str] = None, **attrs):
+    """
+    Root span of a request on the global tracer (see Tracer.trace).
+    """
+    return get_tracer().trace(name, request_id=request_id, **attrs)
+
+
+def span(name: str, **attrs):
+    """
+    Child span on the global tracer (see Tracer.span).
+    """
+    return get_tracer().span(name, **attrs)